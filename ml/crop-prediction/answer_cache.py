@@ -0,0 +1,223 @@
+"""
+Cache of chatbot answers for repeated questions.
+
+Farmers ask the same few questions over and over ("best fertilizer for
+wheat", "when to sell onion"), and each one used to cost a Gemini round trip.
+``AnswerCache`` stores finished answers keyed by the normalized English
+question (after translation) and the answer language.
+
+Lookup is exact on the normalized text first. With a similarity threshold
+set, a miss then falls back to near-duplicate search: questions are TF-IDF
+weighted bags of words, candidates come from an inverted index over their
+words, and the best cosine similarity at or above the threshold is a hit.
+Numbers are part of the answer (soil values, prices), so a near duplicate
+must contain exactly the same numbers. So are the crops, states and
+fertilizers it names: "urea dose for wheat" scores high against "urea dose
+for rice", but only a question naming the same ones (``entities``) can hit.
+
+Entries expire after a TTL and the cache is an LRU bounded in bytes, like
+``PredictionCache``; counters are served at ``/metrics/answers``.
+"""
+
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+_TOKEN = re.compile(r'\d+(?:\.\d+)?|[^\W\d_]+')
+_NUMBER = re.compile(r'\d')
+
+# Words too common to say anything about the question; ignored by the similarity search
+STOP_WORDS = frozenset('''
+    a an and are as at be by can do does for from how i in is it me my of on or should
+    the to what when where which who why will with you your
+'''.split())
+
+# Fertilizers a near duplicate must name exactly like the question; crops and states come from the app
+FERTILIZERS = ['urea', 'dap', 'diammonium phosphate', 'mop', 'muriate of potash', 'potash', 'ssp',
+               'single super phosphate', 'npk', 'ammonium sulphate', 'zinc sulphate', 'gypsum', 'compost',
+               'vermicompost', 'manure', 'neem cake']
+
+# Rough per-entry bookkeeping cost on top of the text sizes
+_ENTRY_OVERHEAD_BYTES = 300
+
+
+def normalize(text):
+    """Lowercase words and numbers of ``text`` joined by single spaces"""
+    return ' '.join(_TOKEN.findall(unicodedata.normalize('NFKC', text).lower()))
+
+
+class AnswerCache:
+    """LRU + TTL cache of chatbot answers with optional near-duplicate lookup"""
+
+    def __init__(self, max_bytes=None, ttl_seconds=None, similarity=None, enabled=None, entities=FERTILIZERS):
+        """
+        Args:
+            max_bytes: Size limit (``ANSWER_CACHE_MAX_MB``)
+            ttl_seconds: Entry lifetime (``ANSWER_CACHE_TTL``)
+            similarity: Cosine threshold for near-duplicate hits, 0 for exact
+                matches only (``ANSWER_CACHE_SIMILARITY``, e.g. 0.85)
+            enabled: ``ANSWER_CACHE``; when off every lookup misses
+            entities: Names (crops, states, fertilizers) a near duplicate must
+                share exactly with the question; see ``set_entities``
+        """
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('ANSWER_CACHE_MAX_MB', '8')) * 1024 * 1024)
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('ANSWER_CACHE_TTL', '86400'))
+        if similarity is None:
+            similarity = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0'))
+        if enabled is None:
+            enabled = os.getenv('ANSWER_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.similarity = similarity
+        self.enabled = enabled
+
+        self._entity_pattern = None
+        self._entries = OrderedDict()  # (text, language) -> (answer, expires_at, size, terms, numbers, entities)
+        self._postings = {}            # (term, language) -> keys of the entries containing it
+        self._document_frequency = Counter()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0,
+                          'evictions': 0, 'expirations': 0}
+        self.set_entities(entities)
+
+    def set_entities(self, names):
+        """Match near duplicates only when they name the same ``names``; drops the cached answers"""
+        names = sorted({normalize(name) for name in names} - {''}, key=len, reverse=True)
+        pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, names)) + r')\b') if names else None
+        with self._lock:
+            self._entity_pattern = pattern
+        self.clear()
+
+    def get(self, question, language):
+        """Cached answer for the English ``question`` in ``language``, or ``None``"""
+        if not self.enabled:
+            return None
+        text = normalize(question)
+        key = (text, language)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                self._remove(key)
+                self._counters['expirations'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[0]
+
+            if self.similarity > 0:
+                similar = self._nearest(text, language, now)
+                if similar is not None:
+                    self._entries.move_to_end(similar)
+                    self._counters['similar_hits'] += 1
+                    return self._entries[similar][0]
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, question, language, answer):
+        """Store ``answer`` to the English ``question`` in ``language``"""
+        if not self.enabled:
+            return
+        text = normalize(question)
+        key = (text, language)
+        size = len(text.encode()) + len(answer.encode()) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        terms, numbers, entities = self._terms(text)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, time.time() + self.ttl, size, terms, numbers, entities)
+            self._bytes += size
+            for term in terms:
+                self._postings.setdefault((term, language), set()).add(key)
+                self._document_frequency[term] += 1
+            self._counters['stores'] += 1
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._document_frequency.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['similar_hits'] + self._counters['misses']
+            hits = self._counters['hits'] + self._counters['similar_hits']
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'similarity_threshold': self.similarity or None,
+                'hit_rate': round(hits / lookups, 4) if lookups else None,
+                **self._counters,
+            }
+
+    def _terms(self, text):
+        """(term counts without stop words, sorted numbers, named entities) of a normalized text"""
+        tokens = text.split()
+        numbers = tuple(sorted(token for token in tokens if _NUMBER.match(token)))
+        terms = Counter(token for token in tokens if token not in STOP_WORDS and not _NUMBER.match(token))
+        pattern = self._entity_pattern
+        entities = frozenset(pattern.findall(text)) if pattern is not None else frozenset()
+        return terms, numbers, entities
+
+    def _weights(self, terms):
+        """TF-IDF weights of ``terms`` against the cached questions"""
+        documents = len(self._entries) + 1
+        return {term: count * (math.log(documents / (1 + self._document_frequency[term])) + 1.0)
+                for term, count in terms.items()}
+
+    def _nearest(self, text, language, now):
+        """Key of the most similar live entry at or above the threshold (lock held)"""
+        terms, numbers, entities = self._terms(text)
+        if not terms:
+            return None
+        candidates = set()
+        for term in terms:
+            candidates.update(self._postings.get((term, language), ()))
+
+        query = self._weights(terms)
+        query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+        best_key, best_score = None, self.similarity
+        for key in candidates:
+            entry = self._entries[key]
+            if entry[1] < now or entry[4] != numbers or entry[5] != entities:
+                continue
+            weights = self._weights(entry[3])
+            dot = sum(weight * weights.get(term, 0.0) for term, weight in query.items())
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            score = dot / (query_norm * norm) if norm else 0.0
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _remove(self, key):
+        """Drop one entry and its index postings (lock held)"""
+        _, _, size, terms, _, _ = self._entries.pop(key)
+        self._bytes -= size
+        for term in terms:
+            postings = self._postings.get((term, key[1]))
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._postings[(term, key[1])]
+            self._document_frequency[term] -= 1
+            if self._document_frequency[term] <= 0:
+                del self._document_frequency[term]
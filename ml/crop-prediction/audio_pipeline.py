@@ -0,0 +1,274 @@
+"""
+In-memory audio decoding and chunked speech recognition for /chatbot/voice.
+
+``voice_to_text`` used to save every upload to ``temp_audio.wav`` in the
+working directory, re-read it with ``sr.AudioFile`` and delete it: two disk
+round trips per request, and concurrent uploads overwrote each other's file.
+This module works on the uploaded bytes instead:
+
+* ``decode_audio`` parses WAV (PCM 8/16/24/32-bit, 32/64-bit float,
+  WAVE_FORMAT_EXTENSIBLE) straight from memory with NumPy; other containers
+  ``sr.AudioFile`` understands (AIFF, FLAC) are read from a ``BytesIO``;
+* ``to_mono_16k`` downmixes to mono and resamples to 16 kHz, the rate
+  speech APIs work at, so requests to the recognizer are a third of the size
+  of 48 kHz stereo. The polyphase windowed-sinc filter for a rate pair is one
+  precomputed matrix, so resampling a clip is a single matmul;
+* ``split_chunks`` cuts long clips at the quietest point near each chunk
+  limit, so no chunk exceeds what the recognizer accepts and words are
+  rarely cut in half; ``transcribe_chunks`` recognizes them one by one.
+
+Recognizers are pluggable (``make_recognizer``/``SPEECH_BACKEND``):
+``GoogleRecognizer`` (default), ``SphinxRecognizer`` (offline, needs
+``pocketsphinx``) and ``StubRecognizer``, an offline stand-in with no
+dependencies for tests and benchmarks.
+"""
+
+import io
+import os
+import struct
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+import speech_recognition as sr
+
+TARGET_RATE = 16000
+
+# Longest piece sent to the recognizer at once; Google's free endpoint rejects long clips
+DEFAULT_CHUNK_SECONDS = 30.0
+
+# Input samples per resampling block; larger blocks mean an odd rate pair, use interpolation
+MAX_RESAMPLE_BLOCK = 4096
+
+_WAVE_PCM, _WAVE_FLOAT, _WAVE_EXTENSIBLE = 0x0001, 0x0003, 0xFFFE
+
+
+class AudioDecodeError(ValueError):
+    """The upload is not audio we can read"""
+
+
+def decode_audio(data):
+    """Return (float32 samples shaped (frames, channels) in [-1, 1], sample rate)"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        try:
+            return _decode_wav(data)
+        except struct.error:
+            raise AudioDecodeError('Truncated WAV header') from None
+    try:
+        with sr.AudioFile(io.BytesIO(data)) as source:
+            audio = sr.Recognizer().record(source)
+    except (ValueError, AssertionError, EOFError, OSError) as e:
+        raise AudioDecodeError(f'Unsupported audio format: {e}') from None
+    samples = _pcm_to_float(audio.frame_data, audio.sample_width, _WAVE_PCM)
+    return samples.reshape(-1, 1), audio.sample_rate
+
+
+def _decode_wav(data):
+    fmt = None
+    frames = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from('<4sI', data, offset)
+        body = data[offset + 8:offset + 8 + size]
+        if chunk_id == b'fmt ':
+            if len(body) < 16:
+                raise AudioDecodeError('Truncated WAV fmt chunk')
+            fmt = struct.unpack_from('<HHIIHH', body)
+            if fmt[0] == _WAVE_EXTENSIBLE and len(body) >= 26:
+                fmt = (struct.unpack_from('<H', body, 24)[0],) + fmt[1:]
+        elif chunk_id == b'data':
+            frames = body
+        offset += 8 + size + (size & 1)
+    if fmt is None or frames is None:
+        raise AudioDecodeError('WAV file without fmt or data chunk')
+
+    format_tag, channels, rate, _, _, bits = fmt
+    if format_tag not in (_WAVE_PCM, _WAVE_FLOAT) or not channels or not rate:
+        raise AudioDecodeError(f'Unsupported WAV encoding (format {format_tag:#x})')
+    # Samples sit in whole bytes, e.g. 12-bit audio in 16-bit containers
+    width = -(-bits // 8)
+    if bits < 8 or width not in ((4, 8) if format_tag == _WAVE_FLOAT else (1, 2, 3, 4)):
+        raise AudioDecodeError(f'Unsupported WAV sample size ({bits} bits)')
+    usable = len(frames) - len(frames) % (width * channels)
+    samples = _pcm_to_float(frames[:usable], width, format_tag)
+    return samples.reshape(-1, channels), rate
+
+
+def _pcm_to_float(raw, width, format_tag):
+    if format_tag == _WAVE_FLOAT:
+        if width not in (4, 8):
+            raise AudioDecodeError(f'Unsupported float width {width}')
+        return np.frombuffer(raw, dtype=f'<f{width}').astype(np.float32)
+    if width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if width == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    if width == 3:
+        # Little-endian 24-bit: widen to int32 by putting the bytes in the top three
+        triples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = (triples[:, 0] << 8) | (triples[:, 1] << 16) | (triples[:, 2] << 24)
+        return values.astype(np.float32) / 2147483648.0
+    if width == 4:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    raise AudioDecodeError(f'Unsupported sample width {width}')
+
+
+@lru_cache(maxsize=16)
+def _resample_matrix(rate, target_rate):
+    """Polyphase windowed-sinc resampler for ``rate`` -> ``target_rate`` as one matrix
+
+    Input is cut into blocks of ``down`` samples (plus ``half`` on each side);
+    a block times the matrix gives its ``up`` output samples, low-pass
+    filtered below the lower Nyquist frequency. Returns (matrix, up, down, half).
+    """
+    divisor = gcd(rate, target_rate)
+    up, down = target_rate // divisor, rate // divisor
+    ratio = max(1.0, down / up)
+    # Several periods per block keep the matrix wide enough for an efficient matmul
+    periods = -(-64 // up)
+    up, down = up * periods, down * periods
+    half = int(np.ceil(8 * ratio))
+    cutoff = 0.5 / ratio  # cycles per input sample
+
+    matrix = np.zeros((down + 2 * half, up), dtype=np.float32)
+    for phase in range(up):
+        position = phase * down / up + half
+        columns = np.arange(int(position) - half + 1, int(position) + half + 1)
+        distance = columns - position
+        weights = np.sinc(2.0 * cutoff * distance) * 0.5 * (1.0 + np.cos(np.pi * distance / (half + 1)))
+        matrix[columns, phase] = weights / weights.sum()
+    return matrix, up, down, half
+
+
+def resample(mono, rate, target_rate=TARGET_RATE):
+    """Resample mono float32 samples with a band-limited polyphase filter"""
+    if rate == target_rate or not len(mono):
+        return mono
+    n_out = int(round(len(mono) * target_rate / rate))
+    matrix, up, down, half = _resample_matrix(rate, target_rate)
+    if down > MAX_RESAMPLE_BLOCK:
+        # Unusual rate pair without a small common ratio: plain interpolation
+        positions = np.arange(n_out, dtype=np.float64) * (rate / target_rate)
+        return np.interp(positions, np.arange(len(mono)), mono).astype(np.float32)
+    rows = -(-len(mono) // down)
+    padded = np.zeros(rows * down + 2 * half, dtype=np.float32)
+    padded[half:half + len(mono)] = mono
+    blocks = np.lib.stride_tricks.sliding_window_view(padded, down + 2 * half)[::down]
+    return (np.ascontiguousarray(blocks) @ matrix).ravel()[:n_out]
+
+
+def to_mono_16k(samples, rate, target_rate=TARGET_RATE):
+    """Downmix (frames, channels) samples to mono and resample to ``target_rate``"""
+    if samples.ndim == 1:
+        mono = samples
+    elif samples.shape[1] == 1:
+        mono = samples[:, 0]
+    else:
+        mono = samples @ np.full(samples.shape[1], 1.0 / samples.shape[1], dtype=np.float32)
+    return resample(np.ascontiguousarray(mono, dtype=np.float32), rate, target_rate)
+
+
+def to_audio_data(samples, rate=TARGET_RATE):
+    """16-bit ``sr.AudioData`` for mono float samples"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2')
+    return sr.AudioData(pcm.tobytes(), rate, 2)
+
+
+def split_chunks(samples, rate=TARGET_RATE, max_seconds=DEFAULT_CHUNK_SECONDS, search_seconds=5.0,
+                 window_seconds=0.1):
+    """Cut ``samples`` into pieces of at most ``max_seconds``, each ending at a quiet spot
+
+    Within the last ``search_seconds`` of every piece the cut goes to the
+    ``window_seconds`` window with the least energy.
+    """
+    limit = int(max_seconds * rate)
+    if len(samples) <= limit:
+        return [samples]
+    window = max(1, int(window_seconds * rate))
+    search = min(int(search_seconds * rate), limit - window)
+    chunks = []
+    start = 0
+    while len(samples) - start > limit:
+        region = samples[start + limit - search:start + limit]
+        n_windows = len(region) // window
+        energy = np.square(region[:n_windows * window].reshape(n_windows, window)).sum(axis=1)
+        cut = start + limit - search + int(np.argmin(energy)) * window + window // 2
+        chunks.append(samples[start:cut])
+        start = cut
+    chunks.append(samples[start:])
+    return chunks
+
+
+def prepare_upload(data, max_seconds=DEFAULT_CHUNK_SECONDS):
+    """Uploaded bytes -> list of 16 kHz mono ``sr.AudioData`` chunks"""
+    samples, rate = decode_audio(data)
+    mono = to_mono_16k(samples, rate)
+    return [to_audio_data(chunk) for chunk in split_chunks(mono, TARGET_RATE, max_seconds)]
+
+
+def transcribe_chunks(recognizer, chunks, language):
+    """Yield the transcript of each chunk; silent or unintelligible chunks yield ''"""
+    for chunk in chunks:
+        try:
+            yield recognizer.recognize(chunk, language)
+        except sr.UnknownValueError:
+            yield ''
+
+
+def transcribe(recognizer, chunks, language):
+    """Whole transcript of ``chunks``; ``sr.UnknownValueError`` if nothing was understood"""
+    text = ' '.join(part for part in transcribe_chunks(recognizer, chunks, language) if part)
+    if not text:
+        raise sr.UnknownValueError()
+    return text
+
+
+class GoogleRecognizer:
+    """Google Web Speech API, optionally through a guard such as ``OutboundService.call``"""
+
+    def __init__(self, call=None):
+        self.call = call or (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio, language):
+        return self.call(self.recognizer.recognize_google, audio, language=language)
+
+
+class SphinxRecognizer:
+    """CMU Sphinx, fully offline (``pip install pocketsphinx``; English models only)"""
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio, language):
+        return self.recognizer.recognize_sphinx(audio)
+
+
+class StubRecognizer:
+    """Offline stand-in: ``text`` for every chunk with sound, ``UnknownValueError`` for silence"""
+
+    def __init__(self, text=None, silence_rms=0.01):
+        self.text = text
+        self.silence_rms = silence_rms
+
+    def recognize(self, audio, language):
+        samples = np.frombuffer(audio.get_raw_data(), dtype='<i2').astype(np.float32) / 32768.0
+        if not len(samples) or np.sqrt(np.mean(np.square(samples))) < self.silence_rms:
+            raise sr.UnknownValueError()
+        seconds = len(samples) / audio.sample_rate
+        return self.text if self.text is not None else f'[{seconds:.1f} s of {language} speech]'
+
+
+RECOGNIZERS = {
+    'google': GoogleRecognizer,
+    'sphinx': SphinxRecognizer,
+    'stub': StubRecognizer,
+}
+
+
+def make_recognizer(name=None, call=None):
+    """Recognizer backend ``name`` (``SPEECH_BACKEND``, default google)"""
+    name = (name or os.getenv('SPEECH_BACKEND', 'google')).lower()
+    if name not in RECOGNIZERS:
+        raise ValueError(f"Unknown SPEECH_BACKEND {name!r}; choose from {', '.join(RECOGNIZERS)}")
+    return GoogleRecognizer(call) if name == 'google' else RECOGNIZERS[name]()
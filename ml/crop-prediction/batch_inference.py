@@ -0,0 +1,138 @@
+"""
+Batch input parsing and validation for the prediction endpoints.
+
+Soil-card uploads arrive as a JSON array, NDJSON or CSV. Everything here works
+on whole columns at once so that a 100k-row upload is validated with a handful
+of NumPy operations instead of one Python branch per field per row.
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+# (request field, min, max, error message) in model feature order
+CROP_FIELD_SPECS = [
+    ('nitrogen', 0, 200, 'Nitrogen must be between 0-200'),
+    ('phosphorus', 0, 200, 'Phosphorus must be between 0-200'),
+    ('potassium', 0, 400, 'Potassium must be between 0-400'),
+    ('temperature', 0, 50, 'Temperature must be between 0-50°C'),
+    ('humidity', 0, 100, 'Humidity must be between 0-100%'),
+    ('ph', 0, 14, 'pH must be between 0-14'),
+    ('rainfall', 0, 500, 'Rainfall must be between 0-500mm'),
+]
+
+PRODUCTION_FIELD_SPECS = [
+    ('area', np.nextafter(0, 1), np.inf, 'Area must be positive'),
+    ('nitrogen_req', 0, 200, 'Nitrogen requirement must be between 0-200'),
+    ('phosphorus_req', 0, 200, 'Phosphorus requirement must be between 0-200'),
+    ('potassium_req', 0, 400, 'Potassium requirement must be between 0-400'),
+    ('temperature', 0, 50, 'Temperature must be between 0-50°C'),
+    ('humidity', 0, 100, 'Humidity must be between 0-100%'),
+    ('ph', 0, 14, 'pH must be between 0-14'),
+    ('rainfall', 0, 500, 'Rainfall must be between 0-500mm'),
+    ('wind_speed', 0, 50, 'Wind speed must be between 0-50 km/h'),
+    ('solar_radiation', 0, 50, 'Solar radiation must be between 0-50 MJ/m²/day'),
+]
+
+# Column names used by the training CSVs, accepted as aliases in uploads
+CROP_FIELD_ALIASES = {
+    'N': 'nitrogen',
+    'P': 'phosphorus',
+    'K': 'potassium',
+}
+
+MAX_BATCH_ROWS = 100000
+
+
+class BatchPayloadError(ValueError):
+    """Raised when a batch upload cannot be parsed at all"""
+
+
+def parse_batch_payload(body, content_type):
+    """Parse a JSON array, NDJSON or CSV request body into a DataFrame"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if not body:
+        raise BatchPayloadError('Empty request body')
+
+    if content_type in ('text/csv', 'application/csv'):
+        try:
+            frame = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, na_values=[''])
+        except Exception as e:
+            raise BatchPayloadError(f'Invalid CSV payload: {e}')
+    elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonlines'):
+        records = []
+        for line_number, line in enumerate(body.decode('utf-8').splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                raise BatchPayloadError(f'Invalid JSON on line {line_number}')
+        frame = _records_to_frame(records)
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise BatchPayloadError('Invalid JSON payload')
+        # Accept both a bare array and {"samples": [...]}
+        if isinstance(payload, dict):
+            payload = payload.get('samples')
+        if not isinstance(payload, list):
+            raise BatchPayloadError('Expected a JSON array of samples')
+        frame = _records_to_frame(payload)
+
+    if len(frame) == 0:
+        raise BatchPayloadError('No samples provided')
+    if len(frame) > MAX_BATCH_ROWS:
+        raise BatchPayloadError(f'Batch too large: {len(frame)} rows (max {MAX_BATCH_ROWS})')
+
+    # Fold alias columns into their canonical field, preferring the canonical value
+    for alias, field in CROP_FIELD_ALIASES.items():
+        if alias not in frame.columns:
+            continue
+        if field in frame.columns:
+            frame[field] = frame[field].combine_first(frame[alias])
+        else:
+            frame[field] = frame[alias]
+        frame = frame.drop(columns=alias)
+
+    return frame
+
+
+def _records_to_frame(records):
+    """Build a DataFrame from decoded records, keeping non-object rows as empty rows"""
+    return pd.DataFrame.from_records([r if isinstance(r, dict) else {} for r in records])
+
+
+def build_feature_matrix(frame, field_specs):
+    """Convert a parsed batch into a float matrix plus per-row error messages
+
+    Returns ``(matrix, errors)`` where ``errors`` is an object array holding
+    ``None`` for valid rows and the first error message for invalid ones. The
+    messages match the single-sample endpoints.
+    """
+    n_rows = len(frame)
+    matrix = np.empty((n_rows, len(field_specs)), dtype=np.float64)
+    errors = np.full(n_rows, None, dtype=object)
+
+    for column, (field, low, high, range_message) in enumerate(field_specs):
+        if field not in frame.columns:
+            raw = pd.Series([None] * n_rows)
+        else:
+            raw = frame[field]
+        values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64)
+        missing = raw.isna().to_numpy()
+        invalid = np.isnan(values) & ~missing
+        out_of_range = ~np.isnan(values) & ((values < low) | (values > high))
+
+        # Only the first failing field of each row is reported
+        unset = errors == None  # noqa: E711 - elementwise comparison on object array
+        errors[missing & unset] = f'Missing required field: {field}'
+        errors[invalid & unset] = 'Invalid input data: please provide numeric values'
+        errors[out_of_range & unset] = range_message
+
+        matrix[:, column] = values
+
+    return matrix, errors
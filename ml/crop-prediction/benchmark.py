@@ -0,0 +1,783 @@
+#!/usr/bin/env python3
+"""
+KrishiKavach performance benchmarks
+
+Usage:
+    python benchmark.py <name> [<name> ...]
+    python benchmark.py all
+
+Each benchmark prints its own table. They load the model files from this
+directory, so run the script from ml/crop-prediction.
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings('ignore')
+
+# Realistic ranges of the crop recommendation inputs (N, P, K, temp, humidity, pH, rainfall)
+CROP_INPUT_RANGES = [(0, 140), (5, 145), (5, 205), (8, 44), (14, 100), (3.5, 10), (20, 300)]
+
+
+def random_crop_samples(n_rows, seed=0):
+    """Uniform random soil samples within the crop recommendation input ranges"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(low, high, n_rows) for low, high in CROP_INPUT_RANGES])
+
+
+def time_call(func, repeat):
+    """Return (p50, p99) latency of ``func()`` in milliseconds"""
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def print_table(header, rows):
+    """Print rows of values as an aligned text table"""
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    print('  '.join(str(value).ljust(width) for value, width in zip(header, widths)))
+    print('  '.join('-' * width for width in widths))
+    for row in rows:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def bench_forest():
+    """Compiled flat-array forest vs sklearn RandomForestClassifier.predict"""
+    from forest_compiler import compile_forest
+
+    with open('crop_recommendation_model.pkl', 'rb') as f:
+        crop_model = pickle.load(f)
+    compiled = compile_forest(crop_model)
+
+    X = random_crop_samples(10000)
+    assert (compiled.predict_proba(X) == crop_model.predict_proba(X)).all(), 'probabilities differ'
+    assert (compiled.predict(X) == crop_model.predict(X)).all(), 'predictions differ'
+    print(f'Compiled {compiled.n_estimators} trees, {len(compiled.feature)} nodes, '
+          f'max depth {compiled.max_depth}; predictions identical on {len(X)} rows\n')
+
+    rows = []
+    for n_rows, repeat in ((1, 200), (32, 100), (256, 30), (10000, 5)):
+        batch = X[:n_rows]
+        sk_p50, sk_p99 = time_call(lambda: crop_model.predict(batch), repeat)
+        fast_p50, fast_p99 = time_call(lambda: compiled.predict(batch), repeat)
+        rows.append((n_rows, f'{sk_p50:.3f}', f'{sk_p99:.3f}', f'{fast_p50:.3f}',
+                     f'{fast_p99:.3f}', f'{sk_p50 / fast_p50:.1f}x'))
+    print_table(('rows', 'sklearn p50 ms', 'sklearn p99 ms', 'compiled p50 ms',
+                 'compiled p99 ms', 'speedup'), rows)
+
+
+def bench_xgb():
+    """Native XGBoost JSON booster vs the pickled XGBRegressor for production estimation"""
+    from xgb_booster import DEFAULT_BOOSTER_PATH, ProductionBooster
+
+    def load_pickle():
+        with open('../xgb_model_pickle.pkl', 'rb') as f:
+            return pickle.load(f)
+
+    cache_path = DEFAULT_BOOSTER_PATH[:-len('.json')] + '.ubj'
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    startup = []
+    for label, loader in (('pickle XGBRegressor', load_pickle),
+                          ('JSON booster (cold)', lambda: ProductionBooster(nthread=1)),
+                          ('JSON booster (cached .ubj)', lambda: ProductionBooster(nthread=1))):
+        start = time.perf_counter()
+        loader()
+        startup.append((label, f'{(time.perf_counter() - start) * 1000.0:.1f}'))
+    print_table(('loader', 'startup ms'), startup)
+    print()
+
+    regressor = load_pickle()
+    booster = ProductionBooster(nthread=1)
+    X = np.random.default_rng(0).normal(size=(32, booster.n_features_in_)).astype(np.float32)
+    reference = regressor.predict(X)
+
+    rows = []
+    for n_rows in (1, 32):
+        batch = X[:n_rows]
+        p50, p99 = time_call(lambda: regressor.predict(batch), 300)
+        rows.append(('pickle XGBRegressor', 'all', n_rows, f'{p50:.3f}', f'{p99:.3f}', '0'))
+        for rounds in (None, 75, 50, 25):
+            iteration_range = None if rounds is None else (0, rounds)
+            p50, p99 = time_call(lambda: booster.predict(batch, iteration_range), 300)
+            drift = np.abs(booster.predict(X, iteration_range) - reference).mean()
+            rows.append(('JSON booster', rounds or 'all', n_rows, f'{p50:.3f}', f'{p99:.3f}', f'{drift:.1f}'))
+    print_table(('model', 'rounds', 'rows', 'p50 ms', 'p99 ms', 'mean |Δ| kg/ha'), rows)
+
+
+def bench_production():
+    """Fused float32 production pipeline vs preprocessor.transform + XGBRegressor.predict"""
+    import pandas as pd
+    from production_pipeline import FusedProductionPipeline
+    from xgb_booster import ProductionBooster
+
+    pipeline = FusedProductionPipeline.from_files(ProductionBooster(nthread=1))
+    with open('../xgb_model_pickle.pkl', 'rb') as f:
+        regressor = pickle.load(f)
+
+    rng = np.random.default_rng(0)
+    requests = [{'area': rng.uniform(0.5, 50), 'temperature': rng.uniform(15, 35),
+                 'humidity': rng.uniform(40, 90), 'ph': rng.uniform(5, 8),
+                 'rainfall': rng.uniform(50, 500), 'crop': rng.choice(['Rice', 'Maize', 'cotton'])}
+                for _ in range(1000)]
+    records = pipeline.records_from_requests(requests)
+    frame = pd.DataFrame(records)
+
+    def reference(n_rows):
+        return regressor.predict(pipeline.preprocessor.transform(frame.iloc[:n_rows]))
+
+    assert np.array_equal(reference(len(records)), pipeline.predict(records)), 'predictions differ'
+    print(f'Fused pipeline identical to transform + predict on {len(records)} rows\n')
+
+    rows = []
+    for n_rows, repeat in ((1, 300), (32, 200), (1000, 30)):
+        batch = records[:n_rows]
+        ref_p50, ref_p99 = time_call(lambda: reference(n_rows), repeat)
+        fused_p50, fused_p99 = time_call(lambda: pipeline.predict(batch), repeat)
+        rows.append((n_rows, f'{ref_p50:.3f}', f'{ref_p99:.3f}', f'{fused_p50:.3f}',
+                     f'{fused_p99:.3f}', f'{ref_p50 / fused_p50:.1f}x'))
+    print_table(('rows', 'transform+predict p50 ms', 'p99 ms', 'fused p50 ms', 'p99 ms', 'speedup'), rows)
+
+
+def _memory_worker(mode, artifact_root, ready, release):
+    """One simulated server worker: load the tree models, serve a batch, then idle"""
+    import sklearn.ensemble  # noqa: F401  (imported by every mode so baselines match)
+    import xgboost  # noqa: F401
+    warnings.filterwarnings('ignore')
+
+    X_crop = random_crop_samples(256)
+    X_production = np.random.default_rng(0).normal(size=(256, 11)).astype(np.float32)
+    if mode == 'pickle':
+        with open('crop_recommendation_model.pkl', 'rb') as f:
+            crop_model = pickle.load(f)
+        with open('../xgb_model_pickle.pkl', 'rb') as f:
+            production_model = pickle.load(f)
+    elif mode == 'memmap':
+        from tree_artifact import load_artifact
+        crop_model = load_artifact(os.path.join(artifact_root, 'crop_model'))
+        production_model = load_artifact(os.path.join(artifact_root, 'production_model_xgb'))
+    if mode != 'baseline':
+        # Touch every tree like real traffic would
+        crop_model.predict(X_crop)
+        production_model.predict(X_production)
+    ready.put(os.getpid())
+    release.wait()
+
+
+def _memory_usage_kb(pid):
+    """(Pss, Rss) of a process in kB from /proc/<pid>/smaps_rollup"""
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Pss', 'Rss'):
+                usage[key] = int(value.split()[0])
+    return usage['Pss'], usage['Rss']
+
+
+def bench_memory():
+    """Total worker memory with pickled models vs shared memory-mapped tree artifacts"""
+    import multiprocessing
+    import tempfile
+    from tree_artifact import DEFAULT_SOURCES, convert
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print('Needs Linux /proc/<pid>/smaps_rollup; skipping')
+        return
+
+    with tempfile.TemporaryDirectory() as artifact_root:
+        for name, candidates in DEFAULT_SOURCES.items():
+            # Convert the same files the pickle workers load
+            source = candidates[-1]
+            convert(source, os.path.join(artifact_root, name))
+
+        # Spawned (not forked) workers each import and load everything themselves, like gunicorn workers
+        context = multiprocessing.get_context('spawn')
+        results = {}
+        for n_workers in (1, 4, 16):
+            for mode in ('baseline', 'pickle', 'memmap'):
+                ready, release = context.Queue(), context.Event()
+                workers = [context.Process(target=_memory_worker, args=(mode, artifact_root, ready, release))
+                           for _ in range(n_workers)]
+                for worker in workers:
+                    worker.start()
+                pids = [ready.get(timeout=300) for _ in workers]
+                usage = [_memory_usage_kb(pid) for pid in pids]
+                release.set()
+                for worker in workers:
+                    worker.join()
+                results[mode, n_workers] = (sum(pss for pss, _ in usage), max(rss for _, rss in usage))
+
+    rows = []
+    for n_workers in (1, 4, 16):
+        baseline_pss, _ = results['baseline', n_workers]
+        for mode in ('pickle', 'memmap'):
+            pss, rss = results[mode, n_workers]
+            rows.append((n_workers, mode, f'{pss / 1024.0:.1f}', f'{(pss - baseline_pss) / 1024.0:.1f}',
+                         f'{(pss - baseline_pss) / 1024.0 / n_workers:.2f}', f'{rss / 1024.0:.1f}'))
+    print_table(('workers', 'format', 'total PSS MB', 'models PSS MB', 'models MB/worker',
+                 'max RSS MB'), rows)
+
+
+def bench_chat():
+    """Concurrent streaming chat conversations against fake_llm_server.py"""
+    import threading
+    from chat_streaming import HTTPStream, StreamingChat
+    from fake_llm_server import make_server
+
+    server = make_server(port=0, first_token_ms=300.0, token_ms=10.0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = HTTPStream(f'http://127.0.0.1:{server.server_address[1]}/v1/stream')
+    chat = StreamingChat()
+
+    def conversation(first_token, total):
+        start = time.perf_counter()
+        for event, _ in chat.stream(backend, 'User: which crop should I grow?'):
+            if event == 'delta' and not first_token:
+                first_token.append((time.perf_counter() - start) * 1000.0)
+        total.append((time.perf_counter() - start) * 1000.0)
+
+    rows = []
+    for n_conversations in (1, 16, 64, 256):
+        first_tokens, totals = [], []
+        threads = []
+        for _ in range(n_conversations):
+            first_token = []
+            first_tokens.append(first_token)
+            threads.append(threading.Thread(target=conversation, args=(first_token, totals)))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = (time.perf_counter() - start) * 1000.0
+        ttft = [values[0] for values in first_tokens if values]
+        rows.append((n_conversations, f'{np.percentile(ttft, 50):.0f}', f'{np.percentile(ttft, 99):.0f}',
+                     f'{np.percentile(totals, 50):.0f}', f'{wall:.0f}'))
+    server.shutdown()
+    print_table(('conversations', 'first token p50 ms', 'p99 ms', 'full answer p50 ms', 'wall ms'), rows)
+
+
+# Typical chatbot messages; the extractor benchmark cycles through them
+CHAT_CORPUS = [
+    'Which crop should I grow? N 90, P 42, K 43, temperature 21°C, humidity 82%, pH 6.5, rainfall 203 mm',
+    'I have 2 hectares of rice, what is the price going to be next month?',
+    'How much fertilizer for wheat? I put 90 kg N and 40 P per acre last year',
+    'Sold 20 quintals of wheat at ₹2000, should I store the rest?',
+    'my soil ph 5.8 and it rains a lot, 1200 mm a year',
+    'What is the best time to sow moong in Rajasthan?',
+    'Arhar/Tur yield for 3 ha in Karnataka',
+    'potato leaves have brown spots, what pest is this',
+    'Current price Rs. 1500 per quintal for onion, storage cost is 5 per day',
+    'temp is 34 degrees and humidity 40 percent, good for cotton?',
+    'hello',
+    'How do I improve soil health before the kharif season?',
+    'Coconut farm 5 acres, how much production can I expect',
+    'nitrogen: 120, phosphorus: 60, potassium: 40 for maize on 4 acres',
+    'Should I sell my 10 tons of sugarcane now or wait?',
+    'Rapeseed & Mustard or groundnut for a dry rabi season?',
+]
+
+
+def _legacy_extract(message):
+    """extract_farming_data_from_message before farming_extractor.py, for comparison"""
+    import re
+    data = {}
+    patterns = {
+        'nitrogen': r'(\d+(?:\.\d+)?)\s*(?:kg|g|mg)?\s*(?:n|nitrogen)',
+        'phosphorus': r'(\d+(?:\.\d+)?)\s*(?:kg|g|mg)?\s*(?:p|phosphorus|phosphate)',
+        'potassium': r'(\d+(?:\.\d+)?)\s*(?:kg|g|mg)?\s*(?:k|potassium)',
+        'temperature': r'(\d+(?:\.\d+)?)\s*(?:°c|celsius|degrees)',
+        'humidity': r'(\d+(?:\.\d+)?)\s*(?:%|percent)',
+        'ph': r'ph\s*(\d+(?:\.\d+)?)',
+        'rainfall': r'(\d+(?:\.\d+)?)\s*(?:mm|cm|rainfall|rains)',
+        'area': r'(\d+(?:\.\d+)?)\s*(?:hectares?|acres?|ha)',
+        'price': r'(?:rs|₹|\$)?\s*(\d+(?:\.\d+)?)',
+        'quantity': r'(\d+(?:\.\d+)?)\s*(?:tons?|kg|quintals?)'
+    }
+    for key, pattern in patterns.items():
+        matches = re.findall(pattern, message.lower())
+        if matches:
+            data[key] = float(matches[0])
+    common_crops = ['rice', 'wheat', 'maize', 'cotton', 'sugarcane', 'potato', 'tomato', 'onion', 'brinjal', 'okra',
+                    'cabbage', 'cauliflower', 'carrot', 'radish', 'spinach', 'mustard', 'groundnut', 'soybean',
+                    'pulses', 'millets']
+    for crop in common_crops:
+        if crop in message.lower():
+            data['crop'] = crop
+            break
+    return data
+
+
+def bench_extract():
+    """Single-pass farming data extractor vs the ten-regex version, over a chat corpus"""
+    import json
+    from farming_extractor import FarmingExtractor
+
+    with open('feature_info.json') as f:
+        extractor = FarmingExtractor.from_feature_info(json.load(f))
+    messages = CHAT_CORPUS * 64
+
+    def run(extract):
+        return lambda: [extract(message) for message in messages]
+
+    rows = []
+    for name, extract in (('ten regexes + 20 substrings', _legacy_extract),
+                          ('single pass (55 crop labels)', extractor.extract),
+                          ('single pass, entities + spans', extractor.entities)):
+        p50, p99 = time_call(run(extract), repeat=50)
+        rows.append((name, f'{p50 * 1000.0 / len(messages):.1f}', f'{p99 * 1000.0 / len(messages):.1f}'))
+    print_table(('extractor', 'us/message p50', 'p99'), rows)
+
+
+def _legacy_route(message):
+    """Crop model decision, fallback topic and suggestion topic as the chatbot found them before"""
+    run_crop_model = any(word in message.lower() for word in ['crop', 'recommendation', 'plant', 'grow'])
+    message_lower = message.lower()
+    topic = None
+    for name, words in (('crop', ['crop', 'recommendation', 'plant', 'grow', 'seed']),
+                        ('fertilizer', ['fertilizer', 'nutrient', 'npk', 'manure']),
+                        ('price', ['price', 'market', 'sell', 'buy', 'cost']),
+                        ('production', ['production', 'yield', 'harvest', 'output']),
+                        ('weather', ['weather', 'soil', 'rain', 'temperature']),
+                        ('general', ['farm', 'farming', 'agriculture', 'help', 'advice']),
+                        ('greeting', ['hello', 'hi', 'hey', 'namaste', 'good'])):
+        if any(word in message_lower for word in words):
+            topic = name
+            break
+    suggestions = next((name for name in ('crop', 'fertilizer', 'price', 'production')
+                        if name in message.lower()), None)
+    return run_crop_model, topic, suggestions
+
+
+def bench_intent():
+    """One-pass intent router vs the chatbot's repeated keyword scans, over a chat corpus"""
+    from intent_router import CHAT_INTENTS, IntentRouter
+
+    router = IntentRouter(CHAT_INTENTS)
+    messages = CHAT_CORPUS * 64
+
+    rows = []
+    for name, route in (('keyword scans (3 per turn)', _legacy_route),
+                        ('intent router (1 pass)', router.classify)):
+        p50, p99 = time_call(lambda: [route(message) for message in messages], repeat=50)
+        rows.append((name, f'{p50 * 1000.0 / len(messages):.1f}', f'{p99 * 1000.0 / len(messages):.1f}'))
+    print_table(('router', 'us/message p50', 'p99'), rows)
+
+
+def bench_outbound():
+    """Guarded vs unguarded calls to a slow or failing stub LLM (fake_llm_server.py)"""
+    import json
+    import threading
+    import urllib.request
+    from fake_llm_server import make_server
+    from outbound import OutboundService
+
+    def generate(url):
+        request = urllib.request.Request(url, data=json.dumps({'prompt': 'User: price?'}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)['text']
+
+    def run(call, n_callers=64):
+        latencies, fallbacks = [], []
+
+        def caller():
+            start = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                fallbacks.append(1)  # the app would answer with generate_fallback_response
+            latencies.append((time.perf_counter() - start) * 1000.0)
+
+        threads = [threading.Thread(target=caller) for _ in range(n_callers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+            time.sleep(0.005)  # requests arriving over ~0.3 s
+        for thread in threads:
+            thread.join()
+        return latencies, len(fallbacks), (time.perf_counter() - start) * 1000.0
+
+    rows = []
+    for scenario, first_token_ms, fail_rate in (('healthy', 50.0, 0.0), ('slow (3 s)', 3000.0, 0.0),
+                                                ('flaky (30% 503)', 50.0, 0.3)):
+        server = make_server(port=0, first_token_ms=first_token_ms, token_ms=0.0, fail_rate=fail_rate)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/v1/generate'
+        service = OutboundService('bench', max_concurrent=16, timeout=0.5, deadline=1.0, retries=2,
+                                  backoff=0.05, failure_threshold=5, reset_timeout=30.0)
+        for mode, call in (('unguarded', lambda: generate(url)), ('guarded', lambda: service.call(generate, url))):
+            latencies, fallbacks, wall = run(call)
+            rows.append((scenario, mode, fallbacks, f'{np.percentile(latencies, 50):.0f}',
+                         f'{np.percentile(latencies, 99):.0f}', f'{wall:.0f}',
+                         service.state if mode == 'guarded' else '-'))
+        server.shutdown()
+    print_table(('upstream', 'calls', 'fallbacks/64', 'p50 ms', 'p99 ms', 'wall ms', 'circuit'), rows)
+
+
+def _legacy_voice_upload(data, directory):
+    """/chatbot/voice before audio_pipeline.py: fixed temp file, sr.AudioFile, delete"""
+    import speech_recognition as sr
+    temp_audio_path = os.path.join(directory, 'temp_audio.wav')
+    with open(temp_audio_path, 'wb') as f:
+        f.write(data)
+    with sr.AudioFile(temp_audio_path) as source:
+        audio_data = sr.Recognizer().record(source)
+    if os.path.exists(temp_audio_path):
+        os.remove(temp_audio_path)
+    return audio_data
+
+
+def bench_voice():
+    """Concurrent voice uploads: in-memory decode + 16 kHz mono vs the temp-file path"""
+    import io
+    import tempfile
+    import threading
+    import wave
+    from audio_pipeline import StubRecognizer, prepare_upload, transcribe
+
+    # 10 s of 44.1 kHz stereo noise, like a phone recording
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes((rng.normal(0, 0.2, 44100 * 10 * 2).clip(-1, 1) * 32767).astype('<i2').tobytes())
+    upload = buffer.getvalue()
+    recognizer = StubRecognizer()
+    directory = tempfile.mkdtemp()
+
+    def run(handle, n_threads, uploads_per_thread=8):
+        errors, latencies = [], []
+
+        def worker():
+            for _ in range(uploads_per_thread):
+                start = time.perf_counter()
+                try:
+                    handle()
+                except Exception as e:
+                    errors.append(e)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+
+        threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        return len(latencies) / wall, np.percentile(latencies, 50), len(errors)
+
+    rows = []
+    for n_threads in (1, 8, 32):
+        for name, handle in (('temp file + sr.AudioFile', lambda: _legacy_voice_upload(upload, directory)),
+                             ('in memory, 16 kHz mono', lambda: transcribe(recognizer, prepare_upload(upload), 'en-IN'))):
+            throughput, p50, errors = run(handle, n_threads)
+            rows.append((n_threads, name, f'{throughput:.0f}', f'{p50:.1f}', errors))
+    print_table(('concurrent uploads', 'path', 'uploads/s', 'p50 ms', 'errors'), rows)
+    print(f'upload {len(upload) / 1e6:.1f} MB; recognizer payload per upload: '
+          f'{len(upload) / 1e6:.1f} MB before, {sum(len(chunk.frame_data) for chunk in prepare_upload(upload)) / 1e6:.2f} MB now')
+
+
+def synthetic_leaves(n_images, size, n_classes, seed=0):
+    """Green leaf-like images with class-specific lesion colour and count; (images, labels)"""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, n_classes, n_images)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    images = np.empty((n_images, size, size, 3), dtype=np.uint8)
+    for i, label in enumerate(labels):
+        leaf = ((yy - 0.5) ** 2 / 0.2 + (xx - 0.5) ** 2 / 0.12) < 1.0
+        image = np.where(leaf[..., None], [60, 140 + rng.integers(-20, 20), 50], [200, 190, 170]).astype(np.float64)
+        lesion = np.array([120 + 3 * label, 90 + (label * 37) % 100, 30 + (label * 11) % 60])
+        for _ in range(1 + label % 6):
+            cy, cx, radius = rng.uniform(0.25, 0.75), rng.uniform(0.3, 0.7), rng.uniform(0.02, 0.04 + label / 600)
+            image[((yy - cy) ** 2 + (xx - cx) ** 2 < radius ** 2) & leaf] = lesion
+        images[i] = np.clip(image + rng.normal(0, 8, image.shape), 0, 255)
+    return images, labels
+
+
+def bench_pest():
+    """NumPy leaf classifier: feature extraction + softmax latency per batch size"""
+    from leaf_classifier import FEATURE_SIZE, LeafClassifier, extract_features
+    from pest_detection import CLASS_NAMES
+
+    images, labels = synthetic_leaves(1200, FEATURE_SIZE, len(CLASS_NAMES))
+    start = time.perf_counter()
+    features = extract_features(images)
+    classifier = LeafClassifier.fit(features[:1000], labels[:1000], CLASS_NAMES)
+    accuracy = (classifier.predict_proba(features[1000:]).argmax(axis=1) == labels[1000:]).mean()
+    print(f'trained on 1000 synthetic leaves in {time.perf_counter() - start:.1f} s, '
+          f'holdout accuracy {accuracy:.2f} (synthetic data; only the latency is meaningful)')
+
+    rows = []
+    for batch_size in (1, 8, 32, 128):
+        batch = images[:batch_size]
+        batch_features = features[:batch_size]
+        repeat = max(10, 400 // batch_size)
+        feature_p50, _ = time_call(lambda: extract_features(batch), repeat)
+        model_p50, _ = time_call(lambda: classifier.predict_proba(batch_features), repeat)
+        p50, p99 = time_call(lambda: classifier.predict_images(batch), repeat)
+        rows.append((batch_size, f'{feature_p50:.2f}', f'{model_p50:.3f}', f'{p50:.2f}', f'{p99:.2f}',
+                     f'{p50 / batch_size:.2f}'))
+    print_table(('batch', 'features ms', 'softmax ms', 'total p50 ms', 'total p99 ms', 'ms/image'), rows)
+    print(f'{FEATURE_SIZE}x{FEATURE_SIZE} px inputs, {features.shape[1]} features, '
+          f'{classifier.weights.nbytes / 1024:.0f} KB of weights')
+
+
+def _legacy_preprocess(image_bytes, target_size=(224, 224)):
+    """PestDetectionModel.preprocess_image before the preprocessing engine"""
+    import io
+    from PIL import Image
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img = img.resize(target_size, Image.Resampling.LANCZOS)
+    return np.expand_dims(np.array(img) / 255.0, axis=0)
+
+
+def bench_images():
+    """Leaf photo preprocessing: draft decode + reduce into a float32 buffer vs full decode + LANCZOS"""
+    import io
+    from PIL import Image
+    from image_preprocessing import ImagePreprocessor
+
+    # A 12 MP phone-sized JPEG and a 1 MP PNG of a synthetic leaf
+    leaf = Image.fromarray(synthetic_leaves(1, 256, 38)[0][0])
+    uploads = {}
+    for name, size, fmt in (('12 MP JPEG', (4032, 3024), 'JPEG'), ('1 MP PNG', (1280, 960), 'PNG')):
+        buffer = io.BytesIO()
+        leaf.resize(size, Image.Resampling.BICUBIC).save(buffer, fmt, quality=90)
+        uploads[name] = buffer.getvalue()
+
+    rows = []
+    for name, data in uploads.items():
+        legacy_p50, _ = time_call(lambda: _legacy_preprocess(data), 10)
+        preprocessor = ImagePreprocessor((224, 224), dtype=np.float32)
+        out = preprocessor.empty(1)[0]
+        p50, p99 = time_call(lambda: preprocessor.preprocess(data, out=out), 20)
+        stages = preprocessor.stats()['stages_ms']
+        rows.append((name, f'{len(data) / 1e6:.1f} MB', f'{legacy_p50:.1f}', f'{p50:.1f}', f'{p99:.1f}',
+                     *(f'{stages[stage]["p50"]:.2f}' for stage in ('decode', 'resize', 'normalize')),
+                     f'{legacy_p50 / p50:.1f}x'))
+    print_table(('upload', 'size', 'legacy p50 ms', 'engine p50 ms', 'engine p99 ms',
+                 'decode', 'resize', 'normalize', 'speedup'), rows)
+
+    batch = [uploads['12 MP JPEG']] * 16
+    rows = []
+    for workers in (1, 4):
+        engine = ImagePreprocessor((224, 224), dtype=np.float32, max_workers=workers)
+        buffer = engine.empty(len(batch))
+        p50, _ = time_call(lambda: engine.preprocess_batch(batch, out=buffer), 5)
+        rows.append((workers, len(batch), f'{p50:.0f}', f'{len(batch) / p50 * 1000:.0f}'))
+    print_table(('threads', 'batch', 'p50 ms', 'images/s'), rows)
+    print(f'{os.cpu_count()} CPUs; output {buffer.nbytes / 1e6:.1f} MB float32 vs '
+          f'{len(batch) * 224 * 224 * 3 * 8 / 1e6:.1f} MB float64 before')
+
+
+def bench_pest_cache():
+    """Perceptual-hash pest analysis cache: lookup cost and hit rate on re-uploaded photos"""
+    import io
+    from PIL import Image
+    from image_hash_cache import PerceptualCache
+
+    rng = np.random.default_rng(0)
+
+    def photo(seed, size=(1024, 768), quality=90):
+        # Smooth random colour field: distinct photos differ at thumbnail scale
+        field = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(field).resize(size, Image.Resampling.BICUBIC).save(buffer, 'JPEG', quality=quality)
+        return buffer.getvalue()
+
+    rows = []
+    for method in ('dhash', 'phash'):
+        cache = PerceptualCache(capacity=4096, method=method, path='')
+        originals, hits, false_hits, reuploads = [], 0, 0, 0
+        for step in range(300):
+            if originals and rng.random() < 0.4:
+                # Re-upload of an earlier photo, resized and recompressed by the phone or messenger
+                seed = originals[rng.integers(len(originals))]
+                data = photo(seed, size=(int(rng.integers(640, 1600)), 600), quality=int(rng.integers(60, 95)))
+                reuploads += 1
+            else:
+                seed = 1000 + step
+                originals.append(seed)
+                data = photo(seed)
+            image_hash, cached = cache.lookup(data, 'field')
+            if cached is None:
+                cache.put(image_hash, 'field', {'seed': seed}, 2.0)  # a ~2 s Gemini call
+            elif cached['seed'] == seed:
+                hits += 1
+            else:
+                false_hits += 1
+        stats = cache.stats()
+        rows.append((method, reuploads, f'{hits / reuploads:.2f}', false_hits, stats['lookup_p50_ms'],
+                     stats['lookup_p99_ms'], f'{stats["saved_ms"] / 1000:.0f}'))
+    print_table(('hash', 're-uploads', 'hit rate', 'false hits', 'lookup p50 ms', 'lookup p99 ms',
+                 'Gemini s saved'), rows)
+
+    big = photo(1, size=(4032, 3024))
+    rows = []
+    for capacity in (1024, 16384):
+        cache = PerceptualCache(capacity=capacity, path='')
+        for value in rng.integers(0, 2 ** 63, capacity, dtype=np.int64):
+            cache.put(int(value), 'field', {}, 1.0)
+        p50, p99 = time_call(lambda: cache.lookup(big, 'field'), 30)
+        rows.append((capacity, f'{p50:.2f}', f'{p99:.2f}'))
+    print_table(('entries', '12 MP hash + lookup p50 ms', 'p99 ms'), rows)
+
+
+def bench_gemini_images():
+    """Gemini vision payloads: bytes sent per upload, before (base64) and after re-encoding"""
+    import io
+    from PIL import Image
+    from image_payload import ImagePayloadOptimizer
+
+    # A textured "leaf photo": smooth colour field plus sensor noise, as phones produce
+    rng = np.random.default_rng(0)
+    field = Image.fromarray(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)).resize((4032, 3024),
+                                                                                       Image.Resampling.BICUBIC)
+    noisy = np.clip(np.asarray(field, dtype=np.int16) + rng.integers(-12, 13, (3024, 4032, 3)), 0, 255)
+    photo = Image.fromarray(noisy.astype(np.uint8))
+    uploads = {}
+    for name, size, image_format in (('12 MP JPEG', (4032, 3024), 'JPEG'), ('3 MP PNG', (2000, 1500), 'PNG')):
+        buffer = io.BytesIO()
+        photo.resize(size, Image.Resampling.BILINEAR).save(buffer, image_format, quality=92)
+        uploads[name] = buffer.getvalue()
+
+    # Upload time at a rural mobile uplink, for scale
+    uplink_bytes_per_s = 2e6 / 8
+    rows = []
+    for name, data in uploads.items():
+        base64_bytes = -(-len(data) // 3) * 4
+        rows.append((name, 'base64 original', '-', base64_bytes // 1024, '-', f'{base64_bytes / uplink_bytes_per_s:.1f}'))
+        for image_format in ('jpeg', 'webp'):
+            optimizer = ImagePayloadOptimizer(max_edge=1024, image_format=image_format, quality=85, baseline_rate=0)
+            payload = optimizer.optimize(data)
+            p50, _ = time_call(lambda: optimizer.optimize(data), 5)
+            rows.append((name, image_format, 'x'.join(map(str, payload.size)), len(payload.data) // 1024,
+                         f'{p50:.0f}', f'{len(payload.data) / uplink_bytes_per_s:.1f}'))
+    print_table(('upload', 'sent as', 'pixels', 'KB', 'encode p50 ms', 's at 2 Mbit/s'), rows)
+
+
+def bench_reload():
+    """Hot model reload: single-row latency while the crop model is swapped every 0.5 s"""
+    import threading
+    from sklearn.ensemble import RandomForestClassifier
+    from model_registry import ModelRegistry
+
+    X = random_crop_samples(2000)
+    y = (X[:, 0] // 30 + X[:, 6] // 100).astype(int)
+    blob = pickle.dumps(RandomForestClassifier(n_estimators=100, random_state=0).fit(X, y))
+    rows = [X[i:i + 1] for i in range(200)]
+
+    rows_out = []
+    for label, reload_every in (('no reloads', None), ('reload every 0.5 s', 0.5)):
+        registry = ModelRegistry()
+        registry.register('crop', lambda: pickle.loads(blob), warmup=lambda model: model.predict(rows[0]))
+        registry.get('crop')
+        stop = threading.Event()
+        timings, errors = [], 0
+
+        def reloader():
+            while not stop.wait(reload_every):
+                registry.reload('crop')
+
+        thread = threading.Thread(target=reloader) if reload_every else None
+        if thread:
+            thread.start()
+        deadline = time.perf_counter() + 3.0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                registry.get('crop').predict(rows[len(timings) % len(rows)])
+            except Exception:
+                errors += 1
+            timings.append((time.perf_counter() - start) * 1000.0)
+        stop.set()
+        if thread:
+            thread.join()
+        rows_out.append((label, len(timings), registry.status()['crop']['reloads'], errors,
+                         f'{np.percentile(timings, 50):.2f}', f'{np.percentile(timings, 99):.2f}'))
+    print_table(('case', 'requests', 'swaps', 'errors', 'p50 ms', 'p99 ms'), rows_out)
+
+
+def bench_shadow():
+    """Shadow evaluation: time a request spends handing a sample to the candidate, by fraction"""
+    from sklearn.ensemble import RandomForestClassifier
+    from shadow_evaluation import ShadowEvaluator
+
+    X = random_crop_samples(2000)
+    y = (X[:, 0] // 30 + X[:, 6] // 100).astype(int)
+    incumbent = RandomForestClassifier(n_estimators=50, random_state=0).fit(X, y)
+    candidate = RandomForestClassifier(n_estimators=100, random_state=1).fit(X, y)
+    rows = [X[i:i + 1] for i in range(500)]
+
+    results = []
+    for fraction in (0.0, 0.1, 1.0):
+        shadow = ShadowEvaluator(fraction=fraction, max_workers=2, max_pending=64)
+        shadow.register('crop', lambda row: int(incumbent.predict(row)[0]), lambda row: int(candidate.predict(row)[0]))
+        timings = []
+        for row in rows:
+            start = time.perf_counter()
+            served = int(incumbent.predict(row)[0])
+            shadow.submit('crop', row, served)
+            timings.append((time.perf_counter() - start) * 1000.0)
+        deadline = time.time() + 30
+        while shadow.stats()['pending'] and time.time() < deadline:
+            time.sleep(0.05)
+        stats = shadow.stats()['routes']['crop']
+        results.append((fraction, f'{np.percentile(timings, 50):.2f}', f'{np.percentile(timings, 99):.2f}',
+                        stats['compared'], stats['dropped'], stats['disagreement_rate'], stats['delta_p50_ms']))
+    print_table(('fraction', 'request p50 ms', 'request p99 ms', 'compared', 'dropped', 'disagreement',
+                 'delta p50 ms'), results)
+
+
+BENCHMARKS = {
+    'forest': bench_forest,
+    'xgb': bench_xgb,
+    'production': bench_production,
+    'memory': bench_memory,
+    'chat': bench_chat,
+    'extract': bench_extract,
+    'intent': bench_intent,
+    'outbound': bench_outbound,
+    'voice': bench_voice,
+    'pest': bench_pest,
+    'images': bench_images,
+    'pest_cache': bench_pest_cache,
+    'gemini_images': bench_gemini_images,
+    'reload': bench_reload,
+    'shadow': bench_shadow,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='KrishiKavach performance benchmarks')
+    parser.add_argument('names', nargs='+', choices=sorted(BENCHMARKS) + ['all'])
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if 'all' in args.names else args.names
+    for name in names:
+        print('=' * 60)
+        print(f'{name}: {BENCHMARKS[name].__doc__}')
+        print('=' * 60)
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Streaming chatbot responses over server-sent events.
+
+``/chatbot/api`` waits for the whole Gemini answer and every translation
+before it replies. The streaming path instead forwards the LLM output as it
+arrives: English text is sent token by token, other languages are translated
+one sentence at a time while the rest of the answer is still being generated.
+
+All LLM streams of a worker run as coroutines on one background asyncio
+loop, and translations of finished sentences run in a small thread pool next
+to it, so a worker is never blocked on the LLM itself; request threads only
+drain a queue. Run the app with many cheap threads (``gunicorn -k gthread
+--threads 64``) and one worker holds that many conversations at once.
+
+Two LLM backends are provided: ``GeminiStream`` (``generate_content_async``
+with ``stream=True``) and ``HTTPStream``, which reads an SSE endpoint such as
+``fake_llm_server.py`` for load tests without an API key.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# A sentence ends at ., !, ?, the Devanagari danda or a newline, followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?।\n])\s+')
+
+_DONE = object()
+
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def split_sentences(buffer):
+    """Split ``buffer`` into complete sentences and the unfinished remainder"""
+    parts = _SENTENCE_END.split(buffer)
+    return parts[:-1], parts[-1]
+
+
+class GeminiStream:
+    """Stream text chunks from a ``google.generativeai.GenerativeModel``
+
+    With an ``OutboundService`` the stream holds one of its slots, times out
+    when Gemini stalls and counts towards its circuit breaker.
+    """
+
+    def __init__(self, model, service=None):
+        self.model = model
+        self.service = service
+
+    async def stream(self, prompt):
+        chunks = self.service.stream(lambda: self._chunks(prompt)) if self.service else self._chunks(prompt)
+        async for text in chunks:
+            yield text
+
+    async def _chunks(self, prompt):
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+
+class HTTPStream:
+    """Stream text from an SSE endpoint answering ``POST {"prompt": ...}``
+
+    Each ``data:`` line carries ``{"text": "..."}``; ``data: [DONE]`` ends the
+    stream. Uses plain asyncio streams, so no HTTP client library is needed.
+    """
+
+    def __init__(self, url, timeout=60.0):
+        self.url = url
+        self.timeout = timeout
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.ssl = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+
+    async def stream(self, prompt):
+        body = json.dumps({'prompt': prompt}).encode()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl or None), self.timeout)
+        try:
+            writer.write((f'POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                          f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                          'Accept: text/event-stream\r\nConnection: close\r\n\r\n').encode() + body)
+            await writer.drain()
+
+            status = await asyncio.wait_for(reader.readline(), self.timeout)
+            if b' 200 ' not in status:
+                raise ConnectionError(f'LLM server answered {status.decode().strip()!r}')
+            chunked = False
+            while True:
+                header = await asyncio.wait_for(reader.readline(), self.timeout)
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = header.decode().partition(':')
+                if name.strip().lower() == 'transfer-encoding' and 'chunked' in value.lower():
+                    chunked = True
+
+            pending = b''
+            async for data in self._body(reader, chunked):
+                pending += data
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    line = line.strip()
+                    if not line.startswith(b'data:'):
+                        continue
+                    payload = line[len(b'data:'):].strip()
+                    if payload == b'[DONE]':
+                        return
+                    text = json.loads(payload).get('text', '')
+                    if text:
+                        yield text
+        finally:
+            writer.close()
+
+    async def _body(self, reader, chunked):
+        if not chunked:
+            while True:
+                data = await asyncio.wait_for(reader.read(4096), self.timeout)
+                if not data:
+                    return
+                yield data
+        while True:
+            size = int((await asyncio.wait_for(reader.readline(), self.timeout)).split(b';')[0], 16)
+            if size == 0:
+                return
+            yield await asyncio.wait_for(reader.readexactly(size), self.timeout)
+            await reader.readline()
+
+
+class StreamingChat:
+    """Background event loop running LLM streams for request threads"""
+
+    def __init__(self, max_streams=None, translate_workers=None):
+        """
+        Args:
+            max_streams: Concurrent LLM streams per worker (``CHAT_STREAM_MAX_CONCURRENT``);
+                extra conversations wait for a slot
+            translate_workers: Threads for blocking translation calls and
+                fallback answers (``CHAT_TRANSLATE_WORKERS``)
+        """
+        if max_streams is None:
+            max_streams = int(os.getenv('CHAT_STREAM_MAX_CONCURRENT', '256'))
+        if translate_workers is None:
+            translate_workers = int(os.getenv('CHAT_TRANSLATE_WORKERS', '8'))
+        self.max_streams = max_streams
+        self._translate_pool = ThreadPoolExecutor(max_workers=translate_workers,
+                                                  thread_name_prefix='chat-translate')
+        self._loop = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='chat-stream-loop', daemon=True).start()
+                self._slots = asyncio.run_coroutine_threadsafe(self._make_slots(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _make_slots(self):
+        return asyncio.Semaphore(self.max_streams)
+
+    def stream(self, backend, prompt, target_language='en', translate=None, fallback=None,
+               suffix='', heartbeat=15.0):
+        """Yield ``(event, payload)`` pairs for one answer
+
+        Events are ``delta`` (``{"text"}``) as text becomes available and a
+        final ``done`` with the full English and translated text; a heartbeat
+        ``ping`` is yielded while nothing else is ready.
+
+        Args:
+            backend: ``GeminiStream``/``HTTPStream``, or ``None`` to send ``fallback()``
+            target_language: Language of the ``delta`` text
+            translate: Blocking ``translate(text, language)``; needed unless English
+            fallback: ``fallback()`` returning a full answer if the LLM fails before
+                producing any text
+            suffix: English text appended after the LLM answer
+        """
+        loop = self._ensure_loop()
+        events = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(backend, prompt, target_language, translate, fallback, suffix, events), loop)
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield 'ping', {}
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            # Client went away (or we finished): stop generating for it
+            future.cancel()
+
+    async def _run(self, backend, prompt, target_language, translate, fallback, suffix, events):
+        loop = asyncio.get_running_loop()
+        translating = target_language != 'en' and translate is not None
+        english, translated = [], []
+        sentences = asyncio.Queue()
+
+        async def translator():
+            # Translate finished sentences in order while the LLM keeps streaming
+            while True:
+                sentence = await sentences.get()
+                if sentence is None:
+                    return
+                text = await loop.run_in_executor(self._translate_pool, translate, sentence, target_language)
+                translated.append(text)
+                events.put(('delta', {'text': text + ' '}))
+
+        translator_task = asyncio.create_task(translator()) if translating else None
+        buffer = ''
+
+        def emit(text):
+            nonlocal buffer
+            english.append(text)
+            if not translating:
+                events.put(('delta', {'text': text}))
+                return
+            buffer += text
+            complete, buffer = split_sentences(buffer)
+            for sentence in complete:
+                sentences.put_nowait(sentence)
+
+        try:
+            async with self._slots:
+                self.active += 1
+                try:
+                    if backend is not None:
+                        async for text in backend.stream(prompt):
+                            emit(text)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"LLM stream error: {e!r}")
+                    if english:
+                        events.put(('error', {'error': 'The answer was cut short. Please try again.'}))
+                finally:
+                    self.active -= 1
+
+            if not english and fallback is not None:
+                # The fallback may run a model; keep it off the loop the other streams share
+                emit(await loop.run_in_executor(self._translate_pool, fallback))
+            if suffix:
+                emit(suffix)
+            if translating:
+                if buffer.strip():
+                    sentences.put_nowait(buffer)
+                sentences.put_nowait(None)
+                await translator_task
+
+            response = ''.join(english).strip()
+            events.put(('done', {
+                'response': ' '.join(translated).strip() if translating else response,
+                'response_en': response,
+            }))
+        except asyncio.CancelledError:
+            if translator_task is not None:
+                translator_task.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Streaming chat failed: {e}")
+            events.put(('error', {'error': str(e)}))
+        finally:
+            events.put(_DONE)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini API, for load testing the streaming chatbot
+
+Answers ``POST /v1/stream`` with ``{"prompt": "..."}`` by streaming a canned
+farming answer as server-sent events, one word per event, with a configurable
+time to first token and delay between tokens:
+
+    data: {"text": "Rice "}
+    ...
+    data: [DONE]
+
+``POST /v1/generate`` returns the whole answer at once as ``{"text": "..."}``,
+after the same total delay. ``--fail-rate`` answers that share of requests
+with a 503, for exercising the outbound-call guards in ``outbound.py``.
+
+Usage:
+    python fake_llm_server.py --port 8090 --first-token-ms 400 --token-ms 25
+    CHATBOT_LLM_URL=http://127.0.0.1:8090/v1/stream python app.py
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWERS = {
+    'crop': ("For your soil, rice and maize are good choices. Rice needs standing water and "
+             "plenty of nitrogen. Maize prefers well drained soil with a pH between 5.5 and 7.5. "
+             "Test your soil before sowing and rotate crops every season to keep it healthy."),
+    'fertilizer': ("Apply nitrogen in two or three split doses instead of all at once. Use compost "
+                   "or farmyard manure to improve soil structure. Always water the field before "
+                   "applying fertilizer and follow the dosage on your soil health card."),
+    'price': ("Prices usually rise a few weeks after harvest when market arrivals fall. If your "
+              "storage costs are low and the produce keeps well, holding for fifteen days can pay "
+              "off. Check the local mandi rates before you decide."),
+}
+DEFAULT_ANSWER = ("I can help with crop recommendations, fertilizer advice, market prices and "
+                  "production estimates. Tell me about your soil, weather and field size, and I "
+                  "will suggest what to do next.")
+
+
+def answer_for(prompt):
+    # Match on the user's turn, not the system context in front of it
+    lowered = prompt.rsplit('User:', 1)[-1].lower()
+    for keyword, answer in ANSWERS.items():
+        if keyword in lowered:
+            return answer
+    return DEFAULT_ANSWER
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    first_token_ms = 400.0
+    token_ms = 25.0
+    max_tokens = 0
+    fail_rate = 0.0
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{"status": "ok"}')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            prompt = json.loads(self.rfile.read(length) or b'{}').get('prompt', '')
+        except ValueError:
+            self.send_error(400, 'Body must be JSON')
+            return
+
+        words = answer_for(prompt).split(' ')
+        if self.max_tokens:
+            words = words[:self.max_tokens]
+
+        if self.fail_rate and random.random() < self.fail_rate:
+            self.send_error(503, 'Injected failure')
+            return
+        if self.path == '/v1/generate':
+            time.sleep((self.first_token_ms + self.token_ms * (len(words) - 1)) / 1000.0)
+            body = json.dumps({'text': ' '.join(words)}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            time.sleep(self.first_token_ms / 1000.0)
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(self.token_ms / 1000.0)
+                text = word if index == len(words) - 1 else word + ' '
+                self.wfile.write(f'data: {json.dumps({"text": text})}\n\n'.encode())
+                self.wfile.flush()
+            self.wfile.write(b'data: [DONE]\n\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled the stream
+
+    def log_message(self, format, *args):
+        pass  # keep load tests quiet
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 1024  # the default backlog of 5 drops load-test connections
+
+
+def make_server(host='127.0.0.1', port=8090, first_token_ms=400.0, token_ms=25.0, max_tokens=0, fail_rate=0.0):
+    """Build (but do not start) a fake LLM server; port 0 picks a free port"""
+    handler = type('ConfiguredFakeLLMHandler', (FakeLLMHandler,), {
+        'first_token_ms': first_token_ms, 'token_ms': token_ms, 'max_tokens': max_tokens,
+        'fail_rate': fail_rate})
+    server = _Server((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake streaming LLM server for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--first-token-ms', type=float, default=400.0)
+    parser.add_argument('--token-ms', type=float, default=25.0)
+    parser.add_argument('--max-tokens', type=int, default=0, help='truncate answers (0 = full)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with a 503')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.first_token_ms, args.token_ms, args.max_tokens,
+                         args.fail_rate)
+    print(f'Fake LLM streaming on http://{args.host}:{server.server_address[1]}/v1/stream')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Single-pass extraction of farming data (nutrients, weather, area, crops) from chat text.
+
+``extract_farming_data_from_message`` used to run ten ``re.findall`` calls on
+a freshly lowercased message and then test twenty crop names with substring
+``in`` checks. ``FarmingExtractor`` compiles everything once into a single
+case-insensitive regex that ``finditer`` walks in one pass:
+
+* numeric fields: a number with an optional label before it ("pH 6.5",
+  "nitrogen: 90"), or with an optional unit and label after it ("90 kg N",
+  "30°C", "200 mm"), plus currency prefixes for prices;
+* crop names: every name and alias is folded into a character trie and
+  emitted as one prefix-factored alternation, which the regex engine matches
+  like an Aho-Corasick automaton (no backtracking across names), with word
+  boundaries so "price" no longer matches "rice".
+
+Each match becomes an ``Entity`` with its field, value, normalized unit and
+character span; ``extract`` keeps the first value per field like before.
+"""
+
+import re
+from collections import namedtuple
+
+Entity = namedtuple('Entity', ['field', 'value', 'unit', 'span'])
+
+# The original chatbot crop list; crop_labels from feature_info.json are added on top
+COMMON_CROPS = ['rice', 'wheat', 'maize', 'cotton', 'sugarcane', 'potato', 'tomato', 'onion', 'brinjal',
+                'okra', 'cabbage', 'cauliflower', 'carrot', 'radish', 'spinach', 'mustard', 'groundnut',
+                'soybean', 'pulses', 'millets']
+
+# Field named by a label word, before or after the number
+_LABEL_FIELDS = {
+    'nitrogen': 'nitrogen', 'n': 'nitrogen',
+    'phosphorus': 'phosphorus', 'phosphate': 'phosphorus', 'p': 'phosphorus',
+    'potassium': 'potassium', 'potash': 'potassium', 'k': 'potassium',
+    'ph': 'ph',
+    'temperature': 'temperature', 'temp': 'temperature',
+    'humidity': 'humidity',
+    'rainfall': 'rainfall', 'rain': 'rainfall', 'rains': 'rainfall',
+    'area': 'area',
+    'price': 'price',
+    'quantity': 'quantity',
+}
+_BEFORE_LABELS = ['nitrogen', 'phosphorus', 'phosphate', 'potassium', 'potash', 'ph', 'temperature', 'temp',
+                  'humidity', 'rainfall', 'rain', 'area', 'price', 'quantity', 'n', 'p', 'k']
+_AFTER_LABELS = ['nitrogen', 'phosphorus', 'phosphate', 'potassium', 'potash', 'rainfall', 'rains',
+                 'n', 'p', 'k']
+
+# Unit spelling -> (normalized unit, field when no label says otherwise)
+_UNITS = {
+    '°c': ('°C', 'temperature'), '° c': ('°C', 'temperature'), 'celsius': ('°C', 'temperature'),
+    'degrees': ('°C', 'temperature'),
+    '%': ('%', 'humidity'), 'percent': ('%', 'humidity'),
+    'mm': ('mm', 'rainfall'), 'cm': ('cm', 'rainfall'),
+    'hectares': ('ha', 'area'), 'hectare': ('ha', 'area'), 'ha': ('ha', 'area'),
+    'acres': ('acre', 'area'), 'acre': ('acre', 'area'),
+    'tons': ('t', 'quantity'), 'ton': ('t', 'quantity'),
+    'quintals': ('quintal', 'quantity'), 'quintal': ('quintal', 'quantity'),
+    'kg': ('kg', 'quantity'), 'mg': ('mg', None), 'g': ('g', None),
+}
+_CURRENCIES = {'rs.': 'INR', 'rs': 'INR', '₹': 'INR', '$': 'USD'}
+
+
+def trie_regex(words):
+    """Prefix-factored regex matching exactly ``words``, e.g. ['rice', 'ragi'] -> 'r(?:agi|ice)'"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def emit(node):
+        ends = '' in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # A word may end here or continue; trying the longer branch first gives longest match
+        return f'(?:{body})?' if ends else body
+    return emit(trie)
+
+
+def crop_aliases(label):
+    """Lowercase names a crop label can be written as ('Moong(Green Gram)' -> moong, green gram)"""
+    name = ' '.join(label.lower().split())
+    aliases = {name}
+    for part in re.split(r'[()/&,]', name):
+        part = part.strip()
+        if len(part) >= 3 and part not in ('total', 'other'):
+            aliases.add(part)
+    return aliases
+
+
+class FarmingExtractor:
+    """Compiled extractor for numbers with units/labels and crop names"""
+
+    def __init__(self, crop_labels=(), common_crops=COMMON_CROPS):
+        # Alias -> canonical crop name; the original list keeps its own spelling
+        self.crop_names = {}
+        for crop in common_crops:
+            self.crop_names[crop] = crop
+        for label in crop_labels:
+            canonical = ' '.join(label.lower().split())
+            for alias in crop_aliases(label):
+                self.crop_names.setdefault(alias, canonical)
+
+        number = r'(?P<{}>\d+(?:\.\d+)?)'
+        unit = fr"(?:\s*(?P<{{}}>{trie_regex(_UNITS)})(?![a-z]))?"
+        self.pattern = re.compile(
+            # Crop names, whole words only
+            fr"(?P<crop>\b{trie_regex(self.crop_names)}\b)"
+            # "pH 6.5", "nitrogen: 90 kg", "temperature is 30°C"
+            fr"|\b(?P<before>{trie_regex(_BEFORE_LABELS)})\s*(?:[:=-]|is|of)?\s*{number.format('value1')}"
+            fr"{unit.format('unit1')}"
+            # "90 kg N", "₹2000", "200 mm rainfall", "30 degrees"
+            fr"|(?P<currency>\brs\.?|₹|\$)?\s*{number.format('value2')}{unit.format('unit2')}"
+            fr"(?:\s*(?P<after>{trie_regex(_AFTER_LABELS)})\b)?",
+            re.IGNORECASE)
+
+    @classmethod
+    def from_feature_info(cls, feature_info):
+        return cls(crop_labels=(feature_info or {}).get('crop_labels', ()))
+
+    def entities(self, message):
+        """Every recognized entity in ``message``, in order of appearance"""
+        found = []
+        for match in self.pattern.finditer(message):
+            if match.group('crop'):
+                name = match.group('crop').lower()
+                found.append(Entity('crop', self.crop_names.get(' '.join(name.split()), name), None, match.span()))
+                continue
+            entity = self._numeric(match)
+            if entity is not None:
+                found.append(entity)
+        return found
+
+    def extract(self, message):
+        """``{field: first value}``, the shape ``extract_farming_data_from_message`` returns"""
+        data = {}
+        for entity in self.entities(message):
+            data.setdefault(entity.field, entity.value)
+        return data
+
+    def _numeric(self, match):
+        if match.group('value1') is not None:
+            value, unit_text, label = match.group('value1'), match.group('unit1'), match.group('before')
+        else:
+            value, unit_text, label = match.group('value2'), match.group('unit2'), match.group('after')
+        unit, unit_field = _UNITS.get(unit_text.lower(), (None, None)) if unit_text else (None, None)
+        currency = match.group('currency')
+
+        if label:
+            field = _LABEL_FIELDS[label.lower()]
+        elif currency:
+            field, unit = 'price', _CURRENCIES[currency.lower()]
+        else:
+            field = unit_field
+        if field is None:
+            return None  # bare number, nothing says what it measures
+        if field == 'price' and currency and unit is None:
+            unit = _CURRENCIES[currency.lower()]
+        return Entity(field, float(value), unit, match.span())
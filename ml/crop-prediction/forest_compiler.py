@@ -0,0 +1,342 @@
+"""
+Flat, array-backed evaluator for fitted tree ensembles (sklearn forests, XGBoost).
+
+``compile_forest`` exports every tree of a fitted ``RandomForestClassifier`` or
+``RandomForestRegressor`` into a handful of contiguous NumPy arrays (feature
+index, threshold, left/right child and leaf values). ``CompiledForest`` then
+walks all trees for a whole batch at once, one tree level per step, instead of
+going through sklearn's per-call validation and per-tree dispatch.
+
+The win is in per-call overhead: a one-row prediction is over ten times
+faster than ``RandomForestClassifier.predict``, while sklearn's Cython
+traversal pulls ahead again somewhere past a few hundred rows (see
+``benchmark.py forest``). Callers should route large batches to sklearn.
+
+Predictions match sklearn exactly: inputs are cast to float32 and compared
+with ``<=`` against the float64 thresholds like sklearn's tree code, and the
+per-tree outputs are accumulated in tree order before averaging.
+
+``compile_xgboost`` flattens a single-output XGBoost ``gbtree`` regressor the
+same way. Its splits use ``<`` against float32 thresholds with per-node NaN
+directions, and leaf values are summed in float32 starting at ``base_score``,
+which reproduces ``Booster.predict`` bit for bit.
+
+Usage:
+    python forest_compiler.py crop_recommendation_model.pkl crop_forest.npz
+"""
+
+import json
+import pickle
+import sys
+
+import numpy as np
+
+
+class CompiledForest:
+    """Random forest stored as flat node arrays, evaluated level by level"""
+
+    def __init__(self, feature, threshold, left, right, leaf_values, roots, max_depth,
+                 n_features, classes=None, decision='<=', aggregation='mean', base_score=0.0,
+                 default_left=None, children=None, is_leaf=None):
+        """
+        Args:
+            decision: ``'<='`` (sklearn) or ``'<'`` (XGBoost) split comparison
+            aggregation: ``'mean'`` of the trees in float64 (random forests) or
+                ``'sum'`` starting at ``base_score`` in the leaf dtype (boosting)
+            default_left: Per-node direction for NaN inputs; when ``None``
+                non-finite inputs are rejected
+            children, is_leaf: Precomputed lookup tables (see ``tree_artifact``),
+                derived from ``left``/``right`` when omitted
+        """
+        if decision not in ('<=', '<'):
+            raise ValueError(f"decision must be '<=' or '<', got {decision!r}")
+        if aggregation not in ('mean', 'sum'):
+            raise ValueError(f"aggregation must be 'mean' or 'sum', got {aggregation!r}")
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.classes_ = classes
+        self.decision = decision
+        self.aggregation = aggregation
+        self.base_score = float(base_score)
+        self.default_left = default_left
+
+        # Derived lookup tables: children packed as [right, left] so the
+        # comparison result indexes straight into them, and a leaf mask
+        if children is None:
+            children = np.stack([right, left], axis=1).ravel().astype(np.int32)
+        if is_leaf is None:
+            is_leaf = left == np.arange(len(left))
+        self._children = children
+        self._is_leaf = is_leaf
+
+    @property
+    def is_classifier(self):
+        return self.classes_ is not None
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """Return the global leaf index reached in every tree, shape (n_trees, n_samples)"""
+        X = self._validate(X)
+        n_samples, n_features = X.shape
+        flat_X = X.ravel()
+
+        # One work item per (tree, sample); items drop out as they reach a leaf
+        nodes = np.repeat(self.roots.astype(np.int32), n_samples)
+        offsets = np.tile(np.arange(n_samples, dtype=np.intp) * n_features, len(self.roots))
+        positions = np.arange(nodes.size)
+        leaves = nodes.copy()
+
+        for _ in range(self.max_depth):
+            values = flat_X[offsets + self.feature[nodes]]
+            if self.decision == '<=':
+                go_left = values <= self.threshold[nodes]
+            else:
+                go_left = values < self.threshold[nodes]
+            if self.default_left is not None:
+                go_left |= np.isnan(values) & self.default_left[nodes]
+            nodes = self._children[2 * nodes + go_left]
+            done = self._is_leaf[nodes]
+            if done.any():
+                leaves[positions[done]] = nodes[done]
+                active = ~done
+                nodes, offsets, positions = nodes[active], offsets[active], positions[active]
+                if nodes.size == 0:
+                    break
+        return leaves.reshape(len(self.roots), n_samples)
+
+    def predict_proba(self, X):
+        """Mean of the per-tree class probabilities, as ``RandomForestClassifier.predict_proba``"""
+        if not self.is_classifier:
+            raise AttributeError('predict_proba is only available for classifiers')
+        return self._aggregate(self.apply(X))
+
+    def predict(self, X):
+        """Predicted class labels or regression values"""
+        leaves = self.apply(X)
+        if self.is_classifier:
+            return self.classes_.take(np.argmax(self._aggregate(leaves), axis=1), axis=0)
+        return self._aggregate(leaves)
+
+    def save(self, path):
+        """Write the arrays to a ``.npz`` file"""
+        arrays = {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'leaf_values': self.leaf_values,
+            'roots': self.roots,
+            'meta': np.array([self.max_depth, self.n_features_in_]),
+            'decision': np.array(self.decision),
+            'aggregation': np.array(self.aggregation),
+            'base_score': np.array(self.base_score),
+        }
+        if self.is_classifier:
+            arrays['classes'] = self.classes_
+        if self.default_left is not None:
+            arrays['default_left'] = self.default_left
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load arrays written by ``save``"""
+        with np.load(path, allow_pickle=False) as data:
+            max_depth, n_features = data['meta']
+            return cls(
+                feature=data['feature'],
+                threshold=data['threshold'],
+                left=data['left'],
+                right=data['right'],
+                leaf_values=data['leaf_values'],
+                roots=data['roots'],
+                max_depth=max_depth,
+                n_features=n_features,
+                classes=data['classes'] if 'classes' in data.files else None,
+                decision=str(data['decision']) if 'decision' in data.files else '<=',
+                aggregation=str(data['aggregation']) if 'aggregation' in data.files else 'mean',
+                base_score=float(data['base_score']) if 'base_score' in data.files else 0.0,
+                default_left=data['default_left'] if 'default_left' in data.files else None,
+            )
+
+    def _aggregate(self, leaves):
+        # Sum tree by tree (not np.sum) to keep sklearn's / XGBoost's floating point order
+        shape = (leaves.shape[1],) + self.leaf_values.shape[1:]
+        if self.aggregation == 'sum':
+            total = np.full(shape, self.base_score, dtype=self.leaf_values.dtype)
+        else:
+            total = np.zeros(shape, dtype=np.float64)
+        for tree_leaves in leaves:
+            total += self.leaf_values[tree_leaves]
+        if self.aggregation == 'mean':
+            total /= self.n_estimators
+        return total
+
+    def _validate(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f'X has {X.shape[-1]} features, but the forest expects {self.n_features_in_}')
+        if self.default_left is None and not np.isfinite(X).all():
+            raise ValueError('Input contains NaN or infinity')
+        return X
+
+
+def compile_forest(model):
+    """Flatten a fitted sklearn random forest into a ``CompiledForest``"""
+    estimators = getattr(model, 'estimators_', None)
+    if not estimators:
+        raise ValueError('Model is not a fitted tree ensemble')
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError('Only single-output forests are supported')
+
+    classes = getattr(model, 'classes_', None)
+    normalize = classes is not None and _counts_in_leaves()
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        # Leaves loop back to themselves so a fixed number of steps is always safe
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+        if classes is not None:
+            value = tree.value[:, 0, :len(classes)].astype(np.float64)
+            if normalize:
+                normalizer = value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+        else:
+            value = tree.value[:, 0, 0].astype(np.float64)
+        values.append(value)
+
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+        threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+        left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+        right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+        leaf_values=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.asarray(roots, dtype=np.intp),
+        max_depth=max_depth,
+        n_features=model.n_features_in_,
+        classes=_plain_classes(classes),
+    )
+
+
+def compile_xgboost(model):
+    """Flatten a single-output XGBoost ``gbtree`` regressor into a ``CompiledForest``
+
+    Accepts an ``xgboost.Booster``, an ``XGBRegressor`` or a ``ProductionBooster``.
+    """
+    if hasattr(model, 'get_booster'):
+        booster = model.get_booster()
+    else:
+        booster = getattr(model, 'booster', model)
+    learner = json.loads(booster.save_raw('json'))['learner']
+    params = learner['learner_model_param']
+    gbm = learner['gradient_booster']
+    if gbm['name'] != 'gbtree' or int(params.get('num_class', 0)) > 1 or int(params.get('num_target', 1)) != 1:
+        raise ValueError('Only single-output gbtree models are supported')
+    if not learner['objective']['name'].startswith('reg:squared'):
+        raise ValueError(f"Unsupported objective {learner['objective']['name']!r}")
+    # Newer XGBoost writes the intercept as a one-element list, e.g. "[1.16E3]"
+    base_score = json.loads(params['base_score'])
+    base_score = np.float32(base_score[0] if isinstance(base_score, list) else base_score)
+
+    features, thresholds, lefts, rights, values, defaults, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in gbm['model']['trees']:
+        if any(tree.get('split_type', [])):
+            raise ValueError('Categorical splits are not supported')
+        left = np.asarray(tree['left_children'], dtype=np.intp)
+        right = np.asarray(tree['right_children'], dtype=np.intp)
+        condition = np.asarray(tree['split_conditions'], dtype=np.float32)
+        node_ids = np.arange(len(left))
+        is_leaf = left == -1
+
+        features.append(np.where(is_leaf, 0, tree['split_indices']))
+        # Leaf nodes keep their output in ``split_conditions``
+        thresholds.append(np.where(is_leaf, np.float32(np.inf), condition))
+        lefts.append(np.where(is_leaf, node_ids, left) + offset)
+        rights.append(np.where(is_leaf, node_ids, right) + offset)
+        values.append(np.where(is_leaf, condition, np.float32(0.0)))
+        defaults.append(np.asarray(tree['default_left'], dtype=bool))
+
+        roots.append(offset)
+        offset += len(left)
+        max_depth = max(max_depth, _tree_depth(left, right))
+
+    return CompiledForest(
+        feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+        threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float32),
+        left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+        right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+        leaf_values=np.ascontiguousarray(np.concatenate(values), dtype=np.float32),
+        roots=np.asarray(roots, dtype=np.intp),
+        max_depth=max_depth,
+        n_features=booster.num_features(),
+        decision='<',
+        aggregation='sum',
+        base_score=base_score,
+        default_left=np.concatenate(defaults),
+    )
+
+
+def _tree_depth(left, right):
+    """Depth of a tree given its child arrays (-1 for leaves)"""
+    depth = 0
+    level = np.array([0])
+    while True:
+        level = level[left[level] != -1]
+        if level.size == 0:
+            return depth
+        level = np.concatenate([left[level], right[level]])
+        depth += 1
+
+
+def _plain_classes(classes):
+    """Class labels as a non-object array so they can be saved without pickle"""
+    if classes is None:
+        return None
+    classes = np.asarray(classes)
+    return classes.astype(str) if classes.dtype == object else classes
+
+
+def _counts_in_leaves():
+    """sklearn < 1.4 stores class counts in ``tree_.value`` and normalizes at predict time"""
+    import sklearn
+    major, minor = (int(part) for part in sklearn.__version__.split('.')[:2])
+    return (major, minor) < (1, 4)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python forest_compiler.py <model.pkl> <output.npz>')
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as f:
+        forest = compile_forest(pickle.load(f))
+    forest.save(sys.argv[2])
+    print(f'Compiled {forest.n_estimators} trees ({len(forest.feature)} nodes, '
+          f'depth {forest.max_depth}) to {sys.argv[2]}')
@@ -0,0 +1,328 @@
+"""
+Hyperparameter search with successive halving, scored on accuracy and latency.
+
+Every model was trained with hard-coded defaults (``n_estimators=100``, a
+default ``XGBRegressor()``), so nobody knew what accuracy a smaller, faster
+model gives up. This harness searches tree count, depth and (for the
+XGBoost production model) learning rate per model family:
+
+* ``--trials`` configurations are drawn from the family's search space;
+* successive halving: every survivor is trained on a budget of training
+  rows, scored, and the best ``1/eta`` move on to ``eta`` times the rows,
+  until the last rung trains on all of them. The rungs of one family run in
+  parallel in a process pool, one single-threaded trial per worker;
+* each trial is scored on the holdout metric (accuracy, or R² and RMSE)
+  and on single-row p50/p99 latency of the path the app serves it with
+  (the compiled forest for crop, the native booster for XGBoost). Trials
+  within ``--max-p99-ms`` rank first, by metric; the rest rank by latency.
+
+The winner is refitted on all training rows, timed again on an idle
+process, and written through ``model_store`` as a new version (with its
+parameters, metric and latency in the manifest), ready for the serving path.
+
+Usage:
+    python hyperparameter_search.py [crop,price,...] [--trials 27] [--eta 3] [--max-p99-ms 2]
+"""
+
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import model_store
+from incremental_training import BOOSTED, INCREMENTAL_FAMILIES, production_xgb_matrix
+from model import (DEFAULT_CHUNK_ROWS, FAMILIES, consumed_rows_artifact, holdout_mask, load_datasets, measured,
+                   prepare, project_dir, row_hashes, score)
+
+FOREST_SPACE = {
+    'n_estimators': [10, 25, 50, 100, 200],
+    'max_depth': [None, 8, 12, 16, 24],
+    'min_samples_leaf': [1, 2, 4],
+}
+BOOSTED_SPACE = {
+    'n_estimators': [50, 100, 200, 400],
+    'max_depth': [3, 4, 6, 8],
+    'learning_rate': [0.03, 0.1, 0.3],
+}
+
+DEFAULT_TRIALS = 27
+DEFAULT_ETA = 3
+
+# Smallest training budget of the first rung
+MIN_BUDGET_ROWS = 500
+
+# Single-row predictions timed per trial (after a short warm-up)
+LATENCY_SAMPLES = 200
+LATENCY_WARMUP = 10
+
+# Data of the family being searched, set once per pool worker
+_data = None
+
+
+def search_space(family):
+    return BOOSTED_SPACE if family in BOOSTED else FOREST_SPACE
+
+
+def sample_configs(space, n_trials, seed=0):
+    """``n_trials`` distinct configurations from the grid ``space`` (all of them if it is smaller)"""
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    if n_trials >= len(grid):
+        return grid
+    rng = np.random.default_rng(seed)
+    return [grid[index] for index in rng.choice(len(grid), n_trials, replace=False)]
+
+
+def make_estimator(family, config, n_jobs=1):
+    if family in BOOSTED:
+        from xgboost import XGBRegressor
+        return XGBRegressor(n_jobs=n_jobs, random_state=42, **config)
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    estimator = RandomForestClassifier if FAMILIES[family]['kind'] == 'classifier' else RandomForestRegressor
+    return estimator(n_jobs=n_jobs, random_state=42, **config)
+
+
+def serving_predictor(family, model):
+    """Single-row predict function the app would use for ``model``"""
+    if family in BOOSTED:
+        from xgb_booster import ProductionBooster
+        return ProductionBooster(booster=model.get_booster(), nthread=1).predict
+    if family == 'crop':
+        from forest_compiler import compile_forest
+        return compile_forest(model).predict
+    return model.predict
+
+
+def latency_ms(predict, rows):
+    """(p50, p99) milliseconds of ``predict`` on each row alone"""
+    for row in rows[:LATENCY_WARMUP]:
+        predict(row.reshape(1, -1))
+    timings = np.empty(len(rows))
+    for index, row in enumerate(rows):
+        started = time.perf_counter()
+        predict(row.reshape(1, -1))
+        timings[index] = (time.perf_counter() - started) * 1000.0
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def kind_of(family):
+    return 'regressor' if family in BOOSTED else FAMILIES[family]['kind']
+
+
+def fit_and_score(family, config, X_train, y_train, X_test, y_test, latency_rows, n_jobs=1):
+    """Train one configuration; (model, trial record)"""
+    model = make_estimator(family, config, n_jobs)
+    _, fit_stats = measured(model.fit, X_train, y_train)
+    if hasattr(model, 'n_jobs'):
+        model.set_params(n_jobs=1 if family in BOOSTED else None)
+    metrics = score(kind_of(family), y_test, model.predict(X_test))
+    p50, p99 = latency_ms(serving_predictor(family, model), latency_rows)
+    return model, {'config': config, 'rows': len(X_train), 'metrics': metrics, 'fit_seconds': fit_stats['seconds'],
+                   'p50_ms': round(p50, 4), 'p99_ms': round(p99, 4)}
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def run_trial(config, n_rows):
+    """One trial on the first ``n_rows`` of the (shuffled) training rows, in a pool worker"""
+    data = _data
+    rows = data['order'][:n_rows]
+    _, record = fit_and_score(data['family'], config, data['X_train'][rows], data['y_train'][rows],
+                              data['X_test'], data['y_test'], data['latency_rows'])
+    return record
+
+
+def rank_key(record, max_p99_ms):
+    """Sort key: trials within the latency budget first, by metric, then the rest by p99"""
+    metric = record['metrics'].get('accuracy', record['metrics'].get('r2'))
+    if max_p99_ms is None or record['p99_ms'] <= max_p99_ms:
+        return (0, -metric, record['p99_ms'])
+    return (1, record['p99_ms'], -metric)
+
+
+def budgets(n_train, n_configs, eta):
+    """Training rows per rung: eta times more each rung, the last one all of them"""
+    n_rungs = max(1, int(math.floor(math.log(max(n_configs, 1), eta))) + 1)
+    return [max(min(MIN_BUDGET_ROWS, n_train), int(n_train / eta ** (n_rungs - 1 - rung))) for rung in range(n_rungs)]
+
+
+def successive_halving(family, data, configs, eta=DEFAULT_ETA, max_p99_ms=None, workers=None):
+    """Run the rungs for one family; (every trial record, ranked records of the last rung)"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(configs)))
+    trials = []
+    survivors = configs
+    rung_budgets = budgets(len(data['order']), len(configs), eta)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+        for rung, n_rows in enumerate(rung_budgets):
+            records = list(pool.map(run_trial, survivors, [n_rows] * len(survivors)))
+            for record in records:
+                record['rung'] = rung
+            trials.extend(records)
+            ranked = sorted(records, key=lambda record: rank_key(record, max_p99_ms))
+            best = ranked[0]
+            print(f"  rung {rung}: {len(survivors)} configs on {n_rows} rows, best {_describe(best)}")
+            if rung == len(rung_budgets) - 1:
+                return trials, ranked
+            survivors = [record['config'] for record in ranked[:max(1, len(ranked) // eta)]]
+    return trials, []
+
+
+def pareto_front(records):
+    """Records no other record beats on both metric and p99 latency"""
+    def metric(record):
+        return record['metrics'].get('accuracy', record['metrics'].get('r2'))
+    return [record for record in records
+            if not any(metric(other) >= metric(record) and other['p99_ms'] <= record['p99_ms']
+                       and (metric(other) > metric(record) or other['p99_ms'] < record['p99_ms'])
+                       for other in records)]
+
+
+def _describe(record):
+    metrics = ', '.join(f'{key} {value:.4f}' for key, value in record['metrics'].items())
+    config = ', '.join(f'{key}={value}' for key, value in record['config'].items())
+    return f"{config}: {metrics}, p50 {record['p50_ms']:.3f} ms, p99 {record['p99_ms']:.3f} ms"
+
+
+def print_trials(records, max_p99_ms):
+    """Table of ``records``, fastest first; ``*`` marks the Pareto front of each training budget"""
+    front = {id(record) for rows in {record['rows'] for record in records}
+             for record in pareto_front([record for record in records if record['rows'] == rows])}
+    header = ('config', 'rows', 'metric', 'p50 ms', 'p99 ms', 'fit s', 'pareto', 'within budget')
+    rows = []
+    for record in sorted(records, key=lambda record: (-record['rows'], record['p99_ms'])):
+        metric = record['metrics'].get('accuracy', record['metrics'].get('r2'))
+        rows.append((', '.join(f'{key}={value}' for key, value in record['config'].items()), record['rows'],
+                     f'{metric:.4f}', f"{record['p50_ms']:.3f}", f"{record['p99_ms']:.3f}",
+                     f"{record['fit_seconds']:.2f}", '*' if id(record) in front else '',
+                     'yes' if max_p99_ms is None or record['p99_ms'] <= max_p99_ms else 'no'))
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    for row in [header, tuple('-' * width for width in widths)] + rows:
+        print('  ' + '  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def family_data(family, frame, seed=0):
+    """Train/holdout split (by row hash, as model.py) of one family, plus what the store needs"""
+    hashes = row_hashes(family, frame)
+    holdout = holdout_mask(hashes)
+    if family in BOOSTED:
+        X, y = production_xgb_matrix(frame)
+        encoders = {}
+    else:
+        X, y, encoders = prepare(family, frame)
+    train_index = np.flatnonzero(~holdout)
+    return {
+        'family': family,
+        'X_train': X[train_index], 'y_train': y[train_index],
+        'X_test': X[holdout], 'y_test': y[holdout],
+        'latency_rows': X[holdout][:LATENCY_SAMPLES],
+        # Rungs take a prefix of one shuffled order, so each budget holds the previous one's rows
+        'order': np.random.default_rng(seed).permutation(len(train_index)),
+        'encoders': encoders,
+        'hashes': hashes,
+    }
+
+
+def search(families, data_dir=project_dir, output=None, trials=DEFAULT_TRIALS, eta=DEFAULT_ETA, max_p99_ms=None,
+           workers=None, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS, promote=True):
+    """Search every family and save the winners as one version; returns its name (or ``None``)"""
+    frames = load_datasets(families, data_dir, chunk_rows)
+    base = model_store.current_version(output)
+    manifest = model_store.read_manifest(base, output) if base else {}
+    artifacts, records = {}, {}
+
+    for family, frame in frames.items():
+        configs = sample_configs(search_space(family), trials, seed)
+        print(f"\n=== {family}: {len(configs)} configs, eta {eta}"
+              f"{f', p99 <= {max_p99_ms} ms' if max_p99_ms is not None else ''} ===")
+        data = family_data(family, frame, seed)
+        started = time.perf_counter()
+        all_trials, ranked = successive_halving(family, data, configs, eta, max_p99_ms, workers)
+        search_seconds = time.perf_counter() - started
+        # Each configuration at the furthest rung it reached
+        furthest = {tuple(record['config'].items()): record for record in all_trials}
+        print_trials(list(furthest.values()), max_p99_ms)
+
+        best = ranked[0]
+        if max_p99_ms is not None and best['p99_ms'] > max_p99_ms:
+            print(f"  No configuration meets p99 <= {max_p99_ms} ms; {family} keeps its current model")
+            continue
+        # Refit the winner alone, so its latency is not measured next to other trials
+        model, final = fit_and_score(family, best['config'], data['X_train'], data['y_train'], data['X_test'],
+                                     data['y_test'], data['latency_rows'], n_jobs=os.cpu_count() or 1)
+        print(f"  winner: {_describe(final)} ({len(all_trials)} trials in {search_seconds:.1f} s)")
+
+        artifact = BOOSTED.get(family) or FAMILIES[family]['artifact']
+        artifacts[artifact] = model.get_booster() if family in BOOSTED else model
+        artifacts.update(data['encoders'])
+        artifacts[consumed_rows_artifact(family)] = np.unique(data['hashes'])
+        metrics = dict(final['metrics'], train_rows=len(data['X_train']), test_rows=len(data['X_test']))
+        record = dict(manifest.get('models', {}).get(family, {}), artifact=artifact, kind=kind_of(family),
+                      params=dict(best['config'], random_state=42), metrics=metrics,
+                      full_fit={'seconds': final['fit_seconds'], 'rows': len(data['X_train']),
+                                'n_jobs': os.cpu_count() or 1},
+                      search={'trials': len(all_trials), 'configs': len(configs), 'eta': eta,
+                              'max_p99_ms': max_p99_ms, 'p50_ms': final['p50_ms'], 'p99_ms': final['p99_ms'],
+                              'seconds': round(search_seconds, 1)})
+        record.pop('incremental', None)
+        if family in BOOSTED:
+            record.update(features=model.get_booster().feature_names, target='Yield_kg_per_ha')
+        else:
+            record.update(features=FAMILIES[family]['features'], target=FAMILIES[family]['target'],
+                          n_estimators=len(model.estimators_))
+        records[family] = record
+
+    if not artifacts:
+        print("\nNothing to save")
+        return None
+    encoders = {column: name for family in records if family in FAMILIES
+                for column, name in FAMILIES[family]['encoded'].items()}
+    feature_info = dict(manifest.get('feature_info', {}))
+    for name, key in (('label_encoder_crop', 'crop_labels'), ('label_encoder_state', 'state_labels')):
+        if name in artifacts:
+            feature_info[key] = artifacts[name].classes_.tolist()
+    version = model_store.write_version(artifacts, {
+        'base': base,
+        'models': {**manifest.get('models', {}), **records},
+        'encoders': {**manifest.get('encoders', {}), **encoders},
+        'feature_info': feature_info,
+        'data': manifest.get('data', {}),
+    }, output, promote, base)
+    print(f"\nSaved version {version} to {output or model_store.model_dir()}{' (promoted)' if promote else ''}")
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Successive-halving hyperparameter search with latency scoring')
+    parser.add_argument('families', nargs='?', default=','.join(INCREMENTAL_FAMILIES),
+                        help=f"comma-separated model families ({', '.join(INCREMENTAL_FAMILIES)})")
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help='configurations per family')
+    parser.add_argument('--eta', type=int, default=DEFAULT_ETA, help='keep 1/eta of the trials per rung')
+    parser.add_argument('--max-p99-ms', type=float, default=None, help='single-row p99 latency budget')
+    parser.add_argument('--workers', type=int, default=None, help='trial processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.getenv('TRAINING_DATA_DIR', project_dir))
+    parser.add_argument('--output', default=None, help='model store directory (TRAINED_MODEL_DIR)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--no-promote', action='store_true', help='save the version without making it current')
+    args = parser.parse_args(argv)
+
+    families = [name.strip() for name in args.families.split(',') if name.strip()]
+    unknown = [name for name in families if name not in INCREMENTAL_FAMILIES]
+    if unknown:
+        parser.error(f"unknown model families: {', '.join(unknown)}")
+    if args.eta < 2:
+        parser.error('--eta must be at least 2')
+    version = search(families, args.data_dir, args.output, args.trials, args.eta, args.max_p99_ms, args.workers,
+                     args.seed, args.chunk_rows, not args.no_promote)
+    return 0 if version else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Perceptual-hash cache of pest image analyses.
+
+Farmers often upload the same leaf photo again, or a recompressed or
+slightly resized copy of it, and every upload cost a full decode plus a slow
+Gemini vision call. ``PerceptualCache`` keys analyses by a 64-bit perceptual
+hash of the image instead of its bytes, so near-identical photos hit too:
+
+* ``dhash`` compares neighbouring pixels of a 9x8 grayscale thumbnail;
+  ``phash`` takes the sign of the low-frequency DCT coefficients of a 32x32
+  one against their median. Both survive JPEG recompression and resizing.
+  JPEGs are decoded in draft mode at 1/8 scale, so hashing a photo costs
+  about a third of decoding it;
+* a lookup is the XOR of the query against every live hash at once (a
+  NumPy array indexed by slot) and a byte-table popcount; the closest entry
+  within ``max_distance`` bits for the same location and model version is a
+  hit, so a retrained classifier never serves its predecessor's answers;
+* entries are an LRU bounded by count with a TTL, and can be persisted to
+  SQLite (``PEST_CACHE_PATH``) so they survive restarts.
+
+Counters, including the analysis time saved by hits, are served at
+``/metrics/pest_cache``.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from image_preprocessing import open_image
+
+logger = logging.getLogger(__name__)
+
+# Bits set in every byte value, for popcounts of XORed hashes
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+# Recent hash + lookup latencies kept for the percentiles
+LATENCY_WINDOW = 1024
+
+# Signed 64-bit range SQLite integers use
+_SIGN_BIT = 1 << 63
+
+
+def _thumbnail(data, size):
+    """Grayscale ``size`` thumbnail of an image, decoded in JPEG draft mode when possible"""
+    image = open_image(data)
+    if image.format == 'JPEG':
+        image.draft('L', (size[0] * 4, size[1] * 4))
+    return image.convert('L').resize(size, Image.Resampling.BOX)
+
+
+def dhash(data):
+    """64-bit difference hash: is each pixel of a 9x8 thumbnail brighter than its left neighbour"""
+    pixels = np.asarray(_thumbnail(data, (9, 8)), dtype=np.int16)
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def phash(data):
+    """64-bit DCT hash: low 8x8 frequencies of a 32x32 thumbnail against their median"""
+    pixels = np.asarray(_thumbnail(data, (32, 32)), dtype=np.float64)
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8]
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+HASHES = {'dhash': dhash, 'phash': phash}
+
+
+def hamming_distances(query, hashes):
+    """Bits differing between the int ``query`` and each entry of a uint64 array"""
+    differing = np.bitwise_xor(hashes, np.uint64(query))
+    return _POPCOUNT[differing.view(np.uint8)].reshape(len(hashes), 8).sum(axis=1, dtype=np.int64)
+
+
+class _Entry:
+    __slots__ = ('slot', 'image_hash', 'location', 'version', 'result', 'compute_ms', 'expires_at')
+
+    def __init__(self, slot, image_hash, location, version, result, compute_ms, expires_at):
+        self.slot = slot
+        self.image_hash = image_hash
+        self.location = location
+        self.version = version
+        self.result = result
+        self.compute_ms = compute_ms
+        self.expires_at = expires_at
+
+
+class PerceptualCache:
+    """LRU + TTL cache of image analyses, matched by perceptual hash within a Hamming distance"""
+
+    def __init__(self, capacity=None, max_distance=None, ttl_seconds=None, path=None, method=None,
+                 enabled=None):
+        """
+        Args:
+            capacity: Entries kept (``PEST_CACHE_SIZE``, 1024)
+            max_distance: Most differing hash bits that still count as the
+                same photo (``PEST_CACHE_DISTANCE``, 6 of 64)
+            ttl_seconds: Entry lifetime (``PEST_CACHE_TTL``, one week)
+            path: SQLite file to persist entries in (``PEST_CACHE_PATH``;
+                empty keeps them in memory only)
+            method: ``'dhash'`` or ``'phash'`` (``PEST_CACHE_METHOD``)
+            enabled: ``PEST_CACHE``; when off every lookup misses
+        """
+        if capacity is None:
+            capacity = int(os.getenv('PEST_CACHE_SIZE', '1024'))
+        if max_distance is None:
+            max_distance = int(os.getenv('PEST_CACHE_DISTANCE', '6'))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('PEST_CACHE_TTL', str(7 * 86400)))
+        if path is None:
+            path = os.getenv('PEST_CACHE_PATH', '')
+        if method is None:
+            method = os.getenv('PEST_CACHE_METHOD', 'dhash').lower()
+        if enabled is None:
+            enabled = os.getenv('PEST_CACHE', '1').lower() not in ('0', 'false', 'no')
+        if method not in HASHES:
+            raise ValueError(f"Unknown PEST_CACHE_METHOD {method!r}; choose from {', '.join(HASHES)}")
+
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.ttl = ttl_seconds
+        self.method = method
+        self.enabled = enabled and capacity > 0
+        self._hash = HASHES[method]
+
+        self._entries = OrderedDict()             # (hash, location, version) -> _Entry, LRU first
+        self._hashes = np.zeros(max(capacity, 1), dtype=np.uint64)
+        self._slot_keys = [None] * max(capacity, 1)  # slot -> key of the entry in it
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._lookup_ms = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'hits': 0, 'near_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                          'expirations': 0, 'unhashable': 0, 'saved_ms': 0.0}
+
+        self._db = None
+        if path and self.enabled:
+            self._open_db(path)
+
+    def lookup(self, data, location, version=''):
+        """(hash, cached result or ``None``) for an uploaded image
+
+        ``version`` names the models behind the analysis; only entries stored
+        under the same version match. The hash is ``None`` when the image
+        cannot be decoded; pass it to ``put`` after computing a result on a miss.
+        """
+        if not self.enabled:
+            return None, None
+        started = time.perf_counter()
+        try:
+            image_hash = self._hash(data)
+        except (OSError, ValueError, SyntaxError, UnidentifiedImageError, Image.DecompressionBombError):
+            with self._lock:
+                self._counters['unhashable'] += 1
+            return None, None
+
+        now = time.time()
+        with self._lock:
+            entry, distance = self._nearest(image_hash, location, version, now)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            self._lookup_ms.append(elapsed_ms)
+            if entry is None:
+                self._counters['misses'] += 1
+                return image_hash, None
+            self._entries.move_to_end((entry.image_hash, entry.location, entry.version))
+            self._counters['hits'] += 1
+            if distance:
+                self._counters['near_hits'] += 1
+            self._counters['saved_ms'] += max(0.0, entry.compute_ms - elapsed_ms)
+            return image_hash, entry.result
+
+    def put(self, image_hash, location, result, compute_seconds, version=''):
+        """Store ``result``, which took ``compute_seconds`` to produce, for ``image_hash``"""
+        if not self.enabled or image_hash is None:
+            return
+        key = (image_hash, location, version)
+        entry = _Entry(None, image_hash, location, version, result, compute_seconds * 1000.0,
+                       time.time() + self.ttl)
+        with self._lock:
+            self._insert(key, entry)
+            self._counters['stores'] += 1
+        self._db_write(entry)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            if self._db is not None:
+                try:
+                    self._db.execute('DELETE FROM analyses')
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Pest cache clear failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = list(self._lookup_ms)
+            entries = len(self._entries)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'enabled': self.enabled,
+            'method': self.method,
+            'entries': entries,
+            'capacity': self.capacity,
+            'max_distance': self.max_distance,
+            'ttl_seconds': self.ttl,
+            'persistent': self._db is not None,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None,
+            **counters,
+            'saved_ms': round(counters['saved_ms'], 1),
+            'saved_ms_per_hit': round(counters['saved_ms'] / counters['hits'], 1) if counters['hits'] else None,
+            'lookup_p50_ms': round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+            'lookup_p99_ms': round(float(np.percentile(latencies, 99)), 3) if latencies else None,
+        }
+
+    def _nearest(self, image_hash, location, version, now):
+        """(closest live entry for ``location`` and ``version`` within ``max_distance``, distance) (lock held)"""
+        entry = self._entries.get((image_hash, location, version))
+        if entry is not None and entry.expires_at >= now:
+            return entry, 0
+        if not self._entries:
+            return None, None
+        distances = hamming_distances(image_hash, self._hashes)
+        candidates = np.flatnonzero(distances <= self.max_distance)
+        for slot in candidates[np.argsort(distances[candidates], kind='stable')]:
+            distance = int(distances[slot])
+            key = self._slot_keys[slot]
+            if key is None or key[1] != location or key[2] != version:
+                continue
+            entry = self._entries[key]
+            if entry.expires_at < now:
+                self._remove(key)
+                self._counters['expirations'] += 1
+                continue
+            return entry, distance
+        return None, None
+
+    def _insert(self, key, entry):
+        """Add ``entry``, evicting the least recently used one when full (lock held)"""
+        if key in self._entries:
+            self._remove(key, forget=False)
+        while not self._free:
+            self._remove(next(iter(self._entries)))
+            self._counters['evictions'] += 1
+        entry.slot = self._free.pop()
+        self._entries[key] = entry
+        self._hashes[entry.slot] = np.uint64(entry.image_hash)
+        self._slot_keys[entry.slot] = key
+
+    def _remove(self, key, forget=True):
+        """Drop one entry and free its slot; ``forget`` deletes it on disk too (lock held)"""
+        entry = self._entries.pop(key)
+        self._slot_keys[entry.slot] = None
+        self._hashes[entry.slot] = 0
+        self._free.append(entry.slot)
+        if forget and self._db is not None:
+            try:
+                self._db.execute('DELETE FROM analyses WHERE image_hash = ? AND location = ? AND version = ? '
+                                 'AND method = ?', (self._signed(key[0]), key[1], key[2], self.method))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Pest cache delete failed: {e}")
+
+    @staticmethod
+    def _signed(image_hash):
+        return image_hash - (1 << 64) if image_hash >= _SIGN_BIT else image_hash
+
+    def _open_db(self, path):
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS analyses ('
+                             'image_hash INTEGER NOT NULL, location TEXT NOT NULL, version TEXT NOT NULL, '
+                             'method TEXT NOT NULL, result TEXT NOT NULL, compute_ms REAL NOT NULL, '
+                             'expires_at REAL NOT NULL, PRIMARY KEY (image_hash, location, version, method))')
+            self._db.commit()
+            rows = self._db.execute(
+                'SELECT image_hash, location, version, result, compute_ms, expires_at FROM analyses '
+                'WHERE method = ? AND expires_at >= ? ORDER BY rowid DESC LIMIT ?',
+                (self.method, time.time(), self.capacity)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Pest cache {path} unavailable, keeping it in memory only: {e}")
+            self._db = None
+            return
+        with self._lock:
+            for image_hash, location, version, result, compute_ms, expires_at in reversed(rows):
+                image_hash %= 1 << 64
+                self._insert((image_hash, location, version),
+                             _Entry(None, image_hash, location, version, json.loads(result), compute_ms, expires_at))
+        logger.info(f"Pest cache: {len(rows)} analyses loaded from {path}")
+
+    def _db_write(self, entry):
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 (self._signed(entry.image_hash), entry.location, entry.version, self.method,
+                                  json.dumps(entry.result), entry.compute_ms, entry.expires_at))
+                self._db.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Pest cache write failed: {e}")
@@ -0,0 +1,221 @@
+"""
+Smaller image payloads for Gemini vision calls.
+
+``analyze_pest_with_ai_image`` used to base64-encode the raw upload, often a
+multi-megabyte phone JPEG or PNG, and send it to Gemini as a string: a third
+more bytes than the file, and the full-resolution pixels the model scales
+down anyway. ``ImagePayloadOptimizer`` prepares the image first:
+
+* decodes it (JPEGs in draft mode, straight to a reduced scale), downsizes
+  it so the longer edge is at most ``max_edge`` pixels and applies the EXIF
+  orientation;
+* re-encodes it as JPEG or WebP at ``quality``, lowering the quality step by
+  step while the result is over ``max_bytes``; EXIF (camera, GPS) is not
+  copied into the new file;
+* hands it to the SDK as a binary part (``{'mime_type', 'data'}``), not a
+  base64 string.
+
+``send`` times every Gemini round trip and logs bytes saved per request. To
+measure the round-trip difference, ``baseline_rate`` of the requests send
+the original file (still as a binary part) instead; ``stats`` compares the
+round-trip percentiles of both groups (``/metrics/gemini_images``).
+"""
+
+import io
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from image_preprocessing import ImageDecodeError
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+
+# MIME types of originals sent for the baseline measurement
+_ORIGINAL_MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp',
+                        'GIF': 'image/gif', 'BMP': 'image/bmp', 'TIFF': 'image/tiff'}
+
+# Quality lost per step while the encoded image is over ``max_bytes``, and the floor
+QUALITY_STEP = 10
+MIN_QUALITY = 40
+
+# Recent round trips and encode times kept for the percentiles
+LATENCY_WINDOW = 512
+
+
+class ImagePayload:
+    """An image ready to send to Gemini"""
+
+    __slots__ = ('data', 'mime_type', 'size', 'original_bytes', 'encode_ms')
+
+    def __init__(self, data, mime_type, size, original_bytes, encode_ms):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size                      # (width, height) sent
+        self.original_bytes = original_bytes  # size of the upload
+        self.encode_ms = encode_ms
+
+    def part(self):
+        """Inline binary content part for ``GenerativeModel.generate_content``"""
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+
+class ImagePayloadOptimizer:
+    """Downscale + re-encode uploads before Gemini vision calls, and measure what it saves"""
+
+    def __init__(self, max_edge=None, image_format=None, quality=None, max_bytes=None, baseline_rate=None):
+        """
+        Args:
+            max_edge: Longest side sent, in pixels (``GEMINI_IMAGE_MAX_EDGE``, 1024)
+            image_format: ``'jpeg'`` or ``'webp'`` (``GEMINI_IMAGE_FORMAT``)
+            quality: Encoder quality (``GEMINI_IMAGE_QUALITY``, 85)
+            max_bytes: Lower the quality until the image fits, down to
+                ``MIN_QUALITY`` (``GEMINI_IMAGE_MAX_BYTES``, 0 = no limit)
+            baseline_rate: Fraction of requests that send the original
+                upload, to measure the round-trip difference
+                (``GEMINI_IMAGE_BASELINE_RATE``, 0)
+        """
+        if max_edge is None:
+            max_edge = int(os.getenv('GEMINI_IMAGE_MAX_EDGE', '1024'))
+        if image_format is None:
+            image_format = os.getenv('GEMINI_IMAGE_FORMAT', 'jpeg')
+        if quality is None:
+            quality = int(os.getenv('GEMINI_IMAGE_QUALITY', '85'))
+        if max_bytes is None:
+            max_bytes = int(os.getenv('GEMINI_IMAGE_MAX_BYTES', '0'))
+        if baseline_rate is None:
+            baseline_rate = float(os.getenv('GEMINI_IMAGE_BASELINE_RATE', '0'))
+        image_format = image_format.lower()
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown GEMINI_IMAGE_FORMAT {image_format!r}; choose from {', '.join(FORMATS)}")
+
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.baseline_rate = baseline_rate
+
+        self._lock = threading.Lock()
+        self._round_trips = {'optimized': deque(maxlen=LATENCY_WINDOW), 'baseline': deque(maxlen=LATENCY_WINDOW)}
+        self._encode_ms = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'requests': 0, 'optimized': 0, 'baseline': 0, 'failures': 0,
+                          'original_bytes': 0, 'sent_bytes': 0, 'base64_bytes_avoided': 0}
+
+    def optimize(self, data):
+        """``ImagePayload`` for uploaded image bytes
+
+        Raises ``ImageDecodeError`` when ``data`` is not a readable image.
+        """
+        started = time.perf_counter()
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.format == 'JPEG':
+                image.draft('RGB', (self.max_edge, self.max_edge))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            # Rotate after shrinking: the bounding box is square, and a small image is cheaper to turn
+            image = ImageOps.exif_transpose(image)
+        except UnidentifiedImageError:
+            raise ImageDecodeError('Not a recognized image format') from None
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+            raise ImageDecodeError(f'Unreadable image: {e}') from None
+
+        pil_format, mime_type = FORMATS[self.image_format]
+        quality = self.quality
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, quality=quality)
+            if not self.max_bytes or buffer.tell() <= self.max_bytes or quality - QUALITY_STEP < MIN_QUALITY:
+                break
+            quality -= QUALITY_STEP
+        encode_ms = (time.perf_counter() - started) * 1000.0
+        return ImagePayload(buffer.getvalue(), mime_type, image.size, len(data), encode_ms)
+
+    def original(self, data):
+        """``ImagePayload`` of the upload as is, for baseline requests"""
+        try:
+            image_format = Image.open(io.BytesIO(data)).format
+        except (OSError, ValueError, SyntaxError, UnidentifiedImageError, Image.DecompressionBombError):
+            raise ImageDecodeError('Not a recognized image format') from None
+        mime_type = _ORIGINAL_MIME_TYPES.get(image_format, 'application/octet-stream')
+        return ImagePayload(data, mime_type, None, len(data), 0.0)
+
+    def send(self, data, request):
+        """Run ``request(part)`` with ``data`` as an optimized (or baseline) image part
+
+        Logs the bytes saved and the round trip, and returns what ``request``
+        returns.
+        """
+        baseline = self.baseline_rate > 0 and random.random() < self.baseline_rate
+        try:
+            payload = self.original(data) if baseline else self.optimize(data)
+        except ImageDecodeError:
+            with self._lock:
+                self._counters['failures'] += 1
+            raise
+        group = 'baseline' if baseline else 'optimized'
+
+        started = time.perf_counter()
+        response = request(payload.part())
+        round_trip_ms = (time.perf_counter() - started) * 1000.0
+
+        base64_bytes = -(-payload.original_bytes // 3) * 4
+        with self._lock:
+            self._counters['requests'] += 1
+            self._counters[group] += 1
+            self._counters['original_bytes'] += payload.original_bytes
+            self._counters['sent_bytes'] += len(payload.data)
+            self._counters['base64_bytes_avoided'] += base64_bytes - len(payload.data)
+            self._round_trips[group].append(round_trip_ms)
+            if not baseline:
+                self._encode_ms.append(payload.encode_ms)
+            reference = self._percentile(self._round_trips['optimized' if baseline else 'baseline'], 50)
+
+        difference = f', {round_trip_ms - reference:+.0f} ms vs {"optimized" if baseline else "baseline"} p50' \
+            if reference is not None else ''
+        logger.info(f"Gemini image ({group}): {payload.original_bytes / 1024:.0f} KB upload, "
+                    f"{len(payload.data) / 1024:.0f} KB sent ({base64_bytes / 1024:.0f} KB as base64 before), "
+                    f"encode {payload.encode_ms:.0f} ms, round trip {round_trip_ms:.0f} ms{difference}")
+        return response
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            optimized = list(self._round_trips['optimized'])
+            baseline = list(self._round_trips['baseline'])
+            encode = list(self._encode_ms)
+        optimized_p50 = self._percentile(optimized, 50)
+        baseline_p50 = self._percentile(baseline, 50)
+        return {
+            'max_edge': self.max_edge,
+            'format': self.image_format,
+            'quality': self.quality,
+            'baseline_rate': self.baseline_rate,
+            **counters,
+            'bytes_saved': counters['original_bytes'] - counters['sent_bytes'],
+            'encode_p50_ms': self._rounded(self._percentile(encode, 50)),
+            'round_trip_ms': {
+                'optimized_p50': self._rounded(optimized_p50),
+                'optimized_p99': self._rounded(self._percentile(optimized, 99)),
+                'baseline_p50': self._rounded(baseline_p50),
+                'baseline_p99': self._rounded(self._percentile(baseline, 99)),
+                'p50_difference': self._rounded(optimized_p50 - baseline_p50)
+                if optimized_p50 is not None and baseline_p50 is not None else None,
+            },
+        }
+
+    @staticmethod
+    def _percentile(values, q):
+        return float(np.percentile(values, q)) if values else None
+
+    @staticmethod
+    def _rounded(value):
+        return round(value, 1) if value is not None else None
@@ -0,0 +1,209 @@
+"""
+Fast decode-and-resize of leaf photo uploads into model input arrays.
+
+``PestDetectionModel.preprocess_image`` decoded every upload at full size,
+resized it with LANCZOS and divided by 255.0 into a fresh float64 array.
+A 12 MP phone JPEG costs far more to decode and filter than the
+classifier costs to run. ``ImagePreprocessor`` does less work per image:
+
+* JPEGs are opened in draft mode (``Image.draft``), so libjpeg decodes
+  straight to 1/2, 1/4 or 1/8 scale in the DCT domain, never building the
+  full-resolution bitmap;
+* the remaining reduction is a cheap box ``reduce`` down to about twice the
+  target size (``reducing_gap``), then one bilinear resize to the target;
+* pixels are written into one preallocated (N, height, width, 3) buffer,
+  uint8 by default (what ``extract_features`` takes) or float32 in [0, 1];
+* a batch is decoded on a thread pool; Pillow releases the GIL while
+  decoding and resizing, so uploads are processed in parallel.
+
+Every image is timed per stage (decode, resize, normalize). Batches report
+their own totals and the preprocessor keeps percentiles, served at
+``/metrics/images``.
+"""
+
+import base64
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+STAGES = ('decode', 'resize', 'normalize')
+
+# Recent per-image stage timings kept for the percentiles
+LATENCY_WINDOW = 1024
+
+# Box-reduce until the image is at most this many times the target size, then filter
+REDUCING_GAP = 2.0
+
+
+class ImageDecodeError(ValueError):
+    """The upload is not an image we can read"""
+
+
+class PreprocessedBatch:
+    """Model input for a batch of uploads"""
+
+    __slots__ = ('images', 'errors', 'timings')
+
+    def __init__(self, images, errors, timings):
+        self.images = images    # (N, height, width, 3) buffer; rows of failed uploads are zero
+        self.errors = errors    # per upload: None, or why it could not be read
+        self.timings = timings  # stage -> total milliseconds over the batch
+
+    @property
+    def ok(self):
+        """Boolean mask of the uploads that were read"""
+        return np.array([error is None for error in self.errors], dtype=bool)
+
+
+def open_image(data):
+    """Lazy PIL image from bytes, a ``data:image`` URL, a path or a PIL image"""
+    if isinstance(data, Image.Image):
+        return data
+    if isinstance(data, str) and data.startswith('data:image'):
+        data = base64.b64decode(data.split(',', 1)[1])
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = io.BytesIO(data)
+    return Image.open(data)
+
+
+class ImagePreprocessor:
+    """Draft-mode decode, reduce + bilinear resize into a preallocated buffer, on a thread pool"""
+
+    def __init__(self, size, dtype=np.uint8, max_workers=None):
+        """
+        Args:
+            size: Output edge in pixels, or (width, height); images are
+                resized to exactly that, ignoring their aspect ratio
+            dtype: ``np.uint8`` (0-255) or ``np.float32`` (0-1) output
+            max_workers: Decode threads for batches (``IMAGE_WORKERS``, default 4)
+        """
+        if np.dtype(dtype) not in (np.dtype(np.uint8), np.dtype(np.float32)):
+            raise ValueError(f'dtype must be uint8 or float32, got {np.dtype(dtype)}')
+        if max_workers is None:
+            max_workers = int(os.getenv('IMAGE_WORKERS', '4'))
+        self.width, self.height = (size, size) if isinstance(size, int) else size
+        self.dtype = np.dtype(dtype)
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-preprocess')
+        self._lock = threading.Lock()
+        self._timings = {stage: deque(maxlen=LATENCY_WINDOW) for stage in STAGES}
+        self._counters = {'images': 0, 'errors': 0, 'draft_decodes': 0}
+
+    def empty(self, n_images):
+        """Output buffer for ``n_images`` images"""
+        return np.zeros((n_images, self.height, self.width, 3), dtype=self.dtype)
+
+    def preprocess(self, data, out=None):
+        """One upload -> (height, width, 3) array (written into ``out`` when given)
+
+        Raises ``ImageDecodeError`` when ``data`` is not a readable image.
+        """
+        if out is None:
+            out = self.empty(1)[0]
+        try:
+            timings = self._preprocess_into(data, out)
+        except ImageDecodeError:
+            self._record([], errors=1)
+            raise
+        self._record([timings], errors=0)
+        return out
+
+    def preprocess_batch(self, items, out=None):
+        """Preprocess many uploads in parallel into one (N, height, width, 3) buffer
+
+        Unreadable uploads do not fail the batch: their row stays zero and
+        ``errors`` says why.
+        """
+        out = self.empty(len(items)) if out is None else out
+        if len(out) < len(items):
+            raise ValueError(f'Output buffer holds {len(out)} images, got {len(items)}')
+
+        def work(index):
+            try:
+                return self._preprocess_into(items[index], out[index]), None
+            except ImageDecodeError as e:
+                out[index] = 0  # the buffer may be reused
+                return None, str(e)
+
+        if len(items) > 1 and self.max_workers > 1:
+            results = list(self._pool.map(work, range(len(items))))
+        else:
+            results = [work(index) for index in range(len(items))]
+
+        errors = [error for _, error in results]
+        per_image = [timings for timings, _ in results if timings is not None]
+        self._record(per_image, errors=sum(error is not None for error in errors))
+        totals = {stage: round(sum(timings[stage] for timings in per_image), 3) for stage in STAGES}
+        return PreprocessedBatch(out[:len(items)], errors, totals)
+
+    def stats(self):
+        """Counters and per-image p50/p99 milliseconds per stage"""
+        with self._lock:
+            windows = {stage: list(window) for stage, window in self._timings.items()}
+            counters = dict(self._counters)
+        return {
+            'size': [self.width, self.height],
+            'dtype': self.dtype.name,
+            'workers': self.max_workers,
+            **counters,
+            'stages_ms': {
+                stage: {
+                    'p50': round(float(np.percentile(values, 50)), 3) if values else None,
+                    'p99': round(float(np.percentile(values, 99)), 3) if values else None,
+                }
+                for stage, values in windows.items()
+            },
+        }
+
+    def _preprocess_into(self, data, out):
+        """Decode, resize and normalize ``data`` into ``out``; stage milliseconds"""
+        started = time.perf_counter()
+        try:
+            image = open_image(data)
+            drafted = False
+            if image.format == 'JPEG':
+                # Let libjpeg scale down while decoding; draft keeps the image >= the requested size
+                requested = (int(self.width * REDUCING_GAP), int(self.height * REDUCING_GAP))
+                drafted = image.draft('RGB', requested) is not None
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.load()
+        except UnidentifiedImageError:
+            raise ImageDecodeError('Not a recognized image format') from None
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+            raise ImageDecodeError(f'Unreadable image: {e}') from None
+        decoded = time.perf_counter()
+
+        if image.size != (self.width, self.height):
+            image = image.resize((self.width, self.height), Image.Resampling.BILINEAR, reducing_gap=REDUCING_GAP)
+        resized = time.perf_counter()
+
+        pixels = np.asarray(image)
+        if self.dtype == np.uint8:
+            out[...] = pixels
+        else:
+            np.multiply(pixels, np.float32(1.0 / 255.0), out=out, casting='unsafe')
+        finished = time.perf_counter()
+
+        if drafted:
+            with self._lock:
+                self._counters['draft_decodes'] += 1
+        return {
+            'decode': (decoded - started) * 1000.0,
+            'resize': (resized - decoded) * 1000.0,
+            'normalize': (finished - resized) * 1000.0,
+        }
+
+    def _record(self, per_image, errors):
+        with self._lock:
+            self._counters['images'] += len(per_image) + errors
+            self._counters['errors'] += errors
+            for timings in per_image:
+                for stage in STAGES:
+                    self._timings[stage].append(timings[stage])
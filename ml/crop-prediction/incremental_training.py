@@ -0,0 +1,277 @@
+"""
+Incremental retraining from newly arrived rows (``python model.py --incremental``).
+
+A full ``model.py`` run refits every forest on every row, even when a week
+brought only a few thousand new records. Each trained version records the
+hashes of the rows its models saw (``consumed_rows_<dataset>``); an
+incremental run reads the CSVs, hashes every row and trains only on the
+rows that are new:
+
+* forests (crop, fertilizer, price, production) keep their trees and grow
+  new ones on the new rows with ``warm_start``, in proportion to how much
+  data arrived (at least ``MIN_NEW_TREES``);
+* the notebook's XGBoost production model continues boosting from the
+  current booster for ``--boost-rounds`` rounds. The first run has no row
+  record for it and only records the file as the baseline the notebook
+  trained on.
+
+Rows are held out by hash (``model.holdout_mask``), so the holdout is the
+same in every run and never trained on. A candidate is promoted only when
+its holdout score is no worse than the incumbent's by more than
+``PROMOTION_TOLERANCE``; a rejected family keeps its model and its row
+record, so the rows are tried again next time. Cases warm starting cannot
+handle fall back to asking for a full retrain: the new rows bring a category
+the encoders do not know, or classifier rows miss some of the classes.
+
+Wall time is compared with a full retrain: estimated from the last full fit
+(scaled by rows), or measured with ``--compare-full``.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+import model_store
+from model import (DEFAULT_CHUNK_ROWS, FAMILIES, StageLog, consumed_rows_artifact, holdout_mask,
+                   load_datasets, measured, prepare, project_dir, row_hashes, score, train_family)
+
+# Fewest trees a warm start adds, however few rows arrived
+MIN_NEW_TREES = 5
+
+# Largest drop in holdout R² / accuracy a candidate may show and still be promoted
+PROMOTION_TOLERANCE = 0.005
+
+DEFAULT_BOOST_ROUNDS = 20
+
+# Boosted model family -> store artifact (dataset of the same name)
+BOOSTED = {'production_xgb': 'production_model_xgb'}
+
+INCREMENTAL_FAMILIES = list(FAMILIES) + list(BOOSTED)
+
+PROMOTED = 'promoted'
+REJECTED = 'rejected'
+UP_TO_DATE = 'up to date'
+BASELINE = 'baseline recorded'
+FULL_RETRAIN = 'needs full retrain'
+
+
+def split_new_rows(name, frame, directory=None):
+    """(row hashes, mask of rows the current version has not seen or ``None`` without a record)"""
+    hashes = row_hashes(name, frame)
+    try:
+        consumed = model_store.load_versioned(consumed_rows_artifact(name), directory=directory)
+    except FileNotFoundError:
+        return hashes, None
+    if not len(consumed):
+        return hashes, np.ones(len(hashes), dtype=bool)
+    # ``consumed`` is sorted: one binary search per row
+    positions = np.minimum(np.searchsorted(consumed, hashes), len(consumed) - 1)
+    return hashes, consumed[positions] != hashes
+
+
+def acceptable(incumbent, candidate):
+    """True when the candidate's holdout score is within ``PROMOTION_TOLERANCE`` of the incumbent's"""
+    key = 'accuracy' if 'accuracy' in incumbent else 'r2'
+    return candidate[key] >= incumbent[key] - PROMOTION_TOLERANCE
+
+
+def update_forest(family, frame, hashes, is_new, record, directory=None, n_jobs=1):
+    """Grow the current forest of ``family`` on its new rows; a result dict (``model`` when trained)"""
+    spec = FAMILIES[family]
+    result = {'family': family, 'new_rows': int(is_new.sum())}
+    encoders = {name: model_store.load_versioned(name, directory=directory) for name in spec['encoded'].values()}
+    X, y, _ = prepare(family, frame, encoders)
+    holdout = holdout_mask(hashes)
+    new_train = is_new & ~holdout
+    result['new_train_rows'] = int(new_train.sum())
+    if not new_train.any():
+        return dict(result, status=UP_TO_DATE, reason='new rows are all held out' if is_new.any() else None)
+
+    unknown = [column for index, column in enumerate(spec['features'])
+               if column in spec['encoded'] and (X[is_new, index] < 0).any()]
+    if unknown:
+        return dict(result, status=FULL_RETRAIN, reason=f"new {', '.join(unknown)} values")
+
+    model = model_store.load_versioned(spec['artifact'], directory=directory)
+    # warm_start refits classes_ from the new rows alone, so they must cover every class
+    if spec['kind'] == 'classifier' and set(np.unique(y[new_train])) != set(model.classes_):
+        return dict(result, status=FULL_RETRAIN, reason='new rows do not cover every class')
+
+    incumbent = score(spec['kind'], y[holdout], model.predict(X[holdout]))
+    old_trees = len(model.estimators_)
+    old_rows = record['metrics']['train_rows']
+    added = max(MIN_NEW_TREES, int(round(old_trees * new_train.sum() / max(old_rows, 1))))
+    model.set_params(warm_start=True, n_estimators=old_trees + added, n_jobs=n_jobs)
+    _, fit_stats = measured(model.fit, X[new_train], y[new_train])
+    model.set_params(warm_start=False, n_jobs=None)
+    candidate = score(spec['kind'], y[holdout], model.predict(X[holdout]))
+    candidate.update(train_rows=old_rows + int(new_train.sum()), test_rows=int(holdout.sum()))
+
+    full_fit = record.get('full_fit')
+    estimate = full_fit['seconds'] * candidate['train_rows'] / full_fit['rows'] if full_fit else None
+    return dict(result, model=model, incumbent=incumbent, candidate=candidate, added=f'{added} trees',
+                seconds=fit_stats['seconds'], full_estimate_seconds=estimate, X=X, y=y, holdout=holdout,
+                status=PROMOTED if acceptable(incumbent, candidate) else REJECTED)
+
+
+def production_xgb_matrix(frame):
+    """(float32 matrix, target) of the production_xgb dataset, through the notebook's preprocessor"""
+    from production_pipeline import FusedProductionPipeline
+
+    pipeline = FusedProductionPipeline.from_files(None)
+    X = pipeline.transform({column: frame[column].to_numpy(dtype=object) if column in pipeline.categorical_columns
+                            else frame[column].to_numpy(dtype=np.float64) for column in pipeline.columns},
+                           n_rows=len(frame))
+    return X, frame['Yield_kg_per_ha'].to_numpy(dtype=np.float64)
+
+
+def update_booster(frame, hashes, is_new, directory=None, rounds=DEFAULT_BOOST_ROUNDS, nthread=None):
+    """Continue boosting the current production booster on its new rows; a result dict"""
+    import xgboost as xgb
+    from xgb_booster import ProductionBooster
+
+    if is_new is None:
+        # The notebook trained on this file; everything in it counts as seen
+        return {'family': 'production_xgb', 'status': BASELINE, 'new_rows': 0, 'new_train_rows': 0,
+                'reason': f"{len(hashes)} rows recorded as the notebook model's data"}
+
+    result = {'family': 'production_xgb', 'new_rows': int(is_new.sum())}
+
+    try:
+        booster = model_store.load_versioned(BOOSTED['production_xgb'], directory=directory)
+    except FileNotFoundError:
+        booster = ProductionBooster(binary_cache=False).booster
+    X, y = production_xgb_matrix(frame)
+    holdout = holdout_mask(hashes)
+    new_train = is_new & ~holdout
+    result['new_train_rows'] = int(new_train.sum())
+    if not new_train.any():
+        return dict(result, status=UP_TO_DATE, reason='new rows are all held out' if is_new.any() else None)
+
+    incumbent = score('regressor', y[holdout], booster.inplace_predict(X[holdout]))
+    # Train with the booster's own hyperparameters (learning rate, depth...)
+    config = json.loads(booster.save_config())['learner']
+    params = {key: value for key, value in config['gradient_booster'].get('tree_train_param', {}).items()
+              if key in ('eta', 'max_depth', 'min_child_weight', 'subsample', 'colsample_bytree', 'lambda', 'alpha')}
+    params['objective'] = config['objective']['name']
+    if nthread:
+        params['nthread'] = nthread
+    dtrain = xgb.DMatrix(X[new_train], y[new_train], feature_names=booster.feature_names)
+    candidate_booster, fit_stats = measured(xgb.train, params, dtrain, num_boost_round=rounds, xgb_model=booster)
+    candidate = score('regressor', y[holdout], candidate_booster.inplace_predict(X[holdout]))
+    candidate.update(test_rows=int(holdout.sum()))
+    return dict(result, model=candidate_booster, incumbent=incumbent, candidate=candidate,
+                added=f'{rounds} rounds', seconds=fit_stats['seconds'], full_estimate_seconds=None,
+                X=X, y=y, holdout=holdout, status=PROMOTED if acceptable(incumbent, candidate) else REJECTED)
+
+
+def full_retrain_seconds(family, result, n_jobs):
+    """Wall time of a from-scratch fit on every training row, for comparison"""
+    X, y, holdout = result['X'], result['y'], result['holdout']
+    if family in FAMILIES:
+        _, _, stats = train_family(family, X, y, holdout, n_jobs=n_jobs)
+        return stats['fit']['seconds']
+    from xgboost import XGBRegressor
+    _, stats = measured(XGBRegressor(n_jobs=n_jobs).fit, X[~holdout], y[~holdout])
+    return stats['seconds']
+
+
+def run_incremental(families, data_dir=project_dir, output=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                    rounds=DEFAULT_BOOST_ROUNDS, compare_full=False, promote=True):
+    """Train ``families`` on their new rows; returns the new version name (or ``None``)"""
+    log = StageLog()
+    started = time.perf_counter()
+    base = model_store.current_version(output)
+    manifest = model_store.read_manifest(base, output) if base else {}
+    n_jobs = os.cpu_count() or 1
+
+    print("Loading datasets and looking for new rows...")
+    frames = log.measure('load', load_datasets, families, data_dir, chunk_rows, log)
+
+    results = {}
+    for family, frame in frames.items():
+        hashes, is_new = split_new_rows(family, frame, output)
+        if family in BOOSTED:
+            result = log.measure(f'boost {family}', update_booster, frame, hashes, is_new, output, rounds, n_jobs)
+        elif is_new is None or family not in manifest.get('models', {}):
+            result = {'family': family, 'status': FULL_RETRAIN, 'reason': 'no trained version with a row record',
+                      'new_rows': len(frame), 'new_train_rows': None}
+        else:
+            result = log.measure(f'grow {family}', update_forest, family, frame, hashes, is_new,
+                                 manifest['models'][family], output, n_jobs)
+        if compare_full and 'model' in result:
+            result['full_seconds'] = log.measure(f'full fit {family}', full_retrain_seconds, family, result, n_jobs)
+        result['hashes'] = hashes
+        results[family] = result
+
+    artifacts, records = {}, {}
+    for family, result in results.items():
+        if result['status'] == BASELINE:
+            artifacts[consumed_rows_artifact(family)] = np.unique(result['hashes'])
+        if result['status'] != PROMOTED:
+            continue
+        artifacts[consumed_rows_artifact(family)] = np.unique(result['hashes'])
+        if family in BOOSTED:
+            artifacts[BOOSTED[family]] = result['model']
+            records[family] = dict(manifest.get('models', {}).get(family, {}), artifact=BOOSTED[family],
+                                   features=result['model'].feature_names, target='Yield_kg_per_ha', kind='regressor',
+                                   metrics=result['candidate'], num_boosted_rounds=result['model'].num_boosted_rounds())
+        else:
+            artifacts[FAMILIES[family]['artifact']] = result['model']
+            records[family] = dict(manifest['models'][family], metrics=result['candidate'],
+                                   n_estimators=len(result['model'].estimators_))
+        records[family]['incremental'] = {key: result.get(key) for key in
+                                          ('new_rows', 'new_train_rows', 'added', 'seconds', 'incumbent')}
+        records[family]['incremental']['base'] = base
+
+    print(f"\n=== INCREMENTAL TRAINING (base {base or 'none'}) ===")
+    report(results)
+
+    version = None
+    if artifacts:
+        version = log.measure('save', model_store.write_version, artifacts, {
+            'base': base,
+            'models': {**manifest.get('models', {}), **records},
+            'encoders': manifest.get('encoders', {}),
+            'feature_info': manifest.get('feature_info', {}),
+            'data': manifest.get('data', {}),
+            'timings': log.stages,
+        }, output, promote, base)
+        print(f"Saved version {version} to {output or model_store.model_dir()}{' (promoted)' if promote else ''}")
+    else:
+        print("Nothing promoted; the current version stays")
+
+    print(f"\n=== STAGES ({time.perf_counter() - started:.1f} s total) ===")
+    log.report()
+    return version
+
+
+def report(results):
+    rows = []
+    saved_total = full_total = 0.0
+    for family, result in results.items():
+        key = 'accuracy' if 'accuracy' in result.get('incumbent', {}) else 'r2'
+        full = result.get('full_seconds', result.get('full_estimate_seconds'))
+        seconds = result.get('seconds')
+        if full is not None and seconds is not None:
+            saved_total += full - seconds
+            full_total += full
+        rows.append((
+            family,
+            result['new_rows'],
+            result.get('added', '-'),
+            f"{key} {result['incumbent'][key]:.4f}" if 'incumbent' in result else '-',
+            f"{key} {result['candidate'][key]:.4f}" if 'candidate' in result else '-',
+            f'{seconds:.2f}' if seconds is not None else '-',
+            (f'{full:.2f}' + ('' if 'full_seconds' in result else ' (est.)')) if full is not None else '-',
+            result['status'] + (f" ({result['reason']})" if result.get('reason') else ''),
+        ))
+    header = ('model', 'new rows', 'added', 'incumbent', 'candidate', 'fit s', 'full retrain s', 'status')
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    for row in [header, tuple('-' * width for width in widths)] + rows:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+    if full_total:
+        print(f"Wall clock saved against full retrains: {saved_total:.1f} s of {full_total:.1f} s "
+              f"({saved_total / full_total:.0%})")
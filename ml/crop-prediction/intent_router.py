@@ -0,0 +1,121 @@
+"""
+Keyword intent routing for the chatbot.
+
+The chat code used to lowercase the message and run ``any(word in
+message_lower ...)`` chains over overlapping keyword lists three times per
+turn: to decide whether to run the local crop model, to pick a fallback
+answer and to pick follow-up suggestions. ``IntentRouter`` expands every
+keyword with its plural and verb endings ("crops", "growing") into one hash
+table at startup; a message is split into words once and each word is a
+single dict lookup. The chat code then reads the one ``Intents`` result for
+all three decisions.
+
+Keywords match whole words, so "hi" no longer fires on "this" and "rain" no
+longer on "grain". The top intent is the one with most keyword hits, ties
+going to the intent listed first.
+
+The router also keeps per-intent turn latencies (``record``), served at
+``/metrics/intents``.
+"""
+
+import re
+import threading
+from collections import deque
+
+import numpy as np
+
+# Endings a keyword may carry and still count
+KEYWORD_ENDINGS = ('', 's', 'es', 'ing', 'ed')
+
+_WORD = re.compile(r'[a-z]+')
+
+# The chatbot's intents and keywords; earlier intents win ties
+CHAT_INTENTS = {
+    'crop': ['crop', 'recommendation', 'plant', 'grow', 'seed'],
+    'fertilizer': ['fertilizer', 'nutrient', 'npk', 'manure'],
+    'price': ['price', 'market', 'sell', 'buy', 'cost'],
+    'production': ['production', 'yield', 'harvest', 'output'],
+    'weather': ['weather', 'soil', 'rain', 'temperature'],
+    'general': ['farm', 'farming', 'agriculture', 'help', 'advice'],
+    'greeting': ['hello', 'hi', 'hey', 'namaste', 'good'],
+}
+
+# Recent turn latencies kept per intent for the percentiles
+LATENCY_WINDOW = 1024
+
+
+class Intents:
+    """Keyword hits per intent for one message"""
+
+    __slots__ = ('scores', 'top')
+
+    def __init__(self, scores, top):
+        self.scores = scores  # intent -> number of keyword hits (only intents with hits)
+        self.top = top        # best intent, or None when nothing matched
+
+    def __contains__(self, intent):
+        return intent in self.scores
+
+    def __repr__(self):
+        return f'Intents(top={self.top!r}, scores={self.scores!r})'
+
+
+class IntentRouter:
+    """One-pass hashed keyword scorer over an ordered ``{intent: [keywords]}`` mapping"""
+
+    def __init__(self, intents):
+        """
+        Args:
+            intents: Ordered mapping of intent -> keywords; earlier intents win ties.
+                A keyword may belong to several intents.
+        """
+        self.intents = list(intents)
+        self._priority = {intent: index for index, intent in enumerate(self.intents)}
+        # Word -> intents it counts for, every keyword ending spelled out
+        self._word_intents = {}
+        for intent, keywords in intents.items():
+            for keyword in keywords:
+                for ending in KEYWORD_ENDINGS:
+                    word_intents = self._word_intents.setdefault(keyword.lower() + ending, [])
+                    if intent not in word_intents:
+                        word_intents.append(intent)
+
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._counts = {}
+
+    def classify(self, message):
+        """Score every intent in one pass over ``message``"""
+        scores = {}
+        for word in _WORD.findall(message.lower()):
+            word_intents = self._word_intents.get(word)
+            if word_intents:
+                for intent in word_intents:
+                    scores[intent] = scores.get(intent, 0) + 1
+        top = min(scores, key=lambda intent: (-scores[intent], self._priority[intent])) if scores else None
+        return Intents(scores, top)
+
+    def record(self, intent, seconds):
+        """Add the latency of a turn routed to ``intent`` (``None`` = no intent)"""
+        intent = intent or 'none'
+        with self._lock:
+            window = self._latencies.get(intent)
+            if window is None:
+                window = self._latencies[intent] = deque(maxlen=LATENCY_WINDOW)
+            window.append(seconds * 1000.0)
+            self._counts[intent] = self._counts.get(intent, 0) + 1
+
+    def stats(self):
+        """Turns and latency percentiles (ms) per intent"""
+        with self._lock:
+            windows = {intent: list(window) for intent, window in self._latencies.items()}
+            counts = dict(self._counts)
+        return {
+            intent: {
+                'turns': counts[intent],
+                'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            }
+            for intent, latencies in windows.items()
+        }
+
@@ -0,0 +1,297 @@
+"""
+CPU-only leaf disease classifier for ``PestDetectionModel``.
+
+``PestDetectionModel.predict`` never looked at the image: TensorFlow is not
+installed, so it returned a randomly chosen disease. This module classifies
+leaf photos into the 38 PlantVillage classes with NumPy only:
+
+* ``extract_features`` turns a batch of small RGB images into fixed-length
+  vectors: a joint hue/saturation histogram and a brightness histogram
+  (lesions, yellowing and mildew are colour changes), per-channel colour
+  moments, a 4x4-cell histogram of oriented gradients (HOG) for spot and
+  vein shapes, and local-contrast texture histograms. Every histogram over
+  the whole batch is one ``np.bincount``, so a batch costs no per-image
+  Python work (about 2-3 ms per 128x128 image on one core);
+* ``LeafClassifier`` is a standardized multinomial logistic regression over
+  those features, stored as a small ``.npz`` (one weight matrix, ~30 KB).
+  Inference is one matmul and a softmax for the whole batch.
+
+Training uses scikit-learn and a folder per class, the layout of the
+PlantVillage dataset:
+
+    python leaf_classifier.py train <dataset_dir> [--output models/pest_classifier.npz]
+
+Serving needs only NumPy and Pillow. See ``benchmark.py pest`` for latency.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from image_preprocessing import ImagePreprocessor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CLASSIFIER_PATH = os.path.join(HERE, 'models', 'pest_classifier.npz')
+
+# Images are reduced to FEATURE_SIZE x FEATURE_SIZE before feature extraction
+FEATURE_SIZE = 128
+
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 12, 3, 8
+HOG_CELLS, HOG_ORIENTATIONS = 4, 9
+GRADIENT_BINS = 8
+
+FEATURE_NAMES = (
+    [f'hue_sat_{h}_{s}' for h in range(HUE_BINS) for s in range(SATURATION_BINS)]
+    + [f'value_{v}' for v in range(VALUE_BINS)]
+    + [f'{stat}_{channel}' for stat in ('mean', 'std') for channel in 'rgb']
+    + [f'hog_{cy}_{cx}_{o}' for cy in range(HOG_CELLS) for cx in range(HOG_CELLS)
+       for o in range(HOG_ORIENTATIONS)]
+    + [f'brighter_neighbours_{n}' for n in range(9)]
+    + [f'gradient_{g}' for g in range(GRADIENT_BINS)]
+)
+N_FEATURES = len(FEATURE_NAMES)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _batch_histogram(indices, n_bins, weights=None):
+    """Per-image histograms of (N, pixels) bin indices as one bincount -> (N, n_bins)"""
+    n_images = indices.shape[0]
+    offsets = (np.arange(n_images, dtype=np.intp) * n_bins)[:, None]
+    counts = np.bincount((indices + offsets).ravel(), weights=None if weights is None else weights.ravel(),
+                         minlength=n_images * n_bins)
+    return counts.reshape(n_images, n_bins).astype(np.float32)
+
+
+def _normalize_rows(histograms):
+    totals = histograms.sum(axis=1, keepdims=True)
+    return histograms / np.maximum(totals, 1e-12)
+
+
+def _hsv(rgb):
+    """Hue in [0, 1), saturation and value of float RGB arrays in [0, 1]"""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    # Pairwise maximum/minimum: reductions over a length-3 last axis are several times slower
+    value = np.maximum(np.maximum(r, g), b)
+    chroma = value - np.minimum(np.minimum(r, g), b)
+    saturation = chroma / np.maximum(value, 1e-6)
+    inverse = 1.0 / np.maximum(chroma, 1e-6)
+    hue = np.where(value == r, (g - b) * inverse,
+                   np.where(value == g, (b - r) * inverse + 2.0, (r - g) * inverse + 4.0))
+    hue *= 1.0 / 6.0
+    hue %= 1.0
+    hue[chroma == 0] = 0.0
+    return hue, saturation, value
+
+
+def extract_features(images):
+    """Feature matrix (N, ``N_FEATURES``) float32 for a batch of RGB images
+
+    ``images`` is (N, H, W, 3), either uint8 or float in [0, 1]; H and W must
+    be multiples of ``HOG_CELLS`` (``FEATURE_SIZE`` is).
+    """
+    images = np.asarray(images)
+    if images.ndim == 3:
+        images = images[None]
+    if images.dtype == np.uint8:
+        rgb = images.astype(np.float32) * np.float32(1.0 / 255.0)
+    else:
+        rgb = images.astype(np.float32, copy=False)
+    n_images, height, width, _ = rgb.shape
+    pixels = height * width
+
+    # Colour: joint hue x saturation, brightness, channel moments
+    hue, saturation, value = _hsv(rgb)
+    hue_index = np.minimum((hue * HUE_BINS).astype(np.int64), HUE_BINS - 1)
+    saturation_index = np.minimum((saturation * SATURATION_BINS).astype(np.int64), SATURATION_BINS - 1)
+    value_index = np.minimum((value * VALUE_BINS).astype(np.int64), VALUE_BINS - 1)
+    hue_saturation = _batch_histogram((hue_index * SATURATION_BINS + saturation_index).reshape(n_images, pixels),
+                                      HUE_BINS * SATURATION_BINS) / pixels
+    brightness = _batch_histogram(value_index.reshape(n_images, pixels), VALUE_BINS) / pixels
+    flat = rgb.reshape(n_images, pixels, 3)
+    average = np.full((1, pixels), 1.0 / pixels, dtype=np.float32)
+    mean = (average @ flat)[:, 0]
+    variance = (average @ (flat * flat))[:, 0] - mean * mean
+    moments = np.concatenate([mean, np.sqrt(np.maximum(variance, 0.0))], axis=1)
+
+    # Shape: histogram of oriented gradients per cell, L2-normalized per cell
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, :, 1:-1] = gray[:, :, 2:] - gray[:, :, :-2]
+    gy[:, 1:-1, :] = gray[:, 2:, :] - gray[:, :-2, :]
+    magnitude = np.sqrt(gx * gx + gy * gy)
+    orientation = np.arctan2(gy, gx) % np.pi
+    orientation_index = np.minimum((orientation * (HOG_ORIENTATIONS / np.pi)).astype(np.int64),
+                                   HOG_ORIENTATIONS - 1)
+    cell_y = (np.arange(height) * HOG_CELLS // height)[:, None]
+    cell_x = (np.arange(width) * HOG_CELLS // width)[None, :]
+    cell_index = (cell_y * HOG_CELLS + cell_x) * HOG_ORIENTATIONS
+    hog = _batch_histogram((cell_index + orientation_index).reshape(n_images, pixels),
+                           HOG_CELLS * HOG_CELLS * HOG_ORIENTATIONS, weights=magnitude)
+    cells = hog.reshape(n_images, HOG_CELLS * HOG_CELLS, HOG_ORIENTATIONS)
+    cells /= np.sqrt(np.square(cells).sum(axis=2, keepdims=True) + 1e-6)
+    hog = cells.reshape(n_images, -1)
+
+    # Texture: how many of the 8 neighbours are brighter (a rotation-invariant LBP count),
+    # and how strong edges are overall
+    centre = gray[:, 1:-1, 1:-1]
+    threshold = centre + 0.02
+    brighter = np.zeros(centre.shape, dtype=np.uint8)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy or dx:
+                brighter += gray[:, 1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx] > threshold
+    neighbours = _normalize_rows(_batch_histogram(brighter.reshape(n_images, -1), 9))
+    gradient_index = np.minimum((np.sqrt(magnitude) * GRADIENT_BINS).astype(np.int64), GRADIENT_BINS - 1)
+    gradients = _batch_histogram(gradient_index.reshape(n_images, pixels), GRADIENT_BINS) / pixels
+
+    return np.concatenate([hue_saturation, brightness, moments, hog, neighbours, gradients],
+                          axis=1).astype(np.float32, copy=False)
+
+
+class LeafClassifier:
+    """Standardized softmax regression over ``extract_features`` vectors"""
+
+    def __init__(self, classes, mean, scale, weights, bias):
+        self.classes = list(classes)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)  # (N_FEATURES, n_classes)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        if self.weights.shape != (N_FEATURES, len(self.classes)):
+            raise ValueError(f'weights must be ({N_FEATURES}, {len(self.classes)}), got {self.weights.shape}')
+        # Fold the standardization into the weights: one matmul per batch
+        self._weights = self.weights / self.scale[:, None]
+        self._bias = self.bias - self.mean / self.scale @ self.weights
+
+    @classmethod
+    def fit(cls, features, labels, classes, C=1.0, max_iter=500):
+        """Train on a feature matrix and integer labels indexing ``classes``"""
+        from sklearn.linear_model import LogisticRegression
+
+        features = np.asarray(features, dtype=np.float64)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale < 1e-6] = 1.0
+        model = LogisticRegression(C=C, max_iter=max_iter)
+        model.fit((features - mean) / scale, labels)
+
+        # Classes missing from the training data get a weight column that never wins
+        weights = np.zeros((features.shape[1], len(classes)), dtype=np.float32)
+        bias = np.full(len(classes), -1e4, dtype=np.float32)
+        coef, intercept = model.coef_, model.intercept_
+        if len(model.classes_) == 2:  # sklearn stores one column for binary problems
+            coef, intercept = np.vstack([-coef, coef]) / 2, np.array([-intercept[0], intercept[0]]) / 2
+        weights[:, model.classes_] = coef.T
+        bias[model.classes_] = intercept
+        return cls(classes, mean, scale, weights, bias)
+
+    def predict_proba(self, features):
+        """Class probabilities (N, n_classes) for a feature matrix"""
+        logits = np.asarray(features, dtype=np.float32) @ self._weights + self._bias
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def predict_images(self, images):
+        """Class probabilities for a batch of (N, H, W, 3) images"""
+        return self.predict_proba(extract_features(images))
+
+    def top_k(self, probabilities, k=3):
+        """Per row, the ``k`` most likely (class name, probability) pairs"""
+        order = np.argsort(-probabilities, axis=1)[:, :k]
+        return [[(self.classes[index], float(row[index])) for index in indices]
+                for row, indices in zip(probabilities, order)]
+
+    def save(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        staging = f'{path}.tmp-{os.getpid()}.npz'
+        np.savez(staging, classes=np.array(self.classes), mean=self.mean, scale=self.scale,
+                 weights=self.weights, bias=self.bias, feature_size=np.int32(FEATURE_SIZE))
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            if int(archive['feature_size']) != FEATURE_SIZE:
+                raise ValueError(f'{path} was trained on {int(archive["feature_size"])} px images, '
+                                 f'this version extracts features at {FEATURE_SIZE} px')
+            return cls(archive['classes'].tolist(), archive['mean'], archive['scale'],
+                       archive['weights'], archive['bias'])
+
+
+def dataset_files(directory, classes):
+    """(paths, labels) for a folder-per-class dataset; unknown folders are skipped"""
+    index = {name: position for position, name in enumerate(classes)}
+    paths, labels = [], []
+    for folder in sorted(os.listdir(directory)):
+        if folder not in index:
+            continue
+        for name in sorted(os.listdir(os.path.join(directory, folder))):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(directory, folder, name))
+                labels.append(index[folder])
+    return paths, np.array(labels, dtype=np.int64)
+
+
+def featurize_files(paths, batch_size=256):
+    """Feature matrix for image files, decoded on a thread pool and extracted in batches
+
+    Unreadable files get all-zero images; their paths are printed.
+    """
+    preprocessor = ImagePreprocessor(FEATURE_SIZE)
+    buffer = preprocessor.empty(batch_size)
+    blocks = []
+    for start in range(0, len(paths), batch_size):
+        batch = preprocessor.preprocess_batch(paths[start:start + batch_size], out=buffer)
+        for path, error in zip(paths[start:start + batch_size], batch.errors):
+            if error:
+                print(f'{path}: {error}')
+        blocks.append(extract_features(batch.images))
+    return np.concatenate(blocks) if blocks else np.zeros((0, N_FEATURES), dtype=np.float32)
+
+
+def train(directory, classes, output=DEFAULT_CLASSIFIER_PATH, holdout=0.2, seed=0):
+    """Train on ``directory``, report holdout accuracy, refit on everything and save"""
+    paths, labels = dataset_files(directory, classes)
+    if not paths:
+        raise ValueError(f'No images in class folders under {directory}')
+    start = time.perf_counter()
+    features = featurize_files(paths)
+    print(f'{len(paths)} images, {N_FEATURES} features in {time.perf_counter() - start:.1f} s')
+
+    order = np.random.default_rng(seed).permutation(len(paths))
+    n_test = int(len(paths) * holdout)
+    if n_test:
+        test, fit = order[:n_test], order[n_test:]
+        classifier = LeafClassifier.fit(features[fit], labels[fit], classes)
+        accuracy = float((classifier.predict_proba(features[test]).argmax(axis=1) == labels[test]).mean())
+        print(f'holdout accuracy {accuracy:.3f} on {n_test} images')
+    classifier = LeafClassifier.fit(features, labels, classes)
+    classifier.save(output)
+    print(f'saved {output}')
+    return classifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the NumPy leaf disease classifier')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='train on a folder-per-class image dataset')
+    train_parser.add_argument('dataset', help='directory with one sub-folder per class name')
+    train_parser.add_argument('--output', default=DEFAULT_CLASSIFIER_PATH)
+    train_parser.add_argument('--holdout', type=float, default=0.2)
+    args = parser.parse_args()
+
+    from pest_detection import CLASS_NAMES
+    train(args.dataset, CLASS_NAMES, args.output, args.holdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+In-process micro-batching for single-row model predictions.
+
+RandomForest and XGBoost spend most of a one-row ``predict`` call in fixed
+per-call overhead (input validation, thread dispatch, tree setup). Under
+concurrent load the batcher collects the rows that arrive within a short
+window, runs them as one matrix prediction and hands each caller its own
+result.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Upper bounds of the histogram buckets; the last bucket is open ended
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _new_histogram():
+    return {str(bound): 0 for bound in HISTOGRAM_BUCKETS} | {'+Inf': 0}
+
+
+def _observe(histogram, value):
+    for bound in HISTOGRAM_BUCKETS:
+        if value <= bound:
+            histogram[str(bound)] += 1
+            return
+    histogram['+Inf'] += 1
+
+
+class _PendingRow:
+    __slots__ = ('row', 'result', 'error', 'done', 'enqueued_at')
+
+    def __init__(self, row):
+        self.row = row
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Collect concurrent single-row requests for one model into matrix predictions"""
+
+    def __init__(self, name, predict_fn, max_batch_size=32, max_wait_ms=2.0):
+        """
+        Args:
+            name: Model name used in metrics
+            predict_fn: Callable taking a 2-D array and returning one prediction per row
+            max_batch_size: Largest number of rows passed to ``predict_fn`` at once
+            max_wait_ms: How long the first row of a batch waits for company
+        """
+        self.name = name
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = _new_histogram()
+        self._queue_depths = _new_histogram()
+        self._requests = 0
+        self._batches = 0
+        self._fallback_batches = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+
+        self._worker = threading.Thread(target=self._run, name=f'micro-batcher-{name}', daemon=True)
+        self._worker.start()
+
+    def predict(self, row):
+        """Predict a single feature row, blocking until its batch has run"""
+        pending = _PendingRow(row)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f'Micro-batcher {self.name} is closed')
+            self._queue.append(pending)
+            depth = len(self._queue)
+            self._condition.notify()
+
+        with self._stats_lock:
+            self._requests += 1
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+            _observe(self._queue_depths, depth)
+
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def close(self):
+        """Stop the worker once the queue has drained"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join(timeout=1.0)
+
+    def stats(self):
+        """Snapshot of queue depth and batch size metrics"""
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'requests': self._requests,
+                'batches': self._batches,
+                'fallback_batches': self._fallback_batches,
+                'mean_batch_size': round(self._requests / self._batches, 2) if self._batches else 0.0,
+                'mean_queue_wait_ms': round(self._total_wait / self._requests * 1000.0, 3) if self._requests else 0.0,
+                'batch_size_histogram': dict(self._batch_sizes),
+                'queue_depth_histogram': dict(self._queue_depths),
+            }
+
+    def _next_batch(self):
+        """Wait for the first row, then gather more until the batch is full or the window closes"""
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            if not self._queue:
+                return None
+
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            started = time.perf_counter()
+            try:
+                results = self.predict_fn(np.array([pending.row for pending in batch]))
+                for pending, result in zip(batch, results):
+                    pending.result = result
+                fallback = False
+            except Exception:
+                # One malformed row must not fail its neighbours: retry row by row
+                fallback = len(batch) > 1
+                for pending in batch:
+                    try:
+                        pending.result = self.predict_fn(np.array([pending.row]))[0]
+                    except Exception as e:
+                        pending.error = e
+
+            with self._stats_lock:
+                self._batches += 1
+                self._fallback_batches += int(fallback)
+                self._total_wait += sum(started - pending.enqueued_at for pending in batch)
+                _observe(self._batch_sizes, len(batch))
+
+            for pending in batch:
+                pending.done.set()
+
+
+class BatcherRegistry:
+    """Per-model micro-batchers sharing one configuration"""
+
+    def __init__(self, max_batch_size=None, max_wait_ms=None, enabled=None):
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv('MICRO_BATCH_MAX_SIZE', '32'))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '2'))
+        if enabled is None:
+            enabled = os.getenv('MICRO_BATCH_ENABLED', '1').lower() not in ('0', 'false', 'no')
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.enabled = enabled
+        self._predict_fns = {}
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, predict_fn):
+        """Register the matrix predict function for a model"""
+        self._predict_fns[name] = predict_fn
+
+    def predict(self, name, row):
+        """Predict one row for ``name``, micro-batched when enabled"""
+        if not self.enabled:
+            return self._predict_fns[name](np.array([row]))[0]
+        batcher = self._batchers.get(name)
+        if batcher is None:
+            with self._lock:
+                batcher = self._batchers.get(name)
+                if batcher is None:
+                    batcher = MicroBatcher(name, self._predict_fns[name],
+                                           self.max_batch_size, self.max_wait_ms)
+                    self._batchers[name] = batcher
+        return batcher.predict(row)
+
+    def stats(self):
+        """Metrics for every batcher started so far"""
+        return {
+            'enabled': self.enabled,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'models': {name: batcher.stats() for name, batcher in self._batchers.items()},
+        }
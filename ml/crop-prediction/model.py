@@ -1,145 +1,473 @@
-import pandas as pd
+"""
+Training pipeline for the crop, fertilizer, price and production models.
+
+The original script read the four CSVs one after another, trained four
+default ``RandomForest*`` models one after another on a single core and
+pickled ten loose files into the working directory. This pipeline does the
+same work in stages:
+
+* load: the CSVs are read concurrently in a thread pool, only the columns a
+  model uses, with explicit dtypes (float32 features, category for text
+  columns) and in chunks of ``--chunk-rows``, so NaN rows are dropped before
+  the chunks are joined and memory stays close to the final frame size;
+* prepare: categoricals become integer codes (sorted categories, the same
+  codes ``LabelEncoder`` gives) and features one float32 matrix, the dtype
+  the forests train on;
+* train: the four model families are fitted in parallel, largest first,
+  in a process pool; cores left over go to each forest's ``n_jobs``;
+* save: models and encoders are written as one version through
+  ``model_store`` (manifest with features, metrics, data and timings).
+
+Every stage reports its wall time and peak resident memory; see
+``python model.py --help`` for the options.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
-from sklearn.model_selection import train_test_split
+import pandas as pd
+from pandas.api.types import union_categoricals
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.metrics import accuracy_score, classification_report, mean_squared_error, r2_score
-import joblib
-import json
-import warnings
-import os
+from sklearn.metrics import accuracy_score, mean_squared_error, r2_score
+from sklearn.preprocessing import LabelEncoder
+
+import model_store
+
 warnings.filterwarnings('ignore')
 
 # Get the absolute path of the project directory
 project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 
-print("Loading and processing all datasets...")
+# Rows per CSV chunk
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Dataset -> CSV file, columns with their dtypes, and whether rows with a missing value are dropped
+DATASETS = {
+    'crop': {
+        'file': 'next_crop_prediction.csv',
+        'dtype': {'N': 'float32', 'P': 'float32', 'K': 'float32', 'temperature': 'float32',
+                  'humidity': 'float32', 'ph': 'float32', 'rainfall': 'float32', 'label': 'category'},
+        'dropna': False,
+    },
+    'fertilizer': {
+        'file': 'fertilizer_and_pesticide_recommend.csv',
+        'dtype': {'Crop': 'category', 'State': 'category', 'Area': 'float32', 'Annual_Rainfall': 'float32',
+                  'Yield': 'float32', 'Fertilizer': 'float64'},
+        'dropna': True,
+    },
+    'price': {
+        'file': 'price_risk_coaching_dataset_50000.csv',
+        'dtype': {'Current_Price': 'float32', 'Storage_Cost_per_Day': 'float32', 'Daily_Loss_%': 'float32',
+                  'Interest_Rate_Monthly_%': 'float32', 'Quantity_Qtl': 'float32',
+                  'Predicted_Price_15D': 'float64'},
+        'dropna': False,
+    },
+    'production': {
+        'file': 'production_estimation.csv',
+        'dtype': {'Area_ha': 'float32', 'N_req_kg_per_ha': 'float32', 'P_req_kg_per_ha': 'float32',
+                  'K_req_kg_per_ha': 'float32', 'Temperature_C': 'float32', 'Humidity_%': 'float32',
+                  'pH': 'float32', 'Rainfall_mm': 'float32', 'Yield_kg_per_ha': 'float64'},
+        'dropna': True,
+    },
+    # The notebook's XGBoost production model; model.py only continues its boosting (--incremental)
+    'production_xgb': {
+        'file': os.path.join('model training', 'data', 'Custom_Crops_yield_Historical_Dataset.csv'),
+        'dtype': {'Dist Code': 'float64', 'Year': 'float64', 'State Code': 'float64', 'Area_ha': 'float64',
+                  'Temperature_C': 'float64', 'Humidity_%': 'float64', 'pH': 'float64', 'Rainfall_mm': 'float64',
+                  'State Name': 'category', 'Dist Name': 'category', 'Crop': 'category',
+                  'Yield_kg_per_ha': 'float64'},
+        'dropna': False,
+    },
+}
 
-# Load all datasets
-crop_recommendation_df = pd.read_csv(os.path.join(project_dir, 'next_crop_prediction.csv'))
-fertilizer_df = pd.read_csv(os.path.join(project_dir, 'fertilizer_and_pesticide_recommend.csv'))
-price_risk_df = pd.read_csv(os.path.join(project_dir, 'price_risk_coaching_dataset_50000.csv'))
-production_df = pd.read_csv(os.path.join(project_dir, 'production_estimation.csv'))
-
-print(f"Crop recommendation dataset: {crop_recommendation_df.shape}")
-print(f"Fertilizer dataset: {fertilizer_df.shape}")
-print(f"Price risk dataset: {price_risk_df.shape}")
-print(f"Production dataset: {production_df.shape}")
-
-# 1. CROP RECOMMENDATION MODEL
-print("\n=== CROP RECOMMENDATION MODEL ===")
-X_crop = crop_recommendation_df[['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']]
-y_crop = crop_recommendation_df['label']
-
-X_train_crop, X_test_crop, y_train_crop, y_test_crop = train_test_split(X_crop, y_crop, test_size=0.2, random_state=42)
-
-crop_model = RandomForestClassifier(n_estimators=100, random_state=42)
-crop_model.fit(X_train_crop, y_train_crop)
-
-y_pred_crop = crop_model.predict(X_test_crop)
-crop_accuracy = accuracy_score(y_test_crop, y_pred_crop)
-print(f"Crop recommendation accuracy: {crop_accuracy:.2f}")
-
-# 2. FERTILIZER RECOMMENDATION MODEL
-print("\n=== FERTILIZER RECOMMENDATION MODEL ===")
-# Prepare fertilizer data
-fertilizer_features = ['Crop', 'State', 'Area', 'Annual_Rainfall', 'Yield']
-fertilizer_target = 'Fertilizer'
-
-# Encode categorical variables
-le_crop = LabelEncoder()
-le_state = LabelEncoder()
-
-fertilizer_df_clean = fertilizer_df.dropna()
-fertilizer_df_clean['Crop_encoded'] = le_crop.fit_transform(fertilizer_df_clean['Crop'])
-fertilizer_df_clean['State_encoded'] = le_state.fit_transform(fertilizer_df_clean['State'])
-
-X_fert = fertilizer_df_clean[['Crop_encoded', 'State_encoded', 'Area', 'Annual_Rainfall', 'Yield']]
-y_fert = fertilizer_df_clean['Fertilizer']
-
-X_train_fert, X_test_fert, y_train_fert, y_test_fert = train_test_split(X_fert, y_fert, test_size=0.2, random_state=42)
-
-fertilizer_model = RandomForestRegressor(n_estimators=100, random_state=42)
-fertilizer_model.fit(X_train_fert, y_train_fert)
-
-y_pred_fert = fertilizer_model.predict(X_test_fert)
-fertilizer_r2 = r2_score(y_test_fert, y_pred_fert)
-print(f"Fertilizer recommendation R² score: {fertilizer_r2:.2f}")
-
-# 3. PRICE PREDICTION MODEL
-print("\n=== PRICE PREDICTION MODEL ===")
-price_features = ['Current_Price', 'Storage_Cost_per_Day', 'Daily_Loss_%', 'Interest_Rate_Monthly_%', 'Quantity_Qtl']
-price_target = 'Predicted_Price_15D'
-
-X_price = price_risk_df[price_features]
-y_price = price_risk_df[price_target]
-
-X_train_price, X_test_price, y_train_price, y_test_price = train_test_split(X_price, y_price, test_size=0.2, random_state=42)
-
-price_model = RandomForestRegressor(n_estimators=100, random_state=42)
-price_model.fit(X_train_price, y_train_price)
-
-y_pred_price = price_model.predict(X_test_price)
-price_r2 = r2_score(y_test_price, y_pred_price)
-print(f"Price prediction R² score: {price_r2:.2f}")
-
-# 4. PRODUCTION ESTIMATION MODEL
-print("\n=== PRODUCTION ESTIMATION MODEL ===")
-prod_features = ['Area_ha', 'N_req_kg_per_ha', 'P_req_kg_per_ha', 'K_req_kg_per_ha', 'Temperature_C', 'Humidity_%', 'pH', 'Rainfall_mm']
-prod_target = 'Yield_kg_per_ha'
-
-production_df_clean = production_df.dropna()
-X_prod = production_df_clean[prod_features]
-y_prod = production_df_clean[prod_target]
-
-X_train_prod, X_test_prod, y_train_prod, y_test_prod = train_test_split(X_prod, y_prod, test_size=0.2, random_state=42)
-
-production_model = RandomForestRegressor(n_estimators=100, random_state=42)
-production_model.fit(X_train_prod, y_train_prod)
-
-y_pred_prod = production_model.predict(X_test_prod)
-prod_r2 = r2_score(y_test_prod, y_pred_prod)
-print(f"Production estimation R² score: {prod_r2:.2f}")
-
-# Save models and encoders
-print("\n=== SAVING MODELS ===")
-import pickle
-with open('crop_recommendation_model.pkl', 'wb') as f:
-    pickle.dump(crop_model, f)
-with open('fertilizer_model.pkl', 'wb') as f:
-    pickle.dump(fertilizer_model, f)
-with open('price_model.pkl', 'wb') as f:
-    pickle.dump(price_model, f)
-with open('production_model.pkl', 'wb') as f:
-    pickle.dump(production_model, f)
-with open('label_encoder_crop.pkl', 'wb') as f:
-    pickle.dump(le_crop, f)
-with open('label_encoder_state.pkl', 'wb') as f:
-    pickle.dump(le_state, f)
-with open('crop_features.pkl', 'wb') as f:
-    pickle.dump(X_crop.columns.tolist(), f)
-with open('fertilizer_features.pkl', 'wb') as f:
-    pickle.dump(fertilizer_features, f)
-with open('price_features.pkl', 'wb') as f:
-    pickle.dump(price_features, f)
-with open('production_features.pkl', 'wb') as f:
-    pickle.dump(prod_features, f)
-
-# Save feature information for API
-feature_info = {
-    'crop_features': ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall'],
-    'fertilizer_features': ['Crop', 'State', 'Area', 'Annual_Rainfall', 'Yield'],
-    'price_features': ['Current_Price', 'Storage_Cost_per_Day', 'Daily_Loss_%', 'Interest_Rate_Monthly_%', 'Quantity_Qtl'],
-    'production_features': ['Area_ha', 'N_req_kg_per_ha', 'P_req_kg_per_ha', 'K_req_kg_per_ha', 'Temperature_C', 'Humidity_%', 'pH', 'Rainfall_mm'],
-    'crop_labels': le_crop.classes_.tolist(),
-    'state_labels': le_state.classes_.tolist()
+# Model family -> artifact name, features, target, estimator kind and label-encoded feature columns
+FAMILIES = {
+    'crop': {
+        'artifact': 'crop_model',
+        'title': 'CROP RECOMMENDATION MODEL',
+        'features': ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall'],
+        'target': 'label',
+        'kind': 'classifier',
+        'encoded': {},
+    },
+    'fertilizer': {
+        'artifact': 'fertilizer_model',
+        'title': 'FERTILIZER RECOMMENDATION MODEL',
+        'features': ['Crop', 'State', 'Area', 'Annual_Rainfall', 'Yield'],
+        'target': 'Fertilizer',
+        'kind': 'regressor',
+        'encoded': {'Crop': 'label_encoder_crop', 'State': 'label_encoder_state'},
+    },
+    'price': {
+        'artifact': 'price_model',
+        'title': 'PRICE PREDICTION MODEL',
+        'features': ['Current_Price', 'Storage_Cost_per_Day', 'Daily_Loss_%', 'Interest_Rate_Monthly_%',
+                     'Quantity_Qtl'],
+        'target': 'Predicted_Price_15D',
+        'kind': 'regressor',
+        'encoded': {},
+    },
+    'production': {
+        'artifact': 'production_model',
+        'title': 'PRODUCTION ESTIMATION MODEL',
+        'features': ['Area_ha', 'N_req_kg_per_ha', 'P_req_kg_per_ha', 'K_req_kg_per_ha', 'Temperature_C',
+                     'Humidity_%', 'pH', 'Rainfall_mm'],
+        'target': 'Yield_kg_per_ha',
+        'kind': 'regressor',
+        'encoded': {},
+    },
 }
 
-with open('feature_info.json', 'w') as f:
-    json.dump(feature_info, f)
+FOREST_PARAMS = {'n_estimators': 100, 'random_state': 42}
+
+# A row is held out for evaluation when its hash % HOLDOUT_BUCKETS == 0 (20%). The
+# split depends only on the row, so it stays the same across full and incremental runs.
+HOLDOUT_BUCKETS = 5
+
+
+class StageLog:
+    """Wall time and peak resident memory per pipeline stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def measure(self, name, func, *args, **kwargs):
+        """Run ``func`` as stage ``name`` and return its result"""
+        result, stats = measured(func, *args, **kwargs)
+        self.stages[name] = stats
+        return result
+
+    def add(self, name, stats):
+        self.stages[name] = stats
+
+    def report(self):
+        rows = [(name, f"{stats['seconds']:.2f}",
+                 f"{stats['peak_mb']:.0f}" if stats.get('peak_mb') is not None else '-',
+                 ', '.join(f'{key} {value}' for key, value in stats.items() if key not in ('seconds', 'peak_mb')))
+                for name, stats in self.stages.items()]
+        header = ('stage', 'seconds', 'peak RSS MB', 'details')
+        widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+        for row in [header, tuple('-' * width for width in widths)] + rows:
+            print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def measured(func, *args, **kwargs):
+    """``func(*args, **kwargs)`` and {'seconds', 'peak_mb'} of the call
+
+    ``peak_mb`` is the highest resident set size of the process while
+    ``func`` ran, sampled every few milliseconds (``None`` where
+    ``/proc/self/statm`` does not exist).
+    """
+    sampler = _RssSampler()
+    started = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - started
+        peak = sampler.stop()
+    return result, {'seconds': round(seconds, 3), 'peak_mb': round(peak / 2 ** 20, 1) if peak else None}
+
+
+class _RssSampler:
+    """Background thread tracking the peak resident set size until ``stop``"""
+
+    INTERVAL = 0.005
+
+    def __init__(self):
+        self.peak = _rss_bytes()
+        self._stopped = threading.Event()
+        self._thread = None
+        if self.peak:
+            self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.INTERVAL):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.peak = max(self.peak, _rss_bytes())
+        return self.peak
+
+
+def _rss_bytes():
+    """Current resident set size (Linux), 0 where it cannot be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def read_dataset(name, data_dir=project_dir, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Read dataset ``name`` chunk by chunk with its declared columns and dtypes"""
+    spec = DATASETS[name]
+    chunks = []
+    reader = pd.read_csv(os.path.join(data_dir, spec['file']), usecols=list(spec['dtype']), dtype=spec['dtype'],
+                         chunksize=chunk_rows)
+    for chunk in reader:
+        chunks.append(chunk.dropna() if spec['dropna'] else chunk)
+    return _concat_chunks(chunks, [column for column, dtype in spec['dtype'].items() if dtype == 'category'])
+
+
+def _concat_chunks(chunks, categorical):
+    """Join chunks; categorical columns get the sorted union of every chunk's categories"""
+    if len(chunks) == 1:
+        frame = chunks[0].reset_index(drop=True)
+        for column in categorical:
+            frame[column] = frame[column].cat.reorder_categories(sorted(frame[column].cat.categories))
+        return frame
+    frame = pd.concat([chunk.drop(columns=categorical) for chunk in chunks], ignore_index=True)
+    for column in categorical:
+        frame[column] = union_categoricals([chunk[column] for chunk in chunks], sort_categories=True)
+    return frame
+
+
+def load_datasets(names, data_dir=project_dir, chunk_rows=DEFAULT_CHUNK_ROWS, log=None):
+    """Read ``names`` concurrently; missing files are reported and left out"""
+    def load(name):
+        path = os.path.join(data_dir, DATASETS[name]['file'])
+        if not os.path.exists(path):
+            return name, None, None
+        started = time.perf_counter()
+        frame = read_dataset(name, data_dir, chunk_rows)
+        return name, frame, time.perf_counter() - started
+
+    frames = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(names)), thread_name_prefix='csv-loader') as pool:
+        for name, frame, seconds in pool.map(load, names):
+            if frame is None:
+                print(f"{DATASETS[name]['file']} not found in {data_dir}, skipping the {name} model")
+                continue
+            frames[name] = frame
+            megabytes = frame.memory_usage(deep=True).sum() / 2 ** 20
+            print(f"{name} dataset: {frame.shape} in {seconds:.2f} s, {megabytes:.1f} MB")
+            if log is not None:
+                # Loads overlap, so the stage peak is only known for all of them together
+                log.add(f'load {name}', {'seconds': round(seconds, 3), 'peak_mb': None, 'rows': len(frame),
+                                         'frame_mb': round(megabytes, 1)})
+    return frames
+
+
+def row_hashes(name, frame):
+    """64-bit hash of each row of dataset ``name``; identifies rows across runs"""
+    return pd.util.hash_pandas_object(frame[list(DATASETS[name]['dtype'])], index=False).to_numpy()
+
+
+def holdout_mask(hashes):
+    """Rows kept out of training and used for evaluation"""
+    return hashes % HOLDOUT_BUCKETS == 0
+
+
+def consumed_rows_artifact(name):
+    """Store artifact with the sorted hashes of the rows of ``name`` the current models were trained on"""
+    return f'consumed_rows_{name}'
+
+
+def prepare(family, frame, encoders=None):
+    """(float32 feature matrix, target, {artifact name: LabelEncoder})
+
+    Encoded columns get new encoders fitted on ``frame``, or use the given
+    ``encoders`` (as incremental training must); values those do not know
+    become -1.
+    """
+    spec = FAMILIES[family]
+    fitted = {}
+    X = np.empty((len(frame), len(spec['features'])), dtype=np.float32)
+    for index, column in enumerate(spec['features']):
+        if column in spec['encoded']:
+            name = spec['encoded'][column]
+            if encoders is not None:
+                encoder = encoders[name]
+                categories = encoder.classes_
+            else:
+                # Sorted categories: the codes are what LabelEncoder.fit_transform would give
+                categories = frame[column].cat.remove_unused_categories().cat.categories
+                encoder = LabelEncoder().fit(np.asarray(categories, dtype=object))
+            X[:, index] = frame[column].cat.set_categories(categories).cat.codes
+            fitted[name] = encoder
+        else:
+            X[:, index] = frame[column].to_numpy()
+    target = frame[spec['target']]
+    y = np.asarray(target, dtype=object) if spec['kind'] == 'classifier' else target.to_numpy(dtype=np.float64)
+    return X, y, fitted
+
+
+def score(kind, y_true, y_pred):
+    """Accuracy for classifiers, R² and RMSE for regressors"""
+    if kind == 'classifier':
+        return {'accuracy': float(accuracy_score(y_true, y_pred))}
+    return {'r2': float(r2_score(y_true, y_pred)), 'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred)))}
+
+
+def train_family(family, X, y, holdout, n_jobs=1):
+    """Fit one model family on the rows outside ``holdout`` and score it on the rest
+
+    Returns (model, metrics, stage stats). Runs in a pool worker, so it only
+    takes and returns picklable values.
+    """
+    spec = FAMILIES[family]
+    estimator = RandomForestClassifier if spec['kind'] == 'classifier' else RandomForestRegressor
+    model = estimator(n_jobs=n_jobs, **FOREST_PARAMS)
+    _, fit_stats = measured(model.fit, X[~holdout], y[~holdout])
+    y_pred, evaluate_stats = measured(model.predict, X[holdout])
+    model.n_jobs = None  # the serving process decides its own parallelism
+
+    metrics = score(spec['kind'], y[holdout], y_pred)
+    metrics.update(train_rows=int((~holdout).sum()), test_rows=int(holdout.sum()))
+    return model, metrics, {'fit': dict(fit_stats, n_jobs=n_jobs), 'evaluate': evaluate_stats}
+
+
+def train_all(prepared, workers=None):
+    """Train every prepared family, in parallel when there are cores to spare
+
+    ``prepared`` maps family -> (X, y, holdout). Families run in a process pool of
+    ``workers`` (default: one per family, at most one per core); each
+    forest gets ``n_jobs`` = cores // workers. Returns family -> (model,
+    metrics, stage stats).
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, cores, len(prepared)))
+    n_jobs = max(1, cores // workers)
+    # Largest first, so the longest fit is not the one left running alone at the end
+    order = sorted(prepared, key=lambda family: prepared[family][0].size, reverse=True)
+    print(f"Training {', '.join(order)} with {workers} worker(s), n_jobs={n_jobs} per forest")
+
+    if workers == 1:
+        return {family: train_family(family, *prepared[family], n_jobs=n_jobs) for family in order}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {family: pool.submit(train_family, family, *prepared[family], n_jobs=n_jobs) for family in order}
+        return {family: future.result() for family, future in futures.items()}
+
+
+def build_feature_info(encoders):
+    """``feature_info`` for the API: feature names, and the crop/state labels when trained"""
+    feature_info = {f'{family}_features': spec['features'] for family, spec in FAMILIES.items()}
+    if 'label_encoder_crop' in encoders:
+        feature_info['crop_labels'] = encoders['label_encoder_crop'].classes_.tolist()
+    if 'label_encoder_state' in encoders:
+        feature_info['state_labels'] = encoders['label_encoder_state'].classes_.tolist()
+    return feature_info
+
+
+def dataset_record(name, data_dir, frame):
+    path = os.path.join(data_dir, DATASETS[name]['file'])
+    stat = os.stat(path)
+    return {'file': DATASETS[name]['file'], 'bytes': stat.st_size, 'mtime': int(stat.st_mtime), 'rows': len(frame)}
+
+
+def run(families, data_dir=project_dir, output=None, workers=None, chunk_rows=DEFAULT_CHUNK_ROWS, promote=True):
+    """Load, prepare, train and save ``families``; returns the new version name (or ``None``)"""
+    log = StageLog()
+    started = time.perf_counter()
+
+    print("Loading and processing all datasets...")
+    frames = log.measure('load', load_datasets, families, data_dir, chunk_rows, log)
+    if not frames:
+        print("No datasets found, nothing to train")
+        return None
+
+    prepared, encoders, consumed = {}, {}, {}
+    for family, frame in frames.items():
+        X, y, family_encoders = log.measure(f'prepare {family}', prepare, family, frame)
+        hashes = row_hashes(family, frame)
+        prepared[family] = (X, y, holdout_mask(hashes))
+        encoders.update(family_encoders)
+        # Recorded so incremental runs (model.py --incremental) can tell which rows are new
+        consumed[consumed_rows_artifact(family)] = np.unique(hashes)
+
+    trained = log.measure('train', train_all, prepared, workers)
+    artifacts = dict(encoders, **consumed)
+    model_records = {}
+    for family, (model, metrics, stats) in trained.items():
+        spec = FAMILIES[family]
+        print(f"\n=== {spec['title']} ===")
+        print(', '.join(f'{key}: {value:.2f}' if isinstance(value, float) else f'{key}: {value}'
+                        for key, value in metrics.items()))
+        artifacts[spec['artifact']] = model
+        for stage, stage_stats in stats.items():
+            log.add(f'{stage} {family}', stage_stats)
+        model_records[family] = {'artifact': spec['artifact'], 'features': spec['features'],
+                                 'target': spec['target'], 'kind': spec['kind'], 'params': FOREST_PARAMS,
+                                 'metrics': metrics, 'n_estimators': len(model.estimators_),
+                                 # What a full retrain cost, to compare incremental runs against
+                                 'full_fit': {'seconds': stats['fit']['seconds'], 'rows': metrics['train_rows'],
+                                              'n_jobs': stats['fit']['n_jobs']}}
+
+    print("\n=== SAVING MODELS ===")
+    # Models this run did not train are carried over from the current version
+    base = model_store.current_version(output)
+    inherited = model_store.read_manifest(base, output) if base else {}
+    manifest = {
+        'base': base,
+        'models': {**inherited.get('models', {}), **model_records},
+        'encoders': {**inherited.get('encoders', {}),
+                     **{column: name for family in trained for column, name in FAMILIES[family]['encoded'].items()}},
+        'feature_info': {**inherited.get('feature_info', {}), **build_feature_info(encoders)},
+        'data': {**inherited.get('data', {}),
+                 **{name: dataset_record(name, data_dir, frame) for name, frame in frames.items()}},
+    }
+    version = log.measure('save', model_store.write_version, artifacts, dict(manifest, timings=log.stages),
+                          output, promote, base)
+    print(f"Saved version {version} to {output or model_store.model_dir()}"
+          f"{' (promoted)' if promote else ''}")
+
+    print(f"\n=== STAGES ({time.perf_counter() - started:.1f} s total) ===")
+    log.report()
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the crop, fertilizer, price and production models')
+    parser.add_argument('--data-dir', default=os.getenv('TRAINING_DATA_DIR', project_dir),
+                        help='directory with the training CSVs')
+    parser.add_argument('--output', default=None, help='model store directory (TRAINED_MODEL_DIR)')
+    parser.add_argument('--only', default=None,
+                        help=f"comma-separated model families ({', '.join(FAMILIES)}; production_xgb too "
+                             "with --incremental)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='training processes (default: one per family, at most one per core)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='rows per CSV chunk')
+    parser.add_argument('--no-promote', action='store_true', help='save the version without making it current')
+    parser.add_argument('--incremental', action='store_true',
+                        help='train only on rows the current version has not seen (incremental_training.py)')
+    parser.add_argument('--boost-rounds', type=int, default=None,
+                        help='boosting rounds added to the XGBoost production model (--incremental)')
+    parser.add_argument('--compare-full', action='store_true',
+                        help='also time a full retrain of each updated model (--incremental)')
+    args = parser.parse_args(argv)
+
+    if args.incremental:
+        import incremental_training
+        known = incremental_training.INCREMENTAL_FAMILIES
+        default = known
+    else:
+        known = default = list(FAMILIES)
+    families = [name.strip() for name in args.only.split(',') if name.strip()] if args.only else default
+    unknown = [name for name in families if name not in known]
+    if unknown:
+        parser.error(f"unknown model families: {', '.join(unknown)}")
+
+    if args.incremental:
+        rounds = args.boost_rounds or incremental_training.DEFAULT_BOOST_ROUNDS
+        incremental_training.run_incremental(families, args.data_dir, args.output, args.chunk_rows, rounds,
+                                             args.compare_full, not args.no_promote)
+        return 0
+    version = run(families, args.data_dir, args.output, args.workers, args.chunk_rows, not args.no_promote)
+    return 0 if version else 1
+
 
-print("All models saved successfully!")
-print(f"Crop recommendation model accuracy: {crop_accuracy:.2f}")
-print(f"Fertilizer model R²: {fertilizer_r2:.2f}")
-print(f"Price model R²: {price_r2:.2f}")
-print(f"Production model R²: {prod_r2:.2f}")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
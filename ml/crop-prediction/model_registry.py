@@ -0,0 +1,348 @@
+"""
+Model registry with background and lazy loading.
+
+Every artifact the app needs (models, encoders, API clients) is registered
+with a loader function instead of being loaded at import time. ``start``
+loads the eager set in a thread pool while Flask is already serving; anything
+else is loaded on first ``get``. Per-model state and load time feed the
+``/health`` and ``/ready`` endpoints.
+
+Each load also gets a version string. When a model is registered with its
+source files the version is a fingerprint of their size and modification
+time, so every worker that loads the same files agrees on it; otherwise it
+is a per-process load counter. Listeners added with ``add_listener`` are
+told about every completed load (e.g. to drop cached predictions).
+
+Loaded artifacts can be replaced without a restart. ``reload`` loads new
+values next to the ones in use and runs each artifact's ``warmup`` on them;
+artifacts registered with ``depends_on`` (a compiled copy, a pipeline around
+a model) are rebuilt from the new values. Only when everything has loaded
+are they swapped in together, by replacing the value table in a single
+assignment. Requests that already fetched an old value finish with it. A
+load or warm-up that fails keeps the old value, together with every artifact
+of its ``group`` (e.g. a model and the label encoder of the same trained
+version) and everything built on them. ``watch`` polls the source
+fingerprints in a background thread and reloads whatever changed, so
+promoting a trained version reaches every worker.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LOADING = 'loading'
+LOADED = 'loaded'
+MISSING = 'missing'
+FAILED = 'failed'
+
+
+class _Entry:
+    def __init__(self, name, loader, required, sources, depends_on, warmup, group, drop_when_missing):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.sources = sources
+        self.depends_on = depends_on
+        self.warmup = warmup
+        self.group = group
+        self.drop_when_missing = drop_when_missing
+        self.failed_fingerprint = None
+        self.reloads = 0
+        self.reloaded_at = None
+        self.reload_error = None
+        self.loads = 0
+        self.version = None
+        self.state = PENDING
+        self.error = None
+        self.load_time = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+
+class ModelRegistry:
+    """Named artifacts loaded once, in the background or on first use"""
+
+    def __init__(self, max_workers=4):
+        self._entries = {}
+        self._executor = None
+        self._max_workers = max_workers
+        self._listeners = []
+        self._watcher = None
+        # Name -> loaded value; never changed in place, only replaced, so one assignment swaps any number
+        self._values = {}
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.RLock()
+        # Values a reload has loaded but not swapped in yet, visible to the reloading thread's loaders
+        self._staging = threading.local()
+
+    def register(self, name, loader, required=False, sources=(), depends_on=(), warmup=None, group=None,
+                 drop_when_missing=False):
+        """Register ``loader()`` for ``name``
+
+        A loader returns the artifact. Returning ``None`` or raising
+        ``FileNotFoundError`` marks it missing (callers fall back to mock
+        predictions); any other exception marks it failed. ``sources`` are
+        the files the artifact may be loaded from, used for its version.
+        ``depends_on`` names artifacts the loader builds on; reloading one of
+        them reloads this one too. ``warmup(value)`` runs on every new value
+        before anyone can ``get`` it. Artifacts of the same ``group`` are
+        swapped all together or not at all. A reload that finds nothing
+        (``None``) keeps the old value, unless ``drop_when_missing``: then the
+        artifact becomes missing.
+        """
+        self._entries[name] = _Entry(name, loader, required, tuple(sources), tuple(depends_on), warmup, group,
+                                     drop_when_missing)
+
+    def add_listener(self, callback):
+        """Call ``callback(name)`` after every completed load of any artifact"""
+        self._listeners.append(callback)
+
+    def start(self, eager=None):
+        """Load ``eager`` (names, or all registered when ``None``) in a background pool"""
+        names = list(self._entries) if eager is None else [name for name in eager if name in self._entries]
+        if not names:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='model-loader')
+        for name in names:
+            self._executor.submit(self._load, self._entries[name])
+
+    def get(self, name, timeout=None):
+        """Return the artifact, loading it now if nobody has started yet
+
+        Returns ``None`` for missing or failed artifacts, or when ``timeout``
+        expires while another thread is still loading it.
+        """
+        staged = getattr(self._staging, 'values', None)
+        if staged is not None and name in staged:
+            return staged[name]
+        entry = self._entries[name]
+        if not entry.done.is_set():
+            self._load(entry)
+            entry.done.wait(timeout)
+        return self._values.get(name)
+
+    def version(self, name):
+        """Version of the loaded artifact, ``None`` until it has been loaded"""
+        return self._entries[name].version
+
+    def is_loaded(self, name):
+        return self._entries[name].state == LOADED
+
+    def available(self, name):
+        """False once the artifact turned out missing or failed (``get`` would return ``None``)"""
+        return self._entries[name].state not in (MISSING, FAILED)
+
+    def ready(self):
+        """True once every required artifact is loaded"""
+        return all(entry.state == LOADED for entry in self._entries.values() if entry.required)
+
+    def status(self):
+        """Per-artifact load state and load time"""
+        return {
+            name: {
+                'state': entry.state,
+                'required': entry.required,
+                'load_time_ms': round(entry.load_time * 1000.0, 1) if entry.load_time is not None else None,
+                'error': entry.error,
+                'version': entry.version,
+                'reloads': entry.reloads,
+                'reloaded_at': entry.reloaded_at,
+                'reload_error': entry.reload_error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def _load(self, entry):
+        # Non-blocking: whoever gets the lock first loads, everyone else waits on ``done``
+        if not entry.lock.acquire(blocking=False):
+            return
+        try:
+            if entry.state != PENDING:
+                return
+            entry.state = LOADING
+            started = time.perf_counter()
+            try:
+                value = entry.loader()
+                if value is not None and entry.warmup is not None:
+                    self._warm(entry, value)
+                with self._swap_lock:
+                    self._values = {**self._values, entry.name: value}
+                entry.state = LOADED if value is not None else MISSING
+            except FileNotFoundError as e:
+                entry.state = MISSING
+                entry.error = str(e)
+            except Exception as e:
+                entry.state = FAILED
+                entry.error = str(e)
+                logger.exception(f"Loading {entry.name} failed")
+            entry.load_time = time.perf_counter() - started
+            entry.loads += 1
+            entry.version = _fingerprint(entry.sources) or f'load-{entry.loads}'
+            logger.info(f"{entry.name}: {entry.state} in {entry.load_time * 1000.0:.0f} ms")
+        finally:
+            entry.done.set()
+            entry.lock.release()
+        self._notify(entry.name)
+
+    def reload(self, names):
+        """Load ``names`` (and what depends on them) again and swap in the new values together
+
+        Artifacts nobody has loaded yet are left for their first ``get``.
+        Returns ``{name: outcome}``: ``'swapped'``, ``'dropped'`` (now
+        missing), ``'kept'`` (this or a related load failed, the old value
+        stays) or ``'not loaded'``.
+        """
+        names = {names} if isinstance(names, str) else set(names)
+        with self._reload_lock:
+            # Registration order puts every artifact after the ones it depends on
+            selected, outcomes = [], {}
+            for name, entry in self._entries.items():
+                if name in names or any(dependency in outcomes for dependency in entry.depends_on):
+                    outcomes[name] = 'not loaded'
+                    if entry.done.is_set() and entry.state != LOADING:
+                        selected.append(entry)
+
+            staged, failed, load_times = {}, {}, {}
+            self._staging.values = staged
+            try:
+                for entry in selected:
+                    if failed.keys() & set(entry.depends_on):
+                        failed[entry.name] = f"{', '.join(failed.keys() & set(entry.depends_on))} failed to load"
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        value = entry.loader()
+                        if value is None and not entry.drop_when_missing:
+                            raise FileNotFoundError(f"{entry.name} has no source any more")
+                        if value is not None and entry.warmup is not None:
+                            entry.warmup(value)
+                    except FileNotFoundError as e:
+                        failed[entry.name] = str(e)
+                        logger.warning(f"Reloading {entry.name}: {e}; keeping version {entry.version}")
+                        continue
+                    except Exception as e:
+                        failed[entry.name] = str(e)
+                        logger.exception(f"Reloading {entry.name} failed; keeping version {entry.version}")
+                        continue
+                    staged[entry.name] = value
+                    load_times[entry.name] = time.perf_counter() - started
+            finally:
+                self._staging.values = None
+
+            rejected = self._rejected(selected, failed)
+            accepted = {name: value for name, value in staged.items() if name not in rejected}
+            with self._swap_lock:
+                self._values = {**self._values, **accepted}
+
+            for entry in selected:
+                fingerprint = _fingerprint(entry.sources)
+                if entry.name in rejected:
+                    # Not retried until the sources change again
+                    entry.failed_fingerprint = fingerprint
+                    entry.reload_error = failed.get(entry.name, 'kept with the artifacts it is swapped with')
+                    outcomes[entry.name] = 'kept'
+                    continue
+                value = accepted[entry.name]
+                entry.state = LOADED if value is not None else MISSING
+                entry.error = entry.reload_error = entry.failed_fingerprint = None
+                entry.load_time = load_times[entry.name]
+                entry.loads += 1
+                entry.reloads += 1
+                entry.reloaded_at = time.time()
+                previous, entry.version = entry.version, fingerprint or f'load-{entry.loads}'
+                outcomes[entry.name] = 'swapped' if value is not None else 'dropped'
+                logger.info(f"{entry.name}: {outcomes[entry.name]} {previous} -> {entry.version} "
+                            f"in {entry.load_time * 1000.0:.0f} ms")
+        for name in accepted:
+            self._notify(name)
+        return outcomes
+
+    @staticmethod
+    def _rejected(selected, failed):
+        """Failed artifacts, the rest of their groups, and everything built on any of them"""
+        rejected = set(failed)
+        changed = True
+        while changed:
+            changed = False
+            groups = {entry.group for entry in selected if entry.name in rejected and entry.group is not None}
+            for entry in selected:
+                if entry.name not in rejected and (entry.group in groups or rejected & set(entry.depends_on)):
+                    rejected.add(entry.name)
+                    changed = True
+        return rejected
+
+    def stale(self):
+        """Loaded artifacts whose source files changed since they were loaded"""
+        names = []
+        for name, entry in self._entries.items():
+            if entry.done.is_set() and entry.sources:
+                fingerprint = _fingerprint(entry.sources)
+                if fingerprint is not None and fingerprint not in (entry.version, entry.failed_fingerprint):
+                    names.append(name)
+        return names
+
+    def reload_stale(self):
+        """``reload`` every stale artifact; ``{}`` when nothing changed"""
+        # One pass at a time, so the watcher and an admin call do not both reload the same change
+        with self._reload_lock:
+            names = self.stale()
+            return self.reload(names) if names else {}
+
+    def watch(self, interval):
+        """Check for changed sources every ``interval`` seconds in a daemon thread (0 = never)"""
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                outcomes = self.reload_stale()
+            except Exception:
+                logger.exception("Model reload check failed")
+                continue
+            if outcomes:
+                logger.info(f"Model sources changed: {outcomes}")
+
+    @staticmethod
+    def _warm(entry, value):
+        try:
+            entry.warmup(value)
+        except Exception:
+            # The first load has nothing to fall back on; serve it cold
+            logger.exception(f"Warming up {entry.name} failed")
+
+    def _notify(self, name):
+        for callback in self._listeners:
+            try:
+                callback(name)
+            except Exception:
+                logger.exception(f"Load listener failed for {name}")
+
+
+def _fingerprint(paths):
+    """Short hash of the size and mtime of the existing files among ``paths``"""
+    digest = hashlib.sha1()
+    found = False
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        found = True
+        digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:12] if found else None
+
+
+def names_from_env(variable, default):
+    """Comma-separated artifact names from an environment variable"""
+    value = os.getenv(variable, default)
+    return [name.strip() for name in value.split(',') if name.strip()]
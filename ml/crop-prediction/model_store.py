@@ -0,0 +1,216 @@
+"""
+Versioned store for the models ``model.py`` trains.
+
+``model.py`` used to pickle ten loose files (four models, two label encoders,
+four feature lists) into whatever directory it was run from, overwriting the
+previous run piecemeal. A training run now writes one version directory:
+
+    trained_models/
+        CURRENT                      # name of the promoted version
+        20261018T093012-3f2a9c1e/
+            manifest.json            # features, metrics, data, timings, artifact hashes
+            crop_model.pkl  fertilizer_model.pkl  price_model.pkl
+            production_model.pkl  label_encoder_crop.pkl  label_encoder_state.pkl
+
+The version is built in a staging directory and renamed into place, then
+``CURRENT`` is replaced atomically, so the app never sees half a run. Older
+versions stay on disk; ``promote`` points ``CURRENT`` back at one of them.
+Every promotion is appended to ``HISTORY``, and ``rollback`` returns to the
+version promoted before the current one.
+Feature lists and ``feature_info`` live in the manifest instead of pickles.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+FORMAT_NAME = 'krishikavach-models'
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+HISTORY = 'HISTORY'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_DIR = os.path.join(HERE, 'trained_models')
+
+
+def model_dir():
+    """Directory trained versions are written to and loaded from (``TRAINED_MODEL_DIR``)"""
+    return os.getenv('TRAINED_MODEL_DIR', DEFAULT_MODEL_DIR)
+
+
+def pointer_path(directory=None):
+    """Path of the ``CURRENT`` file; its mtime changes whenever a version is promoted"""
+    return os.path.join(directory or model_dir(), CURRENT)
+
+
+def write_version(artifacts, manifest, directory=None, promote_version=True, base=None):
+    """Pickle ``artifacts`` (name -> object) with ``manifest`` as a new version
+
+    ``manifest`` is extended with the format, version name, creation time
+    and per-artifact file, size and SHA-256. Artifacts of the ``base``
+    version that are not in ``artifacts`` are carried over unchanged (hard
+    links where possible), so retraining one model still gives a complete
+    version. Returns the version name.
+    """
+    directory = os.path.abspath(directory or model_dir())
+    os.makedirs(directory, exist_ok=True)
+    staging = os.path.join(directory, f'.staging-{os.getpid()}')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    files = {}
+    for name, value in artifacts.items():
+        filename = f'{name}.pkl'
+        with open(os.path.join(staging, filename), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        files[name] = {'file': filename, 'bytes': os.path.getsize(os.path.join(staging, filename)),
+                       'sha256': _sha256(os.path.join(staging, filename))}
+    if base is not None:
+        for name, spec in read_manifest(base, directory)['artifacts'].items():
+            if name not in files:
+                _link_or_copy(os.path.join(directory, base, spec['file']), os.path.join(staging, spec['file']))
+                files[name] = dict(spec, inherited_from=spec.get('inherited_from', base))
+
+    digest = hashlib.sha256()
+    for name, spec in sorted(files.items()):
+        digest.update(f"{name}:{spec['sha256']};".encode())
+
+    created = time.time()
+    version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(created))}-{digest.hexdigest()[:8]}"
+    manifest = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(created)),
+        **manifest,
+        'artifacts': files,
+    }
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.rename(staging, os.path.join(directory, version))
+    if promote_version:
+        promote(version, directory)
+    return version
+
+
+def promote(version, directory=None, record=True):
+    """Make ``version`` the one the app loads (and append it to the history, if ``record``)"""
+    directory = directory or model_dir()
+    if not os.path.exists(os.path.join(directory, version, MANIFEST)):
+        raise FileNotFoundError(f'No trained version {version} in {directory}')
+    if record:
+        _write_lines(os.path.join(directory, HISTORY), history(directory) + [version])
+    _write_lines(pointer_path(directory), [version])
+
+
+def history(directory=None):
+    """Promoted versions, oldest first"""
+    try:
+        with open(os.path.join(directory or model_dir(), HISTORY)) as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def rollback(directory=None):
+    """Promote the version that was current before the current one; returns it, ``None`` if there is none
+
+    Versions promoted before the history was kept fall back to the ``base``
+    the current version was trained from.
+    """
+    directory = directory or model_dir()
+    current = current_version(directory)
+    promoted = history(directory)
+    while promoted and promoted[-1] == current:
+        promoted.pop()
+    if promoted:
+        target = promoted[-1]
+    else:
+        target = read_manifest(current, directory).get('base') if current else None
+        if target is None or target == current:
+            return None
+        promoted = [target]
+    promote(target, directory, record=False)
+    _write_lines(os.path.join(directory, HISTORY), promoted)
+    return target
+
+
+def current_version(directory=None):
+    """Name of the promoted version, ``None`` if nothing was trained yet"""
+    try:
+        with open(pointer_path(directory)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def versions(directory=None):
+    """Names of all trained versions, oldest first"""
+    directory = directory or model_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if not name.startswith('.') and os.path.exists(os.path.join(directory, name, MANIFEST)))
+
+
+def read_manifest(version=None, directory=None):
+    """Manifest of ``version`` (default: the current one)
+
+    Raises ``FileNotFoundError`` when there is no such version.
+    """
+    directory = directory or model_dir()
+    version = version or current_version(directory)
+    if version is None:
+        raise FileNotFoundError(f'No trained version in {directory}')
+    with open(os.path.join(directory, version, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_NAME or manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f'{directory}/{version} is not a version {FORMAT_VERSION} model store entry')
+    return manifest
+
+
+def artifact_path(name, version=None, directory=None):
+    """File of artifact ``name`` in ``version``; ``FileNotFoundError`` if it has none"""
+    directory = directory or model_dir()
+    manifest = read_manifest(version, directory)
+    if name not in manifest['artifacts']:
+        raise FileNotFoundError(f"Trained version {manifest['version']} has no {name}")
+    spec = manifest['artifacts'][name]
+    path = os.path.join(directory, manifest['version'], spec['file'])
+    if os.path.getsize(path) != spec['bytes']:
+        raise ValueError(f'{path} does not match the manifest')
+    return path
+
+
+def load_versioned(name, version=None, directory=None):
+    """Unpickle artifact ``name`` of ``version`` (default: the current one)"""
+    with open(artifact_path(name, version, directory), 'rb') as f:
+        return pickle.load(f)
+
+
+def _write_lines(path, lines):
+    """Replace ``path`` atomically with ``lines``"""
+    staging = f'{path}.tmp-{os.getpid()}'
+    with open(staging, 'w') as f:
+        f.writelines(line + '\n' for line in lines)
+    os.replace(staging, path)
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,332 @@
+"""
+Guarded calls to external APIs (Gemini, Google Translate, Google Speech).
+
+The SDK calls have no timeouts, so one slow upstream used to tie up every
+Flask thread, and the ML endpoints starved with them. Every outbound call
+now goes through an ``OutboundService`` per upstream, which gives it:
+
+* a bulkhead: at most ``max_concurrent`` calls in flight; a call that cannot
+  get a slot within ``queue_timeout`` fails at once with ``BulkheadFull``;
+* a deadline: each attempt runs on the service's own threads and the caller
+  stops waiting after ``timeout`` seconds (``DeadlineExceeded``). The SDK call
+  itself cannot be interrupted, so its slot stays taken until it returns;
+  the bulkhead therefore also bounds the threads stuck on a dead upstream;
+* retries with exponential backoff and full jitter, within ``deadline``;
+* a circuit breaker: after ``failure_threshold`` failed calls in a row the
+  service fails fast (``CircuitOpen``) for ``reset_timeout`` seconds, then
+  lets one probe call through and closes again if it succeeds.
+
+Streaming calls (the chatbot's Gemini answer) go through ``stream`` instead:
+the same bulkhead and circuit breaker, with ``timeout`` as the longest wait
+for the next chunk and ``deadline`` for the whole stream. They are not
+retried, since the first chunks may already have reached the user.
+
+Callers catch ``OutboundError`` (or anything the SDK raises) and fall back,
+e.g. to ``generate_fallback_response``. Settings come from
+``OUTBOUND_<SERVICE>_<SETTING>`` environment variables and per-service
+counters are served at ``/metrics/outbound``.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Recent call latencies kept per service for the percentiles
+LATENCY_WINDOW = 1024
+
+
+class OutboundError(Exception):
+    """An outbound call was not made or did not finish in time"""
+
+
+class BulkheadFull(OutboundError):
+    pass
+
+
+class CircuitOpen(OutboundError):
+    pass
+
+
+class DeadlineExceeded(OutboundError):
+    pass
+
+
+class OutboundService:
+    """Bulkhead, deadline, retry and circuit breaker around one upstream API"""
+
+    SETTINGS = {
+        'max_concurrent': int,
+        'queue_timeout': float,
+        'timeout': float,
+        'deadline': float,
+        'retries': int,
+        'backoff': float,
+        'failure_threshold': int,
+        'reset_timeout': float,
+    }
+
+    def __init__(self, name, max_concurrent=8, queue_timeout=0.5, timeout=10.0, deadline=None,
+                 retries=1, backoff=0.2, failure_threshold=5, reset_timeout=30.0, passthrough=()):
+        """
+        Args:
+            name: Service name for logs and metrics
+            max_concurrent: Calls in flight at once
+            queue_timeout: Seconds to wait for a free slot before failing
+            timeout: Seconds per attempt
+            deadline: Seconds for all attempts and backoff together (default: ``timeout``)
+            retries: Extra attempts after a failure
+            backoff: Base of the exponential backoff; the sleep is uniform in
+                [0, backoff * 2**attempt]
+            failure_threshold: Consecutive failed calls that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe call
+            passthrough: Exception types that are answers, not failures (e.g.
+                "could not understand the audio"); raised as is, never retried
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.deadline = deadline if deadline is not None else timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.passthrough = tuple(passthrough)
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f'outbound-{name}')
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._consecutive_failures = 0
+        self._in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0, 'retries': 0,
+                          'rejected': 0, 'short_circuited': 0, 'circuit_opened': 0}
+
+    @classmethod
+    def from_env(cls, name, **defaults):
+        """Service whose settings may be overridden by ``OUTBOUND_<NAME>_<SETTING>``"""
+        settings = dict(defaults)
+        for setting, parse in cls.SETTINGS.items():
+            value = os.getenv(f'OUTBOUND_{name.upper()}_{setting.upper()}')
+            if value:
+                settings[setting] = parse(value)
+        return cls(name, **settings)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def is_open(self):
+        """True while calls would fail fast"""
+        return self.state == OPEN
+
+    def call(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` under the service's limits and return its result"""
+        with self._lock:
+            self._counters['calls'] += 1
+        probe = self._enter_circuit()
+        started = time.monotonic()
+        give_up_at = started + self.deadline
+        attempt = 0
+        last_error = None
+        try:
+            while True:
+                try:
+                    result = self._attempt(func, args, kwargs, give_up_at)
+                except self.passthrough:
+                    self._record_success(started)
+                    raise
+                except BulkheadFull:
+                    if last_error is not None:
+                        self._record_failure(last_error)  # a retry found no free slot
+                    raise
+                except Exception as e:
+                    last_error = e
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                    if attempt >= self.retries or time.monotonic() + delay >= give_up_at:
+                        self._record_failure(e)
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self._counters['retries'] += 1
+                    logger.info(f"{self.name}: retry {attempt} after {e!r} in {delay * 1000:.0f} ms")
+                    time.sleep(delay)
+                    continue
+                self._record_success(started)
+                return result
+        finally:
+            if probe:
+                with self._lock:
+                    self._probing = False
+
+    async def stream(self, open_stream):
+        """Iterate the async iterable ``open_stream()`` under the service's limits
+
+        Holds one bulkhead slot until the stream ends. A chunk that takes more
+        than ``timeout``, or a stream still going after ``deadline``, raises
+        ``DeadlineExceeded``; errors count towards the circuit breaker, a
+        consumer that stops early does not.
+        """
+        with self._lock:
+            self._counters['calls'] += 1
+        probe = self._enter_circuit()
+        started = time.monotonic()
+        give_up_at = started + self.deadline
+        try:
+            await self._acquire_async(give_up_at)
+            chunks = open_stream().__aiter__()
+            try:
+                while True:
+                    wait = max(0.0, min(self.timeout, give_up_at - time.monotonic()))
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), wait)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        with self._lock:
+                            self._counters['timeouts'] += 1
+                        raise DeadlineExceeded(f'{self.name}: stream stalled or ran past {self.deadline:g} s') \
+                            from None
+                    yield chunk
+            except Exception as e:
+                self._record_failure(e)
+                raise
+            else:
+                self._record_success(started)
+            finally:
+                if hasattr(chunks, 'aclose'):
+                    await chunks.aclose()
+                self._release()
+        finally:
+            if probe:
+                with self._lock:
+                    self._probing = False
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'state': self._current_state(),
+                'in_flight': self._in_flight,
+                'max_concurrent': self.max_concurrent,
+                'timeout_seconds': self.timeout,
+                'consecutive_failures': self._consecutive_failures,
+                'p50_ms': round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+                'p99_ms': round(float(np.percentile(latencies, 99)), 1) if latencies else None,
+                **self._counters,
+            }
+
+    def _attempt(self, func, args, kwargs, give_up_at):
+        wait = min(self.queue_timeout, max(0.0, give_up_at - time.monotonic()))
+        if not self._slots.acquire(timeout=wait):
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise BulkheadFull(f'{self.name}: {self.max_concurrent} calls already in flight')
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._pool.submit(func, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the call really ends, not when we stop waiting for it
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return future.result(timeout=max(0.0, min(self.timeout, give_up_at - time.monotonic())))
+        except FutureTimeoutError:
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise DeadlineExceeded(f'{self.name}: no answer within {self.timeout:g} s') from None
+
+    async def _acquire_async(self, give_up_at):
+        """``_attempt``'s slot acquisition for coroutines: polls instead of blocking the event loop"""
+        wait_until = time.monotonic() + min(self.queue_timeout, max(0.0, give_up_at - time.monotonic()))
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= wait_until:
+                with self._lock:
+                    self._counters['rejected'] += 1
+                raise BulkheadFull(f'{self.name}: {self.max_concurrent} calls already in flight')
+            await asyncio.sleep(0.01)
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _current_state(self):
+        """Circuit state, moving open -> half-open once the reset timeout has passed (lock held)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    def _enter_circuit(self):
+        """Raise ``CircuitOpen`` unless the call may go ahead; True for the half-open probe"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._counters['short_circuited'] += 1
+        raise CircuitOpen(f'{self.name}: circuit open after {self.failure_threshold} failures')
+
+    def _record_success(self, started):
+        with self._lock:
+            self._latencies.append((time.monotonic() - started) * 1000.0)
+            self._counters['successes'] += 1
+            self._consecutive_failures = 0
+            if self._state != CLOSED:
+                logger.info(f"{self.name}: circuit closed")
+            self._state = CLOSED
+
+    def _record_failure(self, error):
+        with self._lock:
+            self._counters['failures'] += 1
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._counters['circuit_opened'] += 1
+                    logger.warning(f"{self.name}: circuit open for {self.reset_timeout:g} s after {error!r}")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+class OutboundRegistry:
+    """Named ``OutboundService`` instances"""
+
+    def __init__(self):
+        self._services = {}
+
+    def register(self, name, **settings):
+        """Create the service ``name``; ``OUTBOUND_<NAME>_*`` variables override ``settings``"""
+        service = OutboundService.from_env(name, **settings)
+        self._services[name] = service
+        return service
+
+    def __getitem__(self, name):
+        return self._services[name]
+
+    def call(self, name, func, *args, **kwargs):
+        return self._services[name].call(func, *args, **kwargs)
+
+    def stats(self):
+        return {name: service.stats() for name, service in self._services.items()}
@@ -1,33 +1,50 @@
 import numpy as np
-from PIL import Image
-import io
-import base64
 import json
 import os
+import time
+
+from image_preprocessing import ImageDecodeError, ImagePreprocessor
+from leaf_classifier import DEFAULT_CLASSIFIER_PATH, FEATURE_SIZE, LeafClassifier
 
 # TensorFlow not available due to compatibility issues
 TF_AVAILABLE = False
 print("Using AI-based pest detection without TensorFlow")
 
+CLASS_NAMES = [
+    'Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy',
+    'Blueberry___healthy', 'Cherry_(including_sour)___Powdery_mildew', 'Cherry_(including_sour)___healthy',
+    'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot', 'Corn_(maize)___Common_rust_', 
+    'Corn_(maize)___Northern_Leaf_Blight', 'Corn_(maize)___healthy', 'Grape___Black_rot',
+    'Grape___Esca_(Black_Measles)', 'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 'Grape___healthy',
+    'Orange___Haunglongbing_(Citrus_greening)', 'Peach___Bacterial_spot', 'Peach___healthy',
+    'Pepper,_bell___Bacterial_spot', 'Pepper,_bell___healthy', 'Potato___Early_blight',
+    'Potato___Late_blight', 'Potato___healthy', 'Raspberry___healthy', 'Soybean___healthy',
+    'Squash___Powdery_mildew', 'Strawberry___Leaf_scorch', 'Strawberry___healthy',
+    'Tomato___Bacterial_spot', 'Tomato___Early_blight', 'Tomato___Late_blight', 'Tomato___Leaf_Mold',
+    'Tomato___Septoria_leaf_spot', 'Tomato___Spider_mites Two-spotted_spider_mite',
+    'Tomato___Target_Spot', 'Tomato___Tomato_Yellow_Leaf_Curl_Virus', 'Tomato___Tomato_mosaic_virus',
+    'Tomato___healthy'
+]
+
+# Top-class probability at or above which a prediction counts as High / Medium confidence
+HIGH_CONFIDENCE = 0.7
+MEDIUM_CONFIDENCE = 0.4
+
 class PestDetectionModel:
-    def __init__(self, model_path=None):
-        """Initialize the pest detection model"""
+    def __init__(self, model_path=None, preprocessor=None):
+        """Initialize the pest detection model
+
+        ``model_path`` is a ``LeafClassifier`` archive (default
+        ``PEST_CLASSIFIER`` or models/pest_classifier.npz). Without one,
+        predictions fall back to ``generate_fallback_image_analysis``.
+        ``preprocessor`` turns uploads into classifier input (default: a new
+        ``FEATURE_SIZE`` uint8 ``ImagePreprocessor``).
+        """
         self.model = None
-        self.class_names = [
-            'Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy',
-            'Blueberry___healthy', 'Cherry_(including_sour)___Powdery_mildew', 'Cherry_(including_sour)___healthy',
-            'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot', 'Corn_(maize)___Common_rust_', 
-            'Corn_(maize)___Northern_Leaf_Blight', 'Corn_(maize)___healthy', 'Grape___Black_rot',
-            'Grape___Esca_(Black_Measles)', 'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 'Grape___healthy',
-            'Orange___Haunglongbing_(Citrus_greening)', 'Peach___Bacterial_spot', 'Peach___healthy',
-            'Pepper,_bell___Bacterial_spot', 'Pepper,_bell___healthy', 'Potato___Early_blight',
-            'Potato___Late_blight', 'Potato___healthy', 'Raspberry___healthy', 'Soybean___healthy',
-            'Squash___Powdery_mildew', 'Strawberry___Leaf_scorch', 'Strawberry___healthy',
-            'Tomato___Bacterial_spot', 'Tomato___Early_blight', 'Tomato___Late_blight', 'Tomato___Leaf_Mold',
-            'Tomato___Septoria_leaf_spot', 'Tomato___Spider_mites Two-spotted_spider_mite',
-            'Tomato___Target_Spot', 'Tomato___Tomato_Yellow_Leaf_Curl_Virus', 'Tomato___Tomato_mosaic_virus',
-            'Tomato___healthy'
-        ]
+        self.preprocessor = preprocessor or ImagePreprocessor(FEATURE_SIZE)
+        self._float_preprocessors = {}
+        model_path = model_path or os.getenv('PEST_CLASSIFIER', DEFAULT_CLASSIFIER_PATH)
+        self.class_names = list(CLASS_NAMES)
         
         if model_path and os.path.exists(model_path):
             self.load_model(model_path)
@@ -64,48 +81,165 @@ class PestDetectionModel:
         print("Simple CNN pest detection model created as fallback!")
     
     def preprocess_image(self, img_data, target_size=(224, 224)):
-        """Preprocess image for prediction - simple version without TensorFlow"""
+        """Preprocess image for prediction: (1, height, width, 3) float32 in [0, 1]"""
         try:
-            # Handle base64 encoded image
-            if isinstance(img_data, str) and img_data.startswith('data:image'):
-                # Remove data URL prefix
-                img_data = img_data.split(',')[1]
-                img_bytes = base64.b64decode(img_data)
-                img = Image.open(io.BytesIO(img_bytes))
-            elif isinstance(img_data, bytes):
-                img = Image.open(io.BytesIO(img_data))
-            else:
-                img = img_data
-            
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize image
-            img = img.resize(target_size, Image.Resampling.LANCZOS)
-            
-            # Convert to numpy array and normalize
-            img_array = np.array(img) / 255.0
-            
-            # Add batch dimension
-            img_array = np.expand_dims(img_array, axis=0)
-            
+            preprocessor = self._float_preprocessors.get(target_size)
+            if preprocessor is None:
+                preprocessor = ImagePreprocessor(target_size, dtype=np.float32, max_workers=1)
+                self._float_preprocessors[target_size] = preprocessor
+            img_array = preprocessor.empty(1)
+            preprocessor.preprocess(img_data, out=img_array[0])
             return img_array
             
-        except Exception as e:
+        except ImageDecodeError as e:
             print(f"Image preprocessing error: {e}")
             return None
     
     def predict(self, image_data):
-        """Predict pest/disease from image - AI-based analysis without TensorFlow"""
+        """Predict pest/disease from image with the NumPy leaf classifier"""
         try:
-            # Since TensorFlow is not available, use AI-based analysis
-            return self.generate_fallback_image_analysis(image_data)
+            if self.model is None:
+                return self.generate_fallback_image_analysis(image_data)
+            return self.predict_batch([image_data])[0]
             
         except Exception as e:
             print(f"Error in prediction: {e}")
             return self.generate_fallback_image_analysis(image_data)
     
+    @property
+    def has_classifier(self):
+        """True when predictions come from a trained leaf classifier, not the fallback"""
+        return self.model is not None
+    
+    def predict_from_image(self, image_bytes, location="Unknown"):
+        """Classify one uploaded image
+
+        Raises ``ImageDecodeError`` when the upload is not a readable image
+        and ``RuntimeError`` when no leaf classifier is loaded.
+        """
+        if self.model is None:
+            raise RuntimeError("No leaf classifier loaded")
+        image = self.preprocessor.preprocess(image_bytes)
+        top_predictions = self.model.top_k(self.model.predict_images(image[None]), k=3)[0]
+        return self._build_result(top_predictions, location)
+    
+    def predict_batch(self, images, location="Unknown"):
+        """Classify several images at once; one result dict per image
+
+        Images that cannot be decoded get ``generate_fallback_response``.
+        """
+        if self.model is None:
+            return [self.generate_fallback_image_analysis(image, location) for image in images]
+        return self._classify_batch(images, location)[0]
+    
+    def predict_field(self, images, location="Unknown"):
+        """Classify every leaf photo of a field survey as one batch and summarize the field
+
+        Returns ``{'field': summarize_field(...), 'results': [...], 'timings_ms': {...}}``.
+        Raises ``RuntimeError`` when no leaf classifier is loaded.
+        """
+        if self.model is None:
+            raise RuntimeError("No leaf classifier loaded")
+        results, timings = self._classify_batch(images, location)
+        return {'field': self.summarize_field(results), 'results': results, 'timings_ms': timings}
+    
+    def summarize_field(self, results):
+        """Aggregate per-leaf results into one assessment of the field
+
+        ``severity`` is the mean leaf severity, healthy leaves counting as 0,
+        so it grows with both how many leaves are affected (``incidence``)
+        and how badly.
+        """
+        analyzed = [result for result in results if 'error' not in result]
+        summary = {
+            'images': len(results),
+            'analyzed': len(analyzed),
+            'unreadable': len(results) - len(analyzed),
+        }
+        if not analyzed:
+            return {**summary, 'severity': None, 'max_severity': None, 'incidence': None,
+                    'is_healthy': None, 'conditions': []}
+        
+        groups = {}
+        for result in analyzed:
+            key = (result['plant_type'], result['pest_disease'])
+            groups.setdefault(key, []).append(result)
+        conditions = sorted(groups.items(), key=lambda item: -len(item[1]))
+        diseased = [result for result in analyzed if not result['is_healthy']]
+        dominant = next((group for (_, name), group in conditions if name != 'Healthy'), conditions[0][1])[0]
+        severities = [result['severity'] for result in analyzed]
+        
+        return {
+            **summary,
+            'severity': round(sum(severities) / len(severities), 1),
+            'max_severity': max(severities),
+            'incidence': round(len(diseased) / len(analyzed), 3),
+            'is_healthy': not diseased,
+            'plant_type': conditions[0][0][0],
+            'dominant_condition': dominant['pest_disease'],
+            'treatment': dominant['treatment'],
+            'prevention': dominant['prevention'],
+            'recommendations': dominant['recommendations'],
+            'conditions': [
+                {
+                    'plant': plant,
+                    'condition': name,
+                    'leaves': len(group),
+                    'mean_confidence': round(sum(result['confidence_score'] for result in group) / len(group), 4),
+                }
+                for (plant, name), group in conditions
+            ],
+        }
+    
+    def _classify_batch(self, images, location):
+        """(one result per image, stage milliseconds) for a batch through the classifier"""
+        batch = self.preprocessor.preprocess_batch(images)
+        ok = batch.ok
+        results = [self.generate_fallback_response(error) if error else None for error in batch.errors]
+        started = time.perf_counter()
+        if ok.any():
+            probabilities = self.model.predict_images(batch.images[ok])
+            top_predictions = iter(self.model.top_k(probabilities, k=3))
+            for index in np.flatnonzero(ok):
+                results[index] = self._build_result(next(top_predictions), location)
+        timings = dict(batch.timings, classify=round((time.perf_counter() - started) * 1000.0, 3))
+        return results, timings
+    
+    def _build_result(self, top_predictions, location):
+        """Response dict for one image from its (class name, probability) top list"""
+        class_name, probability = top_predictions[0]
+        plant, condition = self._split_class_name(class_name)
+        is_healthy = condition.lower() == 'healthy'
+        if probability >= HIGH_CONFIDENCE:
+            confidence = 'High'
+        elif probability >= MEDIUM_CONFIDENCE:
+            confidence = 'Medium'
+        else:
+            confidence = 'Low'
+        return {
+            'pest_disease': 'Healthy' if is_healthy else condition,
+            'plant_type': plant,
+            'confidence': confidence,
+            'confidence_score': round(probability, 4),
+            'severity': self._get_severity(condition),
+            'treatment': self._get_treatment(condition, plant),
+            'prevention': self._get_prevention(condition, plant),
+            'recommendations': self._get_recommendations(condition, plant),
+            'is_healthy': is_healthy,
+            'top_3_predictions': [
+                dict(zip(('plant', 'condition'), self._split_class_name(name)), confidence=round(score, 4))
+                for name, score in top_predictions
+            ],
+            'location': location,
+            'note': 'Analysis performed by the on-device leaf classifier'
+        }
+    
+    @staticmethod
+    def _split_class_name(class_name):
+        """'Tomato___Early_blight' -> ('Tomato', 'Early blight')"""
+        plant, _, condition = class_name.partition('___')
+        return plant.replace('_', ' ').replace(',', ''), condition.replace('_', ' ').strip()
+    
     def _get_severity(self, condition):
         """Determine severity based on condition"""
         if 'healthy' in condition.lower():
@@ -220,7 +354,9 @@ class PestDetectionModel:
     def load_model(self, filepath):
         """Load a saved model"""
         try:
-            self.model = tf.keras.models.load_model(filepath)
+            self.model = LeafClassifier.load(filepath)
+            if self.model.classes != self.class_names:
+                self.class_names = list(self.model.classes)
             print(f"Model loaded from {filepath}")
         except Exception as e:
             print(f"Error loading model: {e}")
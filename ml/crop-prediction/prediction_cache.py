@@ -0,0 +1,299 @@
+"""
+Cache for deterministic single-row predictions.
+
+Farmers often submit the same soil card twice, or the default values of the
+forms, so ``/predict_crop``, ``/predict_price`` and ``/predict_production``
+keep recomputing identical predictions. ``PredictionCache`` stores the raw
+model output under a key made of the model versions and the request fields
+rounded to a per-field precision.
+
+Routes predict on the *rounded* fields, so a response depends only on its
+cache key and is the same whether it was served from the cache or not.
+
+The local cache is an LRU bounded in bytes with a TTL per entry. An optional
+shared backend lets several workers reuse each other's results;
+``FileCacheBackend`` keeps one small JSON file per entry, and pointing it at a
+tmpfs such as ``/dev/shm`` makes it a shared-memory store. Model versions are
+part of the key, so entries of a previous model version are never served,
+and ``invalidate`` frees a model's local entries when it is reloaded.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Decimal places kept per request field; finer than any of the form inputs
+DEFAULT_FIELD_PRECISION = {
+    'nitrogen': 1,
+    'phosphorus': 1,
+    'potassium': 1,
+    'temperature': 1,
+    'humidity': 1,
+    'ph': 2,
+    'rainfall': 1,
+    'current_price': 2,
+    'quantity': 2,
+    'storage_cost': 2,
+    'daily_loss': 2,
+    'interest_rate': 2,
+    'area': 2,
+    'nitrogen_req': 1,
+    'phosphorus_req': 1,
+    'potassium_req': 1,
+    'wind_speed': 1,
+    'solar_radiation': 1,
+}
+
+# Rough per-entry bookkeeping cost on top of the key and value sizes
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def parse_precision(value):
+    """Parse ``PREDICTION_CACHE_PRECISION`` ("ph=2,rainfall=0") into a dict"""
+    precision = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        field, _, digits = item.partition('=')
+        precision[field.strip()] = int(digits)
+    return precision
+
+
+def _plain(value):
+    """NumPy scalars and arrays as JSON-friendly Python values"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+class FileCacheBackend:
+    """Entries as JSON files in a directory shared by all workers"""
+
+    def __init__(self, directory, ttl_seconds, prune_every=1000):
+        self.directory = directory
+        self.ttl = ttl_seconds
+        self.prune_every = prune_every
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        model, _, _ = key.partition(':')
+        return os.path.join(self.directory, f'{model}-{hashlib.sha1(key.encode()).hexdigest()}.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key or entry.get('expires_at', 0) < time.time():
+            return None
+        return entry
+
+    def set(self, key, value, expires_at):
+        path = self._path(key)
+        staging = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(staging, 'w') as f:
+                json.dump({'key': key, 'value': value, 'expires_at': expires_at}, f)
+            os.replace(staging, path)
+        except OSError as e:
+            logger.warning(f"Shared prediction cache write failed: {e}")
+            return
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def invalidate(self, model=None):
+        self._remove(lambda name, path: model is None or name.startswith(f'{model}-'))
+
+    def prune(self):
+        """Remove expired entries"""
+        now = time.time()
+
+        def expired(name, path):
+            try:
+                with open(path) as f:
+                    return json.load(f).get('expires_at', 0) < now
+            except (OSError, ValueError):
+                return True
+        self._remove(expired)
+
+    def _remove(self, predicate):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith('.json') and predicate(name, path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class PredictionCache:
+    """LRU + TTL cache of predictions keyed by model versions and rounded inputs"""
+
+    def __init__(self, max_bytes=None, ttl_seconds=None, precision=None, default_precision=None,
+                 enabled=None, backend=None):
+        """
+        Args:
+            max_bytes: Size limit of the local cache (``PREDICTION_CACHE_MAX_MB``)
+            ttl_seconds: Entry lifetime (``PREDICTION_CACHE_TTL``)
+            precision: Decimal places per field, merged over ``DEFAULT_FIELD_PRECISION``
+                (``PREDICTION_CACHE_PRECISION``, e.g. "ph=2,rainfall=0")
+            default_precision: Decimal places for fields not listed
+            enabled: ``PREDICTION_CACHE``; when off every lookup computes
+            backend: Shared store with ``get``/``set``/``invalidate``; defaults to a
+                ``FileCacheBackend`` in ``PREDICTION_CACHE_DIR`` when that is set
+        """
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('PREDICTION_CACHE_MAX_MB', '16')) * 1024 * 1024)
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+        if precision is None:
+            precision = parse_precision(os.getenv('PREDICTION_CACHE_PRECISION', ''))
+        if default_precision is None:
+            default_precision = int(os.getenv('PREDICTION_CACHE_DEFAULT_PRECISION', '2'))
+        if enabled is None:
+            enabled = os.getenv('PREDICTION_CACHE', '1').lower() not in ('0', 'false', 'no')
+        if backend is None and enabled and os.getenv('PREDICTION_CACHE_DIR'):
+            backend = FileCacheBackend(os.getenv('PREDICTION_CACHE_DIR'), ttl_seconds)
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.precision = {**DEFAULT_FIELD_PRECISION, **precision}
+        self.default_precision = default_precision
+        self.enabled = enabled
+        self.backend = backend
+
+        self._entries = OrderedDict()  # key -> (value, expires_at, size, model)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0,
+                          'expirations': 0, 'invalidations': 0}
+
+    def quantize(self, fields):
+        """Round numeric fields to their precision; normalize text fields"""
+        rounded = {}
+        for field, value in fields.items():
+            if isinstance(value, str):
+                rounded[field] = value.strip()
+            elif value is None:
+                rounded[field] = None
+            else:
+                digits = self.precision.get(field, self.default_precision)
+                # + 0.0 turns -0.0 into 0.0 so both land on the same key
+                rounded[field] = round(float(value), digits) + 0.0
+        return rounded
+
+    def key(self, model, versions, fields):
+        """Cache key for already quantized ``fields``"""
+        payload = json.dumps(fields, sort_keys=True, separators=(',', ':'))
+        return f"{model}:{'/'.join(str(version) for version in versions)}:{payload}"
+
+    def lookup(self, model, versions, fields, compute):
+        """Return ``compute(rounded_fields)``, cached per model versions and rounded fields
+
+        Args:
+            model: Name the entries are filed under (used by ``invalidate``)
+            versions: Versions of every model the prediction depends on
+            fields: Request fields feeding the prediction
+            compute: Callable receiving the rounded fields and returning the prediction
+        """
+        rounded = self.quantize(fields)
+        if not self.enabled:
+            return compute(rounded)
+
+        key = self.key(model, versions, rounded)
+        found, value = self._get(key)
+        if found:
+            return value
+
+        value = _plain(compute(rounded))
+        expires_at = time.time() + self.ttl
+        self._put(key, value, expires_at, model)
+        if self.backend is not None:
+            self.backend.set(key, value, expires_at)
+        return value
+
+    def invalidate(self, model=None, shared=False):
+        """Drop the local entries of ``model`` (all entries when ``None``)
+
+        Shared entries carry the model versions in their key, so a reloaded
+        model never reads them; ``shared=True`` deletes them as well.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if model is None or entry[3] == model]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[2]
+            if keys:
+                self._counters['invalidations'] += len(keys)
+        if shared and self.backend is not None:
+            self.backend.invalidate(model)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['shared_hits'] + self._counters['misses']
+            hits = self._counters['hits'] + self._counters['shared_hits']
+            return {
+                'enabled': self.enabled,
+                'shared_backend': type(self.backend).__name__ if self.backend is not None else None,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hit_rate': round(hits / lookups, 4) if lookups else None,
+                **self._counters,
+            }
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return True, entry[0]
+                self._bytes -= self._entries.pop(key)[2]
+                self._counters['expirations'] += 1
+
+        if self.backend is not None:
+            shared = self.backend.get(key)
+            if shared is not None:
+                self._put(key, shared['value'], shared['expires_at'], key.partition(':')[0])
+                with self._lock:
+                    self._counters['shared_hits'] += 1
+                return True, shared['value']
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return False, None
+
+    def _put(self, key, value, expires_at, model):
+        size = len(key) + len(json.dumps(value)) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, expires_at, size, model)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self._counters['evictions'] += 1
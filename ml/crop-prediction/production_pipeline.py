@@ -0,0 +1,186 @@
+"""
+Fused preprocess-and-predict pipeline for the production (yield) model.
+
+The XGBoost production model was trained in ``model training/model.ipynb`` on
+the output of a ``ColumnTransformer``: ``StandardScaler`` on the numeric
+columns followed by ``OrdinalEncoder`` codes for State Name, Dist Name and
+Crop. Instead of running that transformer (pandas frame, object arrays,
+per-call validation) on every request, the scaler statistics and category
+tables are pulled out of the exported preprocessor once, and request fields
+are converted straight into the float32 matrix the booster consumes.
+
+``FusedProductionPipeline.transform`` is numerically identical to
+``preprocessor.transform`` followed by the booster's float32 conversion.
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PREPROCESSOR_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessor_pickle.pkl')
+
+# Request field -> model column for the inputs the production route accepts
+PRODUCTION_REQUEST_FIELDS = {
+    'dist_code': 'Dist Code',
+    'year': 'Year',
+    'state_code': 'State Code',
+    'area': 'Area_ha',
+    'temperature': 'Temperature_C',
+    'humidity': 'Humidity_%',
+    'ph': 'pH',
+    'rainfall': 'Rainfall_mm',
+    'state_name': 'State Name',
+    'dist_name': 'Dist Name',
+    'crop': 'Crop',
+}
+
+# Values used when a request leaves the location/crop fields out
+PRODUCTION_DEFAULTS = {
+    'Dist Code': 1,
+    'Year': 2023,
+    'State Code': 1,
+    'State Name': 'Default',
+    'Dist Name': 'Default',
+    'Crop': 'rice',
+}
+
+
+class PandasOutputPreprocessor:
+    """Stand-in for the notebook class of the same name so its pickle can be loaded"""
+
+    def transform(self, X):
+        arr = self.pipeline.transform(X)
+        return pd.DataFrame(arr, columns=self.feature_names_, index=getattr(X, 'index', None))
+
+
+class _PreprocessorUnpickler(pickle.Unpickler):
+    """Resolve classes the notebook defined in ``__main__`` to their local stand-ins"""
+
+    def find_class(self, module, name):
+        if module == '__main__' and name == 'PandasOutputPreprocessor':
+            return PandasOutputPreprocessor
+        return super().find_class(module, name)
+
+
+def load_preprocessor(path=DEFAULT_PREPROCESSOR_PATH):
+    """Unpickle the preprocessor exported by the model training notebook"""
+    with open(path, 'rb') as f:
+        return _PreprocessorUnpickler(f).load()
+
+
+class FusedProductionPipeline:
+    """Scaler + ordinal encoder + booster folded into one float32 fast path"""
+
+    def __init__(self, preprocessor, model):
+        """
+        Args:
+            preprocessor: Fitted ``PandasOutputPreprocessor`` (or bare ``ColumnTransformer``)
+            model: Anything with ``predict(float32 matrix)``, e.g. ``ProductionBooster``
+        """
+        pipeline = getattr(preprocessor, 'pipeline', None)
+        transformer = pipeline.named_steps['preprocessor'] if pipeline is not None else preprocessor
+        self.preprocessor = preprocessor
+        self.model = model
+
+        self.numeric_columns = []
+        self.categorical_columns = []
+        for name, step, columns in transformer.transformers_:
+            if name == 'num':
+                self.numeric_columns = list(columns)
+                self.mean = np.asarray(step.mean_, dtype=np.float64) if step.with_mean else None
+                self.scale = np.asarray(step.scale_, dtype=np.float64) if step.with_std else None
+            elif name == 'cat':
+                self.categorical_columns = list(columns)
+                unknown = step.unknown_value if step.handle_unknown == 'use_encoded_value' else None
+                self.unknown_code = np.nan if unknown is None else float(unknown)
+                # Category -> code lookup tables, built once
+                self.category_codes = [
+                    {category: float(code) for code, category in enumerate(categories)}
+                    for categories in step.categories_
+                ]
+                # Case-insensitive aliases used only to canonicalize request values
+                self._canonical = [
+                    {str(category).strip().lower(): category for category in categories}
+                    for categories in step.categories_
+                ]
+
+        self.columns = self.numeric_columns + self.categorical_columns
+
+    @classmethod
+    def from_files(cls, model, preprocessor_path=DEFAULT_PREPROCESSOR_PATH):
+        return cls(load_preprocessor(preprocessor_path), model)
+
+    def canonical_category(self, column, value):
+        """Map a request value onto the spelling the encoder was fitted with ('Rice' -> 'rice')"""
+        index = self.categorical_columns.index(column)
+        return self._canonical[index].get(str(value).strip().lower(), value)
+
+    def records_from_requests(self, requests):
+        """Translate request dicts (``area``, ``crop``...) into model-column records"""
+        records = []
+        for data in requests:
+            record = dict(PRODUCTION_DEFAULTS)
+            for field, column in PRODUCTION_REQUEST_FIELDS.items():
+                if data.get(field) is not None:
+                    record[column] = data[field]
+            for column in self.categorical_columns:
+                record[column] = self.canonical_category(column, record[column])
+            records.append(record)
+        return records
+
+    def columns_from_frame(self, frame):
+        """Model-column arrays from a DataFrame of request fields, defaults filled in"""
+        n_rows = len(frame)
+        columns = {}
+        for field, column in PRODUCTION_REQUEST_FIELDS.items():
+            default = PRODUCTION_DEFAULTS.get(column)
+            values = frame[field] if field in frame.columns else pd.Series([None] * n_rows)
+            if column in self.categorical_columns:
+                columns[column] = [default if pd.isna(value) else self.canonical_category(column, value)
+                                   for value in values]
+            else:
+                numeric = pd.to_numeric(values, errors='coerce')
+                columns[column] = numeric.fillna(default).to_numpy(dtype=np.float64) if default is not None \
+                    else numeric.to_numpy(dtype=np.float64)
+        return columns
+
+    def transform(self, columns, n_rows=None):
+        """Build the float32 model matrix from ``{model column: sequence of values}``
+
+        Produces the same numbers as ``preprocessor.transform`` on a frame
+        with those columns, without building the frame.
+        """
+        if n_rows is None:
+            n_rows = len(columns[self.columns[0]])
+        X = np.empty((n_rows, len(self.columns)), dtype=np.float32)
+
+        if self.numeric_columns:
+            numeric = np.empty((n_rows, len(self.numeric_columns)), dtype=np.float64)
+            for index, column in enumerate(self.numeric_columns):
+                numeric[:, index] = np.asarray(columns[column], dtype=np.float64)
+            # Same operation order as StandardScaler.transform, in float64
+            if self.mean is not None:
+                numeric -= self.mean
+            if self.scale is not None:
+                numeric /= self.scale
+            X[:, :len(self.numeric_columns)] = numeric
+
+        offset = len(self.numeric_columns)
+        for index, column in enumerate(self.categorical_columns):
+            lookup = self.category_codes[index]
+            X[:, offset + index] = np.fromiter(
+                (lookup.get(value, self.unknown_code) for value in columns[column]),
+                dtype=np.float64, count=n_rows)
+        return X
+
+    def transform_records(self, records):
+        """``transform`` for a list of model-column dicts"""
+        return self.transform({column: [record[column] for record in records] for column in self.columns},
+                              n_rows=len(records))
+
+    def predict(self, records):
+        """Yield in kg/ha for each model-column record"""
+        return self.model.predict(self.transform_records(records))
@@ -0,0 +1,214 @@
+"""
+Shadow evaluation of candidate models on live prediction traffic.
+
+A retrained model is only checked against a holdout before promotion, never
+against the requests the app actually gets. ``ShadowEvaluator`` sends a
+sample of real requests (``fraction``) to a candidate model as well, after
+the incumbent has answered and off the request thread:
+
+* ``submit`` draws the sample and queues the inputs with the answer the
+  request got; it never blocks and never raises. When ``max_pending``
+  evaluations are already queued the sample is dropped instead;
+* a small background thread pool runs the incumbent and the candidate on
+  the same inputs (taking turns at going first), times both and compares
+  the candidate's output with the answer that was served;
+* per route it keeps the disagreement rate, the latency of both models and
+  the per-request latency delta (candidate minus incumbent), and candidate
+  errors with the last few messages (``/metrics/shadow``).
+
+The candidate never answers a request, so a broken or slow one costs only
+background CPU, and the background threads run at a lower priority
+(``nice``) so requests get the CPU first. On a machine without spare cores
+the comparisons still take some time from requests (Python threads share
+one interpreter), so keep ``fraction`` small there.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Recent latencies kept per route for the percentiles
+LATENCY_WINDOW = 1024
+
+# Last candidate error messages kept per route
+RECENT_ERRORS = 5
+
+
+def _lower_priority(nice):
+    # Linux schedules threads individually, so this leaves the request threads alone
+    if nice and hasattr(os, 'setpriority'):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except OSError:
+            logger.warning("Could not lower the priority of the shadow threads")
+
+
+class _Route:
+    def __init__(self, incumbent, candidate, agree, difference, ready):
+        self.incumbent = incumbent
+        self.candidate = candidate
+        self.ready = ready
+        self.agree = agree
+        self.difference = difference
+        self.counters = {'sampled': 0, 'dropped': 0, 'compared': 0, 'disagreements': 0, 'errors': 0,
+                         'incumbent_errors': 0, 'no_candidate': 0}
+        self.incumbent_ms = deque(maxlen=LATENCY_WINDOW)
+        self.candidate_ms = deque(maxlen=LATENCY_WINDOW)
+        self.delta_ms = deque(maxlen=LATENCY_WINDOW)
+        self.differences = deque(maxlen=LATENCY_WINDOW)
+        self.recent_errors = deque(maxlen=RECENT_ERRORS)
+
+
+class ShadowEvaluator:
+    """Compare a candidate model with the incumbent on a sample of requests, in the background"""
+
+    def __init__(self, fraction=None, max_workers=None, max_pending=None, nice=None):
+        """
+        Args:
+            fraction: Share of requests also sent to the candidate
+                (``SHADOW_FRACTION``, 0 = off)
+            max_workers: Background threads running the comparisons
+                (``SHADOW_WORKERS``, 2)
+            max_pending: Queued comparisons beyond which samples are
+                dropped (``SHADOW_MAX_PENDING``, 64)
+            nice: Scheduling niceness added to the background threads, so the
+                request threads get the CPU first (``SHADOW_NICE``, 10; Linux)
+        """
+        if fraction is None:
+            fraction = float(os.getenv('SHADOW_FRACTION', '0'))
+        if max_workers is None:
+            max_workers = int(os.getenv('SHADOW_WORKERS', '2'))
+        if max_pending is None:
+            max_pending = int(os.getenv('SHADOW_MAX_PENDING', '64'))
+        if nice is None:
+            nice = int(os.getenv('SHADOW_NICE', '10'))
+
+        self.fraction = fraction
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.nice = nice
+
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = None
+
+    def register(self, route, incumbent, candidate, agree=None, difference=None, ready=None):
+        """Shadow ``route``
+
+        ``incumbent(inputs)`` and ``candidate(inputs)`` predict one request's
+        inputs; ``candidate`` returns ``None`` while there is no candidate.
+        ``agree(served, candidate_output)`` decides whether the two answers
+        match (default ``==``); ``difference`` returns a number to average,
+        e.g. the relative error of a regression. While ``ready()`` is false
+        (no candidate, or it went away) the route is not sampled at all.
+        """
+        self._routes[route] = _Route(incumbent, candidate, agree or (lambda a, b: a == b), difference, ready)
+
+    def submit(self, route, inputs, served):
+        """Maybe queue a shadow comparison of ``inputs``, answered with ``served``; True if queued"""
+        if self.fraction <= 0 or random.random() >= self.fraction:
+            return False
+        spec = self._routes[route]
+        if spec.ready is not None and not spec.ready():
+            return False
+        with self._lock:
+            spec.counters['sampled'] += 1
+            if self._pending >= self.max_pending:
+                spec.counters['dropped'] += 1
+                return False
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='shadow',
+                                                    initializer=_lower_priority, initargs=(self.nice,))
+        self._executor.submit(self._evaluate, spec, inputs, served)
+        return True
+
+    def _evaluate(self, spec, inputs, served):
+        try:
+            # Take turns at going first, so neither model is always timed with warm caches
+            order = ('candidate', 'incumbent') if spec.counters['compared'] % 2 else ('incumbent', 'candidate')
+            runs = {which: self._timed(getattr(spec, which), inputs) for which in order}
+            candidate, candidate_ms, error = runs['candidate']
+            _, incumbent_ms, incumbent_error = runs['incumbent']
+            self._record(spec, served, candidate, None if incumbent_error else incumbent_ms, candidate_ms, error)
+        except Exception:
+            logger.exception("Shadow evaluation failed")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @staticmethod
+    def _timed(predict, inputs):
+        """(output, milliseconds, exception or ``None``) of ``predict(inputs)``"""
+        started = time.perf_counter()
+        try:
+            output = predict(inputs)
+        except Exception as e:
+            return None, (time.perf_counter() - started) * 1000.0, e
+        return output, (time.perf_counter() - started) * 1000.0, None
+
+    def _record(self, spec, served, candidate, incumbent_ms, candidate_ms, error):
+        agree = difference = None
+        if error is None and candidate is not None:
+            try:
+                agree = bool(spec.agree(served, candidate))
+                difference = spec.difference(served, candidate) if spec.difference else None
+            except Exception as e:
+                error = e
+        with self._lock:
+            counters = spec.counters
+            if error is not None:
+                counters['errors'] += 1
+                spec.recent_errors.append(f'{type(error).__name__}: {error}')
+                return
+            if candidate is None:
+                counters['no_candidate'] += 1
+                return
+            counters['compared'] += 1
+            counters['disagreements'] += 0 if agree else 1
+            spec.candidate_ms.append(candidate_ms)
+            if incumbent_ms is None:
+                counters['incumbent_errors'] += 1
+            else:
+                spec.incumbent_ms.append(incumbent_ms)
+                spec.delta_ms.append(candidate_ms - incumbent_ms)
+            if difference is not None:
+                spec.differences.append(float(difference))
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+            routes = {name: (dict(spec.counters), list(spec.incumbent_ms), list(spec.candidate_ms),
+                             list(spec.delta_ms), list(spec.differences), list(spec.recent_errors))
+                      for name, spec in self._routes.items()}
+        result = {}
+        for name, (counters, incumbent, candidate, delta, differences, errors) in routes.items():
+            compared = counters['compared']
+            result[name] = {
+                **counters,
+                'disagreement_rate': round(counters['disagreements'] / compared, 4) if compared else None,
+                'error_rate': round(counters['errors'] / (compared + counters['errors']), 4)
+                if compared + counters['errors'] else None,
+                'incumbent_p50_ms': self._percentile(incumbent, 50),
+                'incumbent_p99_ms': self._percentile(incumbent, 99),
+                'candidate_p50_ms': self._percentile(candidate, 50),
+                'candidate_p99_ms': self._percentile(candidate, 99),
+                'delta_p50_ms': self._percentile(delta, 50),
+                'delta_p99_ms': self._percentile(delta, 99),
+                'mean_difference': round(float(np.mean(differences)), 4) if differences else None,
+                'recent_errors': errors,
+            }
+        return {'fraction': self.fraction, 'pending': pending, 'max_pending': self.max_pending, 'routes': result}
+
+    @staticmethod
+    def _percentile(values, q):
+        return round(float(np.percentile(values, q)), 3) if values else None
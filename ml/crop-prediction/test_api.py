@@ -43,6 +43,28 @@ def test_crop_prediction():
         print(f"Error: {e}")
         return False
 
+def test_crop_batch_prediction():
+    """Test the batch crop prediction endpoint"""
+    print("\nTesting batch crop prediction endpoint...")
+    
+    test_data = [
+        {"nitrogen": 90, "phosphorus": 42, "potassium": 43, "temperature": 20.87,
+         "humidity": 82, "ph": 6.5, "rainfall": 202.93},
+        {"nitrogen": 20, "phosphorus": 60, "potassium": 20, "temperature": 27,
+         "humidity": 60, "ph": 7.0, "rainfall": 80},
+        {"nitrogen": 500, "phosphorus": 42, "potassium": 43, "temperature": 20.87,
+         "humidity": 82, "ph": 6.5, "rainfall": 202.93}
+    ]
+    
+    try:
+        response = requests.post(f"{BASE_URL}/predict_crop/batch", json=test_data)
+        print(f"Status: {response.status_code}")
+        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return response.status_code == 200 and response.json()['failed'] == 1
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
 def test_fertilizer_prediction():
     """Test the fertilizer prediction endpoint"""
     print("\nTesting fertilizer prediction endpoint...")
@@ -134,6 +156,7 @@ def main():
         ("Health Check", test_health_check),
         ("API Info", test_api_info),
         ("Crop Prediction", test_crop_prediction),
+        ("Batch Crop Prediction", test_crop_batch_prediction),
         ("Fertilizer Prediction", test_fertilizer_prediction),
         ("Price Prediction", test_price_prediction),
         ("Production Prediction", test_production_prediction),
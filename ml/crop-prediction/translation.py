@@ -0,0 +1,323 @@
+"""
+Batched, cached Google Translate calls for the chatbot.
+
+A chat turn used to call ``translate_client.translate`` once for the message,
+once for the answer and once per suggestion, and the suggestions and welcome
+text are the same few strings every time. ``TranslationService`` instead:
+
+* sends every string a turn needs in one ``translate`` call (the v2 API takes
+  a list), skipping strings it has already translated;
+* keeps translations in a persistent SQLite cache keyed by (SHA-1 of the
+  text, target language), shared by all workers and kept across restarts,
+  with a bounded in-memory LRU in front of it;
+* pre-warms that cache with the static chatbot strings for every supported
+  language;
+* gets language detection for free from the translation of the message into
+  English (``detectedSourceLanguage``) instead of a separate detect call.
+
+``turn()`` counts what one chat turn would have cost with one call per string
+against the calls actually made; totals are served at ``/metrics/translation``.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translation_cache.sqlite3')
+
+# Google Translate v2 accepts at most 128 strings per request
+MAX_BATCH_STRINGS = 128
+
+# SQLite rows written between two trims of the table to its TTL and size
+PRUNE_EVERY = 256
+
+# Rough per-entry bookkeeping cost on top of the translation size
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """(text hash, target language) -> translation, in memory and in SQLite
+
+    Chat answers are translated sentence by sentence, so most entries are
+    one-off LLM output. Both layers are bounded: entries expire after a TTL,
+    the in-memory layer is an LRU bounded in bytes, and the SQLite table is
+    trimmed to its least recently used ``max_rows`` every ``PRUNE_EVERY`` writes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=None, max_rows=None, ttl_seconds=None):
+        """
+        Args:
+            path: SQLite file shared by the workers; ``None`` for memory only
+            max_bytes: Size limit of the in-memory layer (``TRANSLATION_CACHE_MAX_MB``)
+            max_rows: Rows kept in SQLite (``TRANSLATION_CACHE_MAX_ROWS``)
+            ttl_seconds: Entry lifetime in both layers (``TRANSLATION_CACHE_TTL``)
+        """
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('TRANSLATION_CACHE_MAX_MB', '4')) * 1024 * 1024)
+        if max_rows is None:
+            max_rows = int(os.getenv('TRANSLATION_CACHE_MAX_ROWS', '50000'))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('TRANSLATION_CACHE_TTL', str(7 * 86400)))
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.ttl = ttl_seconds
+        self._memory = OrderedDict()  # (text hash, target) -> (translation, expires_at, size)
+        self._bytes = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.counters = {'evictions': 0, 'expirations': 0, 'pruned_rows': 0}
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('CREATE TABLE IF NOT EXISTS translations ('
+                                 'text_hash TEXT NOT NULL, target TEXT NOT NULL, translated TEXT NOT NULL, '
+                                 'used_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (text_hash, target))')
+                columns = {row[1] for row in self._db.execute('PRAGMA table_info(translations)')}
+                if 'used_at' not in columns:
+                    # Caches written before the table was bounded: start their clock now
+                    self._db.execute('ALTER TABLE translations ADD COLUMN used_at REAL NOT NULL DEFAULT 0')
+                    self._db.execute('UPDATE translations SET used_at = ?', (time.time(),))
+                self._db.execute('CREATE INDEX IF NOT EXISTS translations_used_at ON translations (used_at)')
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Translation cache {path} unavailable, keeping it in memory only: {e}")
+                self._db = None
+
+    def get_many(self, texts, target):
+        """Cached translations for ``texts`` as {text: translation}"""
+        found = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for text in texts:
+                key = (text_key(text), target)
+                entry = self._memory.get(key)
+                if entry is not None and entry[1] < now:
+                    self._remove(key)
+                    self.counters['expirations'] += 1
+                    entry = None
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    found[text] = entry[0]
+                else:
+                    missing.append(text)
+            if missing and self._db is not None:
+                keys = {text_key(text): text for text in missing}
+                try:
+                    hits = []
+                    for start in range(0, len(keys), 500):
+                        chunk = list(keys)[start:start + 500]
+                        rows = self._db.execute(
+                            f"SELECT text_hash, translated FROM translations WHERE target = ? AND used_at >= ? "
+                            f"AND text_hash IN ({','.join('?' * len(chunk))})", [target, now - self.ttl, *chunk])
+                        for text_hash, translated in rows:
+                            self._remember((text_hash, target), translated, now)
+                            found[keys[text_hash]] = translated
+                            hits.append((now, text_hash, target))
+                    if hits:
+                        self._db.executemany('UPDATE translations SET used_at = ? WHERE text_hash = ? AND target = ?',
+                                             hits)
+                        self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Translation cache read failed: {e}")
+        return found
+
+    def put_many(self, pairs, target):
+        """Store ``{text: translation}`` for ``target``"""
+        now = time.time()
+        rows = [(text_key(text), target, translated, now) for text, translated in pairs.items()]
+        with self._lock:
+            for text_hash, _, translated, _ in rows:
+                self._remember((text_hash, target), translated, now)
+            if self._db is not None and rows:
+                try:
+                    self._db.executemany('INSERT OR REPLACE INTO translations (text_hash, target, translated, used_at) '
+                                         'VALUES (?, ?, ?, ?)', rows)
+                    self._writes += len(rows)
+                    if self._writes >= PRUNE_EVERY:
+                        self._writes = 0
+                        self._prune(now)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Translation cache write failed: {e}")
+
+    def __len__(self):
+        return len(self._memory)
+
+    def _remember(self, key, translated, now):
+        """Add one in-memory entry and evict down to ``max_bytes`` (lock held)"""
+        size = len(translated.encode('utf-8')) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._remove(key)
+        self._memory[key] = (translated, now + self.ttl, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._memory)))
+            self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        self._bytes -= self._memory.pop(key)[2]
+
+    def _prune(self, now):
+        """Delete expired rows and the least recently used beyond ``max_rows`` (lock held)"""
+        pruned = self._db.execute('DELETE FROM translations WHERE used_at < ?', (now - self.ttl,)).rowcount
+        pruned += self._db.execute(
+            'DELETE FROM translations WHERE rowid IN (SELECT rowid FROM translations '
+            'ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_rows,)).rowcount
+        self.counters['pruned_rows'] += max(pruned, 0)
+
+
+class TurnCounter:
+    """Translation work of one chat turn"""
+
+    def __init__(self):
+        self.strings = 0      # strings translated or detected (= round trips without batching)
+        self.round_trips = 0  # calls actually sent to the API
+
+
+class TranslationService:
+    """Batched translation with a persistent cache in front of a Google Translate client"""
+
+    def __init__(self, client_getter, cache=None, call=None):
+        """
+        Args:
+            client_getter: Callable returning the ``translate_v2.Client`` (or ``None``)
+            cache: ``TranslationCache``; defaults to ``TRANSLATION_CACHE_PATH``
+            call: ``call(request)`` running one API request, e.g. under an
+                ``OutboundService``; defaults to calling it directly
+        """
+        self.client_getter = client_getter
+        self.call = call or (lambda request: request())
+        self.cache = cache if cache is not None else TranslationCache(
+            os.getenv('TRANSLATION_CACHE_PATH', DEFAULT_CACHE_PATH))
+        self._lock = threading.Lock()
+        self._stats = {'strings': 0, 'cache_hits': 0, 'round_trips': 0, 'errors': 0,
+                       'turns': 0, 'turn_strings': 0, 'turn_round_trips': 0}
+        self._local = threading.local()
+
+    @contextmanager
+    def turn(self):
+        """Count the strings and API calls of one chat turn made from this thread"""
+        counter = TurnCounter()
+        self._local.counter = counter
+        try:
+            yield counter
+        finally:
+            self._local.counter = None
+            with self._lock:
+                self._stats['turns'] += 1
+                self._stats['turn_strings'] += counter.strings
+                self._stats['turn_round_trips'] += counter.round_trips
+            logger.info(f"Chat turn translation: {counter.round_trips} round trips for "
+                        f"{counter.strings} strings ({counter.strings - counter.round_trips} saved)")
+
+    def translate_many(self, texts, target_language, counter=None):
+        """Translate ``texts`` into ``target_language`` with at most one API call per 128 misses
+
+        Untranslatable input (no client, API error) comes back unchanged.
+        """
+        counter = counter or getattr(self._local, 'counter', None)
+        texts = list(texts)
+        if not texts or target_language == 'en':
+            return texts
+        if counter is not None:
+            counter.strings += len(texts)
+
+        unique = list(dict.fromkeys(text for text in texts if text))
+        translated = self.cache.get_many(unique, target_language)
+        missing = [text for text in unique if text not in translated]
+        with self._lock:
+            self._stats['strings'] += len(texts)
+            self._stats['cache_hits'] += len(unique) - len(missing)
+
+        client = self.client_getter() if missing else None
+        if client is not None:
+            fresh = {}
+            for start in range(0, len(missing), MAX_BATCH_STRINGS):
+                chunk = missing[start:start + MAX_BATCH_STRINGS]
+                results = self._call(lambda: client.translate(chunk, target_language=target_language), counter)
+                if results is None:
+                    break
+                for text, result in zip(chunk, results):
+                    fresh[text] = result['translatedText']
+            self.cache.put_many(fresh, target_language)
+            translated.update(fresh)
+        return [translated.get(text, text) for text in texts]
+
+    def translate(self, text, target_language):
+        return self.translate_many([text], target_language)[0]
+
+    def to_english(self, text, detect=False, counter=None):
+        """Return (English text, detected source language) from a single API call
+
+        ``detect`` only affects the bookkeeping: it marks a call that replaces
+        a separate ``detect_language`` round trip.
+        """
+        counter = counter or getattr(self._local, 'counter', None)
+        client = self.client_getter()
+        strings = 2 if detect else 1
+        if counter is not None:
+            counter.strings += strings
+        with self._lock:
+            self._stats['strings'] += strings
+        if client is None:
+            return text, 'en'
+        result = self._call(lambda: client.translate(text, target_language='en'), counter)
+        if result is None:
+            return text, 'en'
+        return result['translatedText'], result.get('detectedSourceLanguage', 'en')
+
+    def detect(self, text):
+        """Detected language of ``text`` ('en' when unavailable)"""
+        client = self.client_getter()
+        if client is None:
+            return 'en'
+        result = self._call(lambda: client.detect_language(text), None)
+        return result['language'] if result is not None else 'en'
+
+    def prewarm(self, texts, languages):
+        """Translate ``texts`` into every language up front; one call per language with misses"""
+        for language in languages:
+            if language != 'en':
+                self.translate_many(texts, language)
+        logger.info(f"Translation cache warmed: {len(self.cache)} entries")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        turns = stats['turns']
+        stats['cache_entries'] = len(self.cache)
+        stats.update({f'cache_{name}': value for name, value in self.cache.counters.items()})
+        stats['round_trips_saved_per_turn'] = (
+            round((stats['turn_strings'] - stats['turn_round_trips']) / turns, 2) if turns else None)
+        return stats
+
+    def _call(self, request, counter):
+        with self._lock:
+            self._stats['round_trips'] += 1
+        if counter is not None:
+            counter.round_trips += 1
+        try:
+            return self.call(request)
+        except Exception as e:
+            logger.error(f"Translation error: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return None
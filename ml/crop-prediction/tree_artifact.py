@@ -0,0 +1,271 @@
+"""
+Memory-mapped tree model artifacts shared by all server workers.
+
+Unpickling ``crop_recommendation_model.pkl`` or ``xgb_model_pickle.pkl`` gives
+every gunicorn worker its own private copy of the trees, so resident memory
+grows with the worker count. A tree artifact is a directory holding the
+flattened node arrays of a ``CompiledForest`` as plain ``.npy`` files plus a
+small ``manifest.json``:
+
+    artifacts/crop_model/
+        manifest.json
+        feature.npy  threshold.npy  children.npy  is_leaf.npy
+        leaf_values.npy  roots.npy  left.npy  right.npy  [default_left.npy]
+
+``load_artifact`` opens the arrays with ``np.load(mmap_mode='r')``. Nothing is
+copied into the process: the pages come from the OS page cache, which every
+worker mapping the same files shares, and they are read-only so no worker can
+dirty them. The lookup tables ``CompiledForest`` would otherwise derive at
+load time (``children``, ``is_leaf``) are stored too, for the same reason.
+
+``write_artifact`` builds the new directory next to the old one and swaps it
+in with renames, so a worker that still has the previous version mapped keeps
+reading consistent (if outdated) data.
+
+Usage:
+    python tree_artifact.py <model.pkl|model.json> <output_dir>
+    python tree_artifact.py --all [--output artifacts]
+"""
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+
+import model_store
+from forest_compiler import CompiledForest, compile_forest, compile_xgboost
+
+FORMAT_NAME = 'krishikavach-trees'
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ARTIFACT_DIR = os.path.join(HERE, 'artifacts')
+
+# Artifact name -> candidate source models, first existing one wins (same order as app.py,
+# after the current trained version)
+DEFAULT_SOURCES = {
+    'crop_model': [os.path.join(HERE, '..', 'model training', 'models', 'crop_model.pkl'),
+                   os.path.join(HERE, 'crop_recommendation_model.pkl')],
+    'production_model_xgb': [os.path.join(HERE, '..', 'xgb_model_pickle.pkl')],
+}
+
+# Array name -> dtype on disk; int32 indices keep the mapped files small
+_ARRAY_DTYPES = {
+    'feature': np.int32,
+    'threshold': None,
+    'left': np.int32,
+    'right': np.int32,
+    'children': np.int32,
+    'is_leaf': np.bool_,
+    'leaf_values': None,
+    'roots': np.int32,
+    'default_left': np.bool_,
+}
+
+
+def artifact_dir():
+    """Directory the app looks for artifacts in (``TREE_ARTIFACT_DIR``)"""
+    return os.getenv('TREE_ARTIFACT_DIR', DEFAULT_ARTIFACT_DIR)
+
+
+def default_sources():
+    """``DEFAULT_SOURCES`` with the current ``model.py`` version first, when it has the model"""
+    sources = {name: list(candidates) for name, candidates in DEFAULT_SOURCES.items()}
+    for name, candidates in sources.items():
+        try:
+            candidates.insert(0, model_store.artifact_path(name))
+        except FileNotFoundError:
+            pass
+    return sources
+
+
+def convert_model(model):
+    """Compile a fitted sklearn random forest or XGBoost regressor"""
+    if getattr(model, 'estimators_', None) is not None:
+        return compile_forest(model)
+    return compile_xgboost(model)
+
+
+def write_artifact(forest, path, source=None):
+    """Write ``forest`` as a memory-mappable artifact directory at ``path``"""
+    path = os.path.abspath(path)
+    staging = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    arrays = {
+        'feature': forest.feature,
+        'threshold': forest.threshold,
+        'left': forest.left,
+        'right': forest.right,
+        'children': forest._children,
+        'is_leaf': forest._is_leaf,
+        'leaf_values': forest.leaf_values,
+        'roots': forest.roots,
+    }
+    if forest.default_left is not None:
+        arrays['default_left'] = forest.default_left
+
+    manifest_arrays = {}
+    for name, array in arrays.items():
+        dtype = _ARRAY_DTYPES[name]
+        array = np.ascontiguousarray(array, dtype=dtype)
+        np.save(os.path.join(staging, f'{name}.npy'), array, allow_pickle=False)
+        manifest_arrays[name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'kind': 'classifier' if forest.is_classifier else 'regressor',
+        'n_features': forest.n_features_in_,
+        'n_estimators': forest.n_estimators,
+        'max_depth': forest.max_depth,
+        'decision': forest.decision,
+        'aggregation': forest.aggregation,
+        'base_score': forest.base_score,
+        'classes': forest.classes_.tolist() if forest.is_classifier else None,
+        'source': source,
+        'arrays': manifest_arrays,
+    }
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap directories; readers holding the old files keep their mappings
+    retired = None
+    if os.path.exists(path):
+        retired = f'{path}.old-{os.getpid()}'
+        os.rename(path, retired)
+    os.rename(staging, path)
+    if retired is not None:
+        shutil.rmtree(retired, ignore_errors=True)
+    return path
+
+
+def load_artifact(path, mmap=True):
+    """Open an artifact directory as a ``CompiledForest`` backed by read-only memory maps
+
+    Raises ``FileNotFoundError`` when there is no artifact at ``path``.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_NAME or manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} tree artifact")
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        array = np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise ValueError(f'{path}/{name}.npy does not match the manifest')
+        arrays[name] = array
+
+    classes = manifest['classes']
+    return CompiledForest(
+        feature=arrays['feature'],
+        threshold=arrays['threshold'],
+        left=arrays['left'],
+        right=arrays['right'],
+        leaf_values=arrays['leaf_values'],
+        roots=arrays['roots'],
+        max_depth=manifest['max_depth'],
+        n_features=manifest['n_features'],
+        classes=np.asarray(classes) if classes is not None else None,
+        decision=manifest['decision'],
+        aggregation=manifest['aggregation'],
+        base_score=manifest['base_score'],
+        default_left=arrays.get('default_left'),
+        children=arrays['children'],
+        is_leaf=arrays['is_leaf'],
+    )
+
+
+def load_named_artifact(name, directory=None):
+    """``load_artifact`` for ``<TREE_ARTIFACT_DIR>/<name>``
+
+    ``None`` if it was never converted, or is ``superseded`` by the current
+    trained version (the app then loads that version itself).
+    """
+    path = os.path.join(directory or artifact_dir(), name)
+    if not os.path.exists(os.path.join(path, MANIFEST)) or superseded(path):
+        return None
+    return load_artifact(path)
+
+
+def superseded(path):
+    """True when the artifact at ``path`` is not the model of the current ``model_store`` version
+
+    One converted from a trained version is superseded once another version
+    is current; one converted from anywhere else (the bundled pickles) as
+    soon as the current version has its own copy of the model.
+    """
+    current = model_store.current_version()
+    if current is None:
+        return False
+    with open(os.path.join(path, MANIFEST)) as f:
+        source = json.load(f).get('source')
+    if source:
+        version_dir = os.path.dirname(os.path.abspath(os.path.join(HERE, source)))
+        if os.path.dirname(version_dir) == os.path.abspath(model_store.model_dir()):
+            return os.path.basename(version_dir) != current
+    try:
+        model_store.artifact_path(os.path.basename(os.path.normpath(path)), current)
+    except (FileNotFoundError, ValueError):
+        return False
+    return True
+
+
+def load_source_model(path):
+    """Unpickle a model, or load an XGBoost JSON/UBJSON model as a booster"""
+    if path.endswith(('.json', '.ubj')):
+        import xgboost as xgb
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return booster
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def convert(source, output):
+    """Convert the model file ``source`` into an artifact directory ``output``"""
+    forest = convert_model(load_source_model(source))
+    write_artifact(forest, output, source=os.path.relpath(source, HERE))
+    return forest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert tree models into memory-mapped artifacts')
+    parser.add_argument('source', nargs='?', help='model pickle or XGBoost JSON file')
+    parser.add_argument('output', nargs='?', help='artifact directory to write')
+    parser.add_argument('--all', action='store_true',
+                        help='convert every model the app serves into --output')
+    parser.add_argument('--output', dest='output_dir', default=artifact_dir())
+    args = parser.parse_args()
+
+    if args.all:
+        jobs = []
+        for name, candidates in default_sources().items():
+            source = next((path for path in candidates if os.path.exists(path)), None)
+            if source is None:
+                print(f'{name}: no source model found, skipping')
+                continue
+            jobs.append((source, os.path.join(args.output_dir, name)))
+    elif args.source and args.output:
+        jobs = [(args.source, args.output)]
+    else:
+        parser.print_usage()
+        return 1
+
+    for source, output in jobs:
+        forest = convert(source, output)
+        print(f'{source} -> {output} ({forest.n_estimators} trees, {len(forest.feature)} nodes, '
+              f'depth {forest.max_depth})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Native XGBoost booster for production estimation.
+
+``ml/xgb_model.json`` holds the production model in XGBoost's own format,
+feature names included. Loading it into a bare ``xgboost.Booster`` skips
+unpickling a full ``XGBRegressor`` (and the sklearn version checks that come
+with it), and ``inplace_predict`` runs straight on the NumPy input without
+building a ``DMatrix`` or going through the sklearn wrapper per request.
+
+Parsing the JSON text is the slow part of startup, so the first load writes
+a binary UBJSON copy next to it and later loads use that while it is newer
+than the JSON file.
+"""
+
+import os
+
+import numpy as np
+
+try:
+    import xgboost as xgb
+except ImportError:
+    xgb = None
+
+DEFAULT_BOOSTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'xgb_model.json')
+
+
+class ProductionBooster:
+    """Thin predict-only wrapper around a native XGBoost JSON model"""
+
+    def __init__(self, path=DEFAULT_BOOSTER_PATH, iteration_range=None, nthread=None,
+                 binary_cache=True, booster=None):
+        """
+        Args:
+            path: XGBoost JSON (or UBJSON) model file
+            iteration_range: Default ``(begin, end)`` boosting rounds used for
+                prediction; fewer rounds trade accuracy for latency
+            nthread: Threads per prediction; 1 is fastest for single rows
+            binary_cache: Keep a ``.ubj`` copy of a JSON model for fast reloads
+            booster: Already loaded ``xgboost.Booster`` to wrap instead of
+                reading ``path`` (e.g. an incrementally trained version)
+        """
+        if xgb is None:
+            raise ImportError('xgboost is not installed')
+        self.path = path if booster is None else None
+        self.booster = booster if booster is not None else _load_booster(path, binary_cache)
+        if nthread is not None:
+            self.booster.set_param({'nthread': int(nthread)})
+        self.feature_names = self.booster.feature_names or []
+        self.n_features_in_ = self.booster.num_features()
+        self.num_boosted_rounds = self.booster.num_boosted_rounds()
+        self.iteration_range = self._check_range(iteration_range)
+
+    def predict(self, X, iteration_range=None):
+        """Predict a 2-D float matrix with ``inplace_predict``"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        rounds = self._check_range(iteration_range) if iteration_range is not None else self.iteration_range
+        return self.booster.inplace_predict(X, iteration_range=rounds, validate_features=False)
+
+    def predict_dmatrix(self, dmatrix, iteration_range=None):
+        """Predict a caller-owned, reusable ``DMatrix`` (e.g. a fixed evaluation set)"""
+        rounds = self._check_range(iteration_range) if iteration_range is not None else self.iteration_range
+        return self.booster.predict(dmatrix, iteration_range=rounds, validate_features=False)
+
+    def _check_range(self, iteration_range):
+        if iteration_range is None:
+            return (0, 0)  # XGBoost's "all rounds"
+        begin, end = (int(value) for value in iteration_range)
+        if not 0 <= begin < end <= self.num_boosted_rounds:
+            raise ValueError(f'iteration_range must lie within (0, {self.num_boosted_rounds}]')
+        return (begin, end)
+
+
+def _load_booster(path, binary_cache):
+    """Load a booster, preferring an up-to-date UBJSON copy of a JSON model"""
+    booster = xgb.Booster()
+    if not binary_cache or not path.endswith('.json'):
+        booster.load_model(path)
+        return booster
+
+    cache_path = path[:-len('.json')] + '.ubj'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        try:
+            booster.load_model(cache_path)
+            return booster
+        except Exception:
+            booster = xgb.Booster()
+
+    booster.load_model(path)
+    try:
+        booster.save_model(cache_path)
+    except OSError:
+        pass  # read-only deployment; keep loading the JSON
+    return booster
+
+
+def iteration_range_from_env(value=None):
+    """Parse ``PRODUCTION_XGB_ROUNDS`` ("50" or "0:50") into an iteration range"""
+    value = value if value is not None else os.getenv('PRODUCTION_XGB_ROUNDS', '')
+    if not value:
+        return None
+    if ':' in value:
+        begin, end = value.split(':', 1)
+        return (int(begin), int(end))
+    return (0, int(value))